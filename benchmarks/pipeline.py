@@ -0,0 +1,209 @@
+"""Benchmark stages of the streamvis processing pipeline for typical detector image shapes.
+
+Each stage is timed separately on simulated images and metadata, similar to those produced by
+'tests/zmq_sender.py', and the results are written as json, e.g.:
+
+    $ python benchmarks/pipeline.py --output results.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+from datetime import datetime
+from time import perf_counter
+
+import bokeh
+import numpy as np
+
+import streamvis as sv
+from streamvis.metadata_decoder import MetadataDecoder
+from streamvis.receiver import StreamAdapter
+from streamvis.ring_buffer import RingBuffer
+from streamvis.statistics_handler import StatisticsHandler
+
+# image shapes (height, width) and data types of the 'tests/zmq_sender.py' streams
+STREAMS = {
+    "base": ((1024, 1024), "float32"),
+    "raw-16m": ((512 * 32, 1024), "uint16"),
+    "alvra": ((514, 9318), "float32"),
+    "bernina": ((1554, 1030), "float32"),
+    "alvra-16m": ((4214, 4982), "float32"),
+    "bernina-16m": ((4164, 4150), "float32"),
+}
+
+# screen size of the main image view in pixels
+PLOT_WIDTH = 1200
+PLOT_HEIGHT = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument(
+        "--stream",
+        type=str,
+        nargs="+",
+        choices=list(STREAMS),
+        default=list(STREAMS),
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="a number of timed runs per stage")
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=2,
+        help="a number of untimed runs, e.g. for numba compilation",
+    )
+    parser.add_argument(
+        "--detector-name",
+        type=str,
+        default=None,
+        help="a detector name for raw (uint16) streams to also benchmark jungfrau conversion",
+    )
+    parser.add_argument("--output", type=str, default=None, help="an output json file")
+
+    args = parser.parse_args()
+
+    results = dict()
+    for stream in args.stream:
+        shape, dtype = STREAMS[stream]
+        print(f"{stream}: {shape} {dtype}")
+        results[stream] = benchmark_stream(
+            shape, dtype, args.repeat, args.warmup, args.detector_name
+        )
+        for stage, stats in results[stream].items():
+            print(f"  {stage:<25} {stats['median']:10.3f} ms")
+
+    report = dict(
+        timestamp=datetime.now().isoformat(),
+        platform=platform.platform(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        bokeh=bokeh.__version__,
+        streamvis=sv.__version__,
+        repeat=args.repeat,
+        results=results,
+    )
+
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def benchmark_stream(shape, dtype, repeat, warmup, detector_name=None):
+    """Time all pipeline stages for images of the given shape and data type.
+
+    Args:
+        shape (tuple): Image shape.
+        dtype (str): Image data type.
+        repeat (int): A number of timed runs per stage.
+        warmup (int): A number of untimed runs per stage.
+        detector_name (str, optional): A detector name for raw images. Defaults to None.
+
+    Returns:
+        dict: Timing statistics in milliseconds per stage.
+    """
+    rng = np.random.default_rng(0)
+    image = rng.uniform(5000, 10090, size=shape).astype(dtype)
+    metadata = simulated_metadata(image, rng)
+    if detector_name is not None and dtype == "uint16":
+        metadata["detector_name"] = detector_name
+    metadata_bytes = json.dumps(metadata).encode()
+
+    decode_metadata = MetadataDecoder()
+    ring_buffer = RingBuffer(size=1)
+    stream_adapter = StreamAdapter()
+    image_processor = sv.ImageProcessor()
+    image_view = sv.ImageView(plot_height=PLOT_HEIGHT, plot_width=PLOT_WIDTH)
+    # there is no browser to report the actual canvas size, which is a readonly property
+    image_view.plot._property_values.update(inner_width=PLOT_WIDTH, inner_height=PLOT_HEIGHT)
+    colormapper = sv.ColorMapper([image_view])
+    histogram = sv.Histogram(nplots=1)
+    stats_handler = StatisticsHandler(hit_threshold=15)
+
+    def receive():
+        frame = ring_buffer.reserve(image.dtype, image.shape)
+        frame[:] = image
+        ring_buffer.commit(metadata)
+
+    proc_image = stream_adapter.process(image, metadata).astype(np.float32, copy=False)
+
+    stages = dict(
+        receiver_decode=lambda: decode_metadata(metadata_bytes),
+        receiver_copy=receive,
+        stream_adapter_process=lambda: stream_adapter.process(image, metadata),
+        image_processor_update=lambda: image_processor.update(metadata, proc_image),
+        image_view_update=lambda: image_view.update(proc_image),
+        histogram_update=lambda: histogram.update([proc_image]),
+        colormapper_update=lambda: colormapper.update(proc_image),
+        statistics_parse=lambda: stats_handler.parse(dict(metadata), image),
+    )
+
+    return {name: time_stage(func, repeat, warmup) for name, func in stages.items()}
+
+
+def time_stage(func, repeat, warmup):
+    """Time a function call.
+
+    Args:
+        func (function): A function without arguments.
+        repeat (int): A number of timed runs.
+        warmup (int): A number of untimed runs.
+
+    Returns:
+        dict: min, median, mean, p90 and max times in milliseconds.
+    """
+    for _ in range(warmup):
+        func()
+
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append((perf_counter() - start) * 1000)
+
+    return dict(
+        min=min(times),
+        median=statistics.median(times),
+        mean=statistics.mean(times),
+        p90=float(np.percentile(times, 90)),
+        max=max(times),
+    )
+
+
+def simulated_metadata(image, rng):
+    """Return metadata similar to the one sent by 'tests/zmq_sender.py'.
+    """
+    n_spots = 30
+    return dict(
+        htype=["array-1.0"],
+        type=str(image.dtype),
+        shape=list(image.shape),
+        frame=1,
+        pulse_id=1000,
+        pulse_id_diff=[0, 0, 0],
+        missing_packets_1=[0, 0, 0],
+        missing_packets_2=[0, 1, 0],
+        is_good_frame=1,
+        module_enabled=[1, 0, 1],
+        number_of_spots=n_spots,
+        spot_x=(rng.random(n_spots) * 1000).tolist(),
+        spot_y=(rng.random(n_spots) * 1000).tolist(),
+        run_name="run_001",
+        detector_distance=0.015,
+        beam_energy=4570.0,
+        beam_center_x=700,
+        beam_center_y=500,
+        swissmx_x=1,
+        swissmx_y=1,
+        laser_on=True,
+        radint_q=[0, 1000],
+        radint_I=(rng.random(1000) * 10).tolist(),
+        saturated_pixels=1,
+    )
+
+
+if __name__ == "__main__":
+    main()
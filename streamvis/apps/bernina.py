@@ -98,6 +98,8 @@ sv_hist.plots[0].title = Title(text="Full image")
 sv_hist.plots[1].title = Title(text="Signal roi", text_color="red")
 sv_hist.plots[2].title = Title(text="Background roi", text_color="green")
 
+sv_profiler = sv.ProfilerPanel(datatable_height=200, datatable_width=700)
+
 sv_streamctrl = sv.StreamControl()
 
 sv_image_processor = sv.ImageProcessor()
@@ -158,7 +160,9 @@ layout_controls = row(
 )
 
 layout_metadata = column(
-    sv_metadata.issues_datatable, row(sv_metadata.show_all_toggle), sv_metadata.datatable
+    sv_metadata.issues_datatable,
+    row(sv_metadata.show_all_toggle, sv_profiler.toggle),
+    sv_metadata.datatable,
 )
 
 final_layout = column(
@@ -169,7 +173,7 @@ final_layout = column(
             layout_metadata, Spacer(height=10), layout_utility, Spacer(height=10), layout_controls
         ),
     ),
-    layout_hist,
+    row(layout_hist, Spacer(width=30), sv_profiler.datatable),
 )
 
 doc.add_root(final_layout)
@@ -252,4 +256,4 @@ async def internal_periodic_callback():
     sv_metadata.update(metadata)
 
 
-doc.add_periodic_callback(internal_periodic_callback, 1000 / doc.client_fps)
+sv_streamctrl.add_update_callback(internal_periodic_callback)
@@ -57,6 +57,8 @@ sv_spots = sv.Spots([sv_main], sv_metadata)
 
 sv_hist = sv.Histogram(nplots=1, plot_height=290, plot_width=700)
 
+sv_profiler = sv.ProfilerPanel(datatable_height=300, datatable_width=700)
+
 
 def image_buffer_slider_callback(_attr, _old, new):
     sv_rt.metadata, sv_rt.image = image_buffer[new]
@@ -94,11 +96,16 @@ layout_hist = column(
 )
 
 layout_metadata = column(
-    sv_metadata.issues_datatable, row(sv_metadata.show_all_toggle), sv_metadata.datatable
+    sv_metadata.issues_datatable,
+    row(sv_metadata.show_all_toggle, sv_profiler.toggle),
+    sv_metadata.datatable,
 )
 
 layout_debug = column(
-    layout_intensity, Spacer(height=30), row(layout_hist, Spacer(width=30), layout_metadata)
+    layout_intensity,
+    Spacer(height=30),
+    row(layout_hist, Spacer(width=30), layout_metadata),
+    sv_profiler.datatable,
 )
 
 layout_zoom = gridplot(
@@ -204,4 +211,4 @@ async def internal_periodic_callback():
     sv_metadata.update(metadata)
 
 
-doc.add_periodic_callback(internal_periodic_callback, 1000 / doc.client_fps)
+sv_streamctrl.add_update_callback(internal_periodic_callback)
@@ -163,4 +163,4 @@ async def internal_periodic_callback():
     sv_metadata.update(metadata)
 
 
-doc.add_periodic_callback(internal_periodic_callback, 1000 / doc.client_fps)
+sv_streamctrl.add_update_callback(internal_periodic_callback)
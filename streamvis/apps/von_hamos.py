@@ -166,6 +166,8 @@ sv_streamgraph.plots[2].title = Title(text="Zoom Area 2 Total Intensity")
 
 sv_streamctrl = sv.StreamControl()
 
+sv_profiler = sv.ProfilerPanel(datatable_height=200, datatable_width=800)
+
 
 # Final layouts
 layout_zoom1 = column(
@@ -232,12 +234,17 @@ layout_controls = column(
 )
 
 layout_metadata = column(
-    sv_metadata.issues_datatable, row(sv_metadata.show_all_toggle), sv_metadata.datatable
+    sv_metadata.issues_datatable,
+    row(sv_metadata.show_all_toggle, sv_profiler.toggle),
+    sv_metadata.datatable,
 )
 
 layout_left = column(row(layout_zoom1, layout_zoom2), layout_bottom_row_controls)
 layout_right = column(
-    layout_streamgraphs, Spacer(height=30), row(layout_controls, Spacer(width=30), layout_metadata)
+    layout_streamgraphs,
+    Spacer(height=30),
+    row(layout_controls, Spacer(width=30), layout_metadata),
+    sv_profiler.datatable,
 )
 
 final_layout = column(sv_main.plot, row(layout_left, Spacer(width=30), layout_right))
@@ -302,4 +309,4 @@ async def internal_periodic_callback():
     sv_metadata.update(metadata)
 
 
-doc.add_periodic_callback(internal_periodic_callback, 1000 / doc.client_fps)
+sv_streamctrl.add_update_callback(internal_periodic_callback)
@@ -2,6 +2,8 @@ import argparse
 import logging
 import os
 import pkgutil
+import re
+import signal
 from functools import partial
 from threading import Thread
 
@@ -10,13 +12,34 @@ from bokeh.application.handlers import ScriptHandler
 from bokeh.server.server import Server
 
 from streamvis import __version__
+from streamvis.conversion_pool import ConversionPool
+from streamvis.frame_cache import FrameCache
 from streamvis.handler import StreamvisHandler, StreamvisCheckHandler
-from streamvis.receiver import Receiver, StreamAdapter
+from streamvis.metadata_decoder import BACKENDS, MetadataDecoder
+from streamvis.metrics import MetricsHandler
+from streamvis.recorder import TRIGGERS, Recorder
+from streamvis.receiver import HANDLER_POOL_SIZE, Receiver, StreamAdapter
 from streamvis.statistics_handler import StatisticsHandler
 
 logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+MEMORY_UNITS = {
+    "B": 1,
+    "KB": 10 ** 3,
+    "MB": 10 ** 6,
+    "GB": 10 ** 9,
+    "TB": 10 ** 12,
+    "KIB": 2 ** 10,
+    "MIB": 2 ** 20,
+    "GIB": 2 ** 30,
+    "TIB": 2 ** 40,
+}
+
+# a minimal time in seconds after the last request of conversion options by a session, when frames
+# are still converted with those options in the background
+CONVERSION_REQUEST_TIMEOUT = 10
+
 
 def main():
     """The streamvis command line interface.
@@ -60,10 +83,13 @@ def main():
 
     parser.add_argument(
         "--address",
-        metavar="PROTOCOL://HOST:PORT",
+        metavar="[NAME=]PROTOCOL://HOST:PORT",
         type=str,
-        default="tcp://127.0.0.1:9001",
-        help="an address string for zmq socket",
+        action="append",
+        default=None,
+        help="an address string for zmq socket, can be repeated to receive several streams, "
+        "which are selected in applications by a name via 'stream' url argument, e.g. "
+        "http://localhost:5006/?stream=NAME (default: tcp://127.0.0.1:9001)",
     )
 
     parser.add_argument(
@@ -81,6 +107,31 @@ def main():
         help="the size of the zmq thread pool to handle I/O operations",
     )
 
+    parser.add_argument(
+        "--receiver-mode",
+        type=str,
+        choices=["thread", "process", "async"],
+        default="thread",
+        help="run the receiver in a thread of the server process, in a separate process that "
+        "shares received images via shared memory, or on the server event loop, which allows to "
+        "update clients on arrival of new frames",
+    )
+
+    parser.add_argument(
+        "--decompression-threads",
+        type=int,
+        default=2,
+        help="a number of threads to decompress images that arrive compressed (bitshuffle/lz4)",
+    )
+
+    parser.add_argument(
+        "--metadata-decoder",
+        type=str,
+        choices=BACKENDS,
+        default="auto",
+        help="a json parser for zmq message metadata, 'auto' uses orjson if it is installed",
+    )
+
     parser.add_argument(
         "--buffer-size",
         type=int,
@@ -88,6 +139,31 @@ def main():
         help="a number of last received zmq messages to keep in memory",
     )
 
+    parser.add_argument(
+        "--buffer-memory",
+        type=memory_size,
+        default=None,
+        help="a memory budget for received images, e.g. '4GB' or '512MiB', shared equally by all "
+        "streams, the number of kept zmq messages is then derived from the image size instead of "
+        "using --buffer-size",
+    )
+
+    parser.add_argument(
+        "--reorder-window",
+        type=int,
+        default=None,
+        help="pass received messages to statistics in pulse_id order within a window of this "
+        "number of pulses (limited by --buffer-size)",
+    )
+
+    parser.add_argument(
+        "--reorder-window-ms",
+        type=float,
+        default=None,
+        help="pass received messages to statistics in pulse_id order within a window of this "
+        "number of milliseconds (limited by --buffer-size)",
+    )
+
     parser.add_argument(
         "--hit-threshold",
         type=int,
@@ -102,10 +178,70 @@ def main():
         help="a maximum number of concurrent client connections",
     )
 
+    parser.add_argument(
+        "--record-dir",
+        type=str,
+        default=None,
+        help="a directory to record received images and metadata to hdf5 files, recording is "
+        "disabled if not provided",
+    )
+
+    parser.add_argument(
+        "--record-trigger",
+        type=str,
+        choices=TRIGGERS,
+        default="all",
+        help="record all frames, only hits, or frames around each hit",
+    )
+
+    parser.add_argument(
+        "--record-frames-around",
+        type=int,
+        default=0,
+        help="a number of frames to record before and after each hit for the 'around' trigger "
+        "(frames before a hit are limited by the buffer size)",
+    )
+
+    parser.add_argument(
+        "--record-queue-size",
+        type=int,
+        default=100,
+        help="a maximal number of frames waiting to be written, further frames are dropped",
+    )
+
+    parser.add_argument(
+        "--frame-cache-memory",
+        type=memory_size,
+        default="512MB",
+        help="a memory budget for processed images shared between client sessions, e.g. '2GB'",
+    )
+
+    parser.add_argument(
+        "--conversion-workers",
+        type=int,
+        default=2,
+        help="a number of threads to convert received images in the background for client "
+        "sessions, 0 to convert images only on request",
+    )
+
+    parser.add_argument(
+        "--handler-pool-size",
+        type=int,
+        default=HANDLER_POOL_SIZE,
+        help="a maximal number of jungfrau data handlers with distinct detector configurations "
+        "kept in memory",
+    )
+
     parser.add_argument(
         "--client-fps", type=float, default=1, help="client update rate in frames per second",
     )
 
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="periodically log durations of document update stages for each client session",
+    )
+
     parser.add_argument(
         "--allow-client-subnet",
         type=str,
@@ -126,24 +262,125 @@ def main():
     app_path = os.path.join(apps_path, args.app + ".py")
     logger.info(app_path)
 
-    # StatisticsHandler is used by Receiver to parse metadata information to be displayed in
-    # 'statistics' application, all messages are being processed.
-    stats = StatisticsHandler(hit_threshold=args.hit_threshold, buffer_size=args.buffer_size)
+    if (
+        args.reorder_window is not None
+        and args.buffer_memory is None
+        and args.reorder_window > args.buffer_size
+    ):
+        logger.warning(
+            f"Reorder window of {args.reorder_window} pulses is limited by the buffer size "
+            f"of {args.buffer_size} messages"
+        )
 
-    # Receiver gets messages via zmq stream and parses statistics with StatisticsHandler
-    receiver = Receiver(on_receive=stats.parse, buffer_size=args.buffer_size)
+    if args.address is None:
+        args.address = ["tcp://127.0.0.1:9001"]
 
-    # Start receiver in a separate thread
-    start_receiver = partial(receiver.start, args.io_threads, args.connection_mode, args.address)
-    t = Thread(target=start_receiver, daemon=True)
-    t.start()
+    if args.buffer_memory is None:
+        buffer_memory = None
+    else:
+        buffer_memory = args.buffer_memory // len(args.address)
 
     # Reconstructs requested images
-    jf_adapter = StreamAdapter()
+    jf_adapter = StreamAdapter(pool_size=args.handler_pool_size)
+
+    # Shares processed images between sessions with the same conversion options
+    frame_cache = FrameCache(memory=args.frame_cache_memory)
+
+    # sessions request conversions with the client update rate
+    request_timeout = max(CONVERSION_REQUEST_TIMEOUT, 3 / args.client_fps)
+
+    receivers = dict()
+    stats_handlers = dict()
+    conversion_pools = dict()
+    async_receivers = []
+    for stream in args.address:
+        # an optional stream name precedes the address, otherwise the address itself is the name
+        name, sep, address = stream.partition("=")
+        if not sep:
+            name = address = stream
+
+        if name in receivers:
+            parser.error(f"Stream name '{name}' is not unique")
+
+        # StatisticsHandler is used by Receiver to parse metadata information to be displayed in
+        # 'statistics' application, all messages are being processed.
+        stats = StatisticsHandler(hit_threshold=args.hit_threshold, buffer_size=args.buffer_size)
+
+        # Recorder is used by Receiver to write frames selected by a trigger to hdf5 files
+        if args.record_dir is None:
+            recorder = None
+        else:
+            recorder = Recorder(
+                args.record_dir,
+                prefix=re.sub(r"\W+", "_", name),
+                trigger=args.record_trigger,
+                hit_threshold=args.hit_threshold,
+                frames_around=args.record_frames_around,
+                queue_size=args.record_queue_size,
+            )
+
+        # Receiver gets messages via zmq stream and parses statistics with StatisticsHandler, a
+        # receiver process parses statistics itself, so that only hits are kept here
+        if args.receiver_mode == "process":
+            parse_stats = stats.parse_hit
+        else:
+            parse_stats = stats.parse
+
+        receiver = Receiver(
+            on_receive=parse_stats,
+            buffer_size=args.buffer_size,
+            buffer_memory=buffer_memory,
+            decompression_threads=args.decompression_threads,
+            reorder_window=args.reorder_window,
+            reorder_window_ms=args.reorder_window_ms,
+            metadata_decoder=MetadataDecoder(backend=args.metadata_decoder),
+            recorder=recorder,
+        )
+
+        # ConversionPool is used by Receiver to convert received frames in the background with
+        # conversion options requested by sessions
+        if args.conversion_workers:
+            conversion_pool = ConversionPool(
+                jf_adapter,
+                frame_cache=frame_cache,
+                workers=args.conversion_workers,
+                request_timeout=request_timeout,
+                receiver=receiver,
+            )
+            receiver.on_receive = _chain_callbacks(parse_stats, conversion_pool.submit)
+        else:
+            conversion_pool = None
+
+        # Start receiver in a separate thread, or on the server event loop
+        if args.receiver_mode == "async":
+            async_receivers.append(
+                partial(receiver.start_async, args.io_threads, args.connection_mode, address)
+            )
+        else:
+            if args.receiver_mode == "process":
+                start_receiver = partial(
+                    receiver.start_process,
+                    args.io_threads,
+                    args.connection_mode,
+                    address,
+                    stats=stats,
+                )
+            else:
+                start_receiver = partial(
+                    receiver.start, args.io_threads, args.connection_mode, address
+                )
+            t = Thread(target=start_receiver, daemon=True)
+            t.start()
+
+        receivers[name] = receiver
+        stats_handlers[name] = stats
+        conversion_pools[name] = conversion_pool
 
     # StreamvisHandler is a custom bokeh application Handler, which sets some of the core
     # properties for new bokeh documents created by all applications.
-    sv_handler = StreamvisHandler(receiver, stats, jf_adapter, args)
+    sv_handler = StreamvisHandler(
+        receivers, stats_handlers, jf_adapter, frame_cache, conversion_pools, args
+    )
     sv_check_handler = StreamvisCheckHandler(
         max_sessions=args.max_client_connections, allow_client_subnet=args.allow_client_subnet
     )
@@ -168,10 +405,66 @@ def main():
         allow_websocket_origin=args.allow_websocket_origin,
         unused_session_lifetime_milliseconds=1,
         check_unused_sessions_milliseconds=3000,
+        extra_patterns=[
+            (
+                "/metrics",
+                MetricsHandler,
+                dict(receivers=receivers, allow_client_subnet=args.allow_client_subnet),
+            )
+        ],
     )
 
     server.start()
-    server.io_loop.start()
+    for start_receiver in async_receivers:
+        server.io_loop.spawn_callback(start_receiver)
+
+    # stop the server on SIGTERM as well, so that receivers are stopped
+    signal.signal(
+        signal.SIGTERM, lambda *_: server.io_loop.add_callback_from_signal(server.io_loop.stop)
+    )
+
+    try:
+        server.io_loop.start()
+    finally:
+        for receiver in receivers.values():
+            receiver.stop()
+
+        # write queued frames and close files of recorders
+        for receiver in receivers.values():
+            if receiver.recorder is not None:
+                receiver.recorder.close()
+
+
+def _chain_callbacks(*callbacks):
+    def chained(*args):
+        for callback in callbacks:
+            callback(*args)
+
+    return chained
+
+
+def memory_size(value):
+    """Parse a memory size with an optional unit, e.g. '4GB', '512 MiB' or '1000000'.
+
+    Args:
+        value (str): A memory size string.
+
+    Returns:
+        int: The memory size in bytes.
+    """
+    size_str = value.strip().upper()
+    number = size_str.rstrip("BKMGTI ")
+    unit = size_str[len(number) :].strip() or "B"
+
+    try:
+        size = int(float(number) * MEMORY_UNITS[unit])
+    except (ValueError, KeyError):
+        raise argparse.ArgumentTypeError(f"invalid memory size '{value}'") from None
+
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"memory size should be positive, got '{value}'")
+
+    return size
 
 
 if __name__ == "__main__":
@@ -15,6 +15,8 @@ from bokeh.models import (
 
 from bokeh.palettes import Cividis256, Greys256, Plasma256
 
+from streamvis.profiler import profile
+
 cmap_dict = {
     "gray": Greys256,
     "gray_r": Greys256[::-1],
@@ -177,6 +179,7 @@ class ColorMapper:
         """
         return self.display_max_spinner.value
 
+    @profile
     def update(self, image):
         """Trigger an update for the colormapper.
 
@@ -0,0 +1,178 @@
+from datetime import datetime
+from itertools import cycle
+from time import monotonic
+
+from bokeh.io import curdoc
+from bokeh.layouts import column, gridplot
+from bokeh.models import (
+    BasicTicker,
+    BasicTickFormatter,
+    BoxZoomTool,
+    ColumnDataSource,
+    DataRange1d,
+    DatetimeAxis,
+    Grid,
+    Legend,
+    LegendItem,
+    Line,
+    LinearAxis,
+    PanTool,
+    Plot,
+    ResetTool,
+    Title,
+    WheelZoomTool,
+)
+from bokeh.palettes import Category10_10
+
+import streamvis as sv
+from streamvis.metrics import process_rss
+
+# a number of last points to keep in line plots
+ROLLOVER = 3600
+
+doc = curdoc()
+receiver = doc.receiver
+sessions = doc.sessions
+doc.title = f"{doc.title} Performance"
+
+
+class LinePlot:
+    def __init__(self, title, plot_height=250, plot_width=1000):
+        """Initialize a time plot with a line per key, where new keys can appear at any update.
+
+        Args:
+            title (str): Plot title.
+            plot_height (int, optional): Height of plot area in screen pixels. Defaults to 250.
+            plot_width (int, optional): Width of plot area in screen pixels. Defaults to 1000.
+        """
+        plot = Plot(
+            title=Title(text=title),
+            x_range=DataRange1d(),
+            y_range=DataRange1d(),
+            plot_height=plot_height,
+            plot_width=plot_width,
+            toolbar_location="left",
+        )
+
+        # ---- tools
+        plot.toolbar.logo = None
+        plot.add_tools(PanTool(), BoxZoomTool(), WheelZoomTool(dimensions="width"), ResetTool())
+
+        # ---- axes
+        plot.add_layout(LinearAxis(formatter=BasicTickFormatter(precision=1)), place="left")
+        plot.add_layout(DatetimeAxis(), place="below")
+
+        # ---- grid lines
+        plot.add_layout(Grid(dimension=0, ticker=BasicTicker()))
+        plot.add_layout(Grid(dimension=1, ticker=BasicTicker()))
+
+        # ---- legend
+        plot.add_layout(Legend(location="top_left"))
+        plot.legend.click_policy = "hide"
+
+        self.plot = plot
+        self._sources = dict()
+        self._colors = cycle(Category10_10)
+
+    def update(self, t, values):
+        """Add points to lines.
+
+        Args:
+            t (datetime): Time of the points.
+            values (dict): Values of the points, with line names as keys.
+        """
+        for name, value in values.items():
+            source = self._sources.get(name)
+            if source is None:
+                source = self._sources[name] = ColumnDataSource(dict(x=[], y=[]))
+                renderer = self.plot.add_glyph(
+                    source, Line(x="x", y="y", line_color=next(self._colors), line_width=2)
+                )
+                self.plot.legend.items.append(LegendItem(label=name, renderers=[renderer]))
+
+            source.stream(dict(x=[t], y=[value]), rollover=ROLLOVER)
+
+
+# Server state graphs
+sv_streamgraph = sv.StreamGraph(nplots=4, plot_height=200, plot_width=1000, rollover=ROLLOVER)
+sv_streamgraph.plots[0].title = Title(text=f"Receiver rate, Hz ({doc.stream})")
+sv_streamgraph.plots[1].title = Title(text=f"Receiver buffer fill, % ({doc.stream})")
+sv_streamgraph.plots[2].title = Title(text="Active sessions")
+sv_streamgraph.plots[3].title = Title(text="Process RSS, MB")
+
+stage_latency = LinePlot("Mean stage duration, ms (all sessions)")
+session_fps = LinePlot("Achieved update rate, fps (per session)")
+
+# stage counters of all sessions and their time at the previous update
+last_counters = dict()
+last_time = monotonic()
+
+
+def update():
+    global last_counters, last_time
+
+    t = datetime.now()
+    now = monotonic()
+    elapsed = now - last_time
+
+    counters = {
+        session_id: session["profiler"].counters() for session_id, session in sessions.items()
+    }
+
+    stage_totals = dict()
+    fps = dict()
+    for session_id, session_counters in counters.items():
+        last_session_counters = last_counters.get(session_id)
+        if last_session_counters is None:
+            # differences are available starting from the second update
+            continue
+
+        for stage, (count, total) in session_counters.items():
+            last_count, last_total = last_session_counters.get(stage, (0, 0))
+            if count < last_count:
+                # counters were cleared
+                continue
+
+            stage_count, stage_total = stage_totals.get(stage, (0, 0))
+            stage_count += count - last_count
+            stage_total += total - last_total
+            stage_totals[stage] = (stage_count, stage_total)
+
+        if "update" in session_counters:
+            session = sessions[session_id]
+            name = f"{session['app']} ({session['stream']}) {session_id[:8]}"
+            update_count = session_counters["update"][0]
+            fps[name] = (update_count - last_session_counters.get("update", (0, 0))[0]) / elapsed
+
+    latency = {
+        stage: total / count * 1000 for stage, (count, total) in stage_totals.items() if count
+    }
+
+    buffer = receiver.buffer
+    sv_streamgraph.update(
+        [
+            receiver.metrics.to_dict()["messages_per_second"],
+            len(buffer) / buffer.size * 100 if buffer.size else 0,
+            len(sessions),
+            process_rss() / 1e6,
+        ]
+    )
+    stage_latency.update(t, latency)
+    session_fps.update(t, fps)
+
+    last_counters = counters
+    last_time = now
+
+
+doc.add_root(
+    column(
+        gridplot(
+            [*sv_streamgraph.plots, stage_latency.plot, session_fps.plot],
+            ncols=1,
+            toolbar_location="left",
+            toolbar_options=dict(logo=None),
+        ),
+        sv_streamgraph.moving_average_spinner,
+    )
+)
+doc.add_periodic_callback(update, 1000)
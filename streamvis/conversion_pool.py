@@ -0,0 +1,239 @@
+import logging
+from collections import namedtuple
+from concurrent import futures
+from threading import Lock
+from time import monotonic
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# image conversion settings requested by a session
+ConversionOptions = namedtuple(
+    "ConversionOptions", ["datatype", "mask", "gap_pixels", "double_pixels", "geometry", "n_rot"]
+)
+
+
+def convert_frame(jf_adapter, metadata, image, options, copy=True):
+    """Convert a received frame according to conversion options.
+
+    Args:
+        jf_adapter (StreamAdapter): A jungfrau stream adapter.
+        metadata (dict): Metadata of a received frame.
+        image (ndarray): Image of a received frame.
+        options (ConversionOptions): Conversion options.
+        copy (bool, optional): If False, the resulting image can be a read-only view of the
+            received image, which should then stay unchanged. Defaults to True.
+
+    Returns:
+        (dict, ndarray): Resulting metadata and image.
+    """
+    if options.datatype == "Image":
+        # saturated pixels are detected during conversion, unless they are already provided
+        detect_saturated = "saturated_pixels" not in metadata and image.dtype == np.uint16
+        proc_image = jf_adapter.process(
+            image,
+            metadata,
+            mask=options.mask,
+            gap_pixels=options.gap_pixels,
+            double_pixels=options.double_pixels,
+            geometry=options.geometry,
+            n_rot=options.n_rot,
+            saturated_pixels=detect_saturated,
+            copy=copy,
+        )
+
+        if detect_saturated:
+            proc_image, saturated_pixels_coord = proc_image
+            if saturated_pixels_coord is not None:
+                # the received metadata is shared by sessions with different conversion options
+                metadata = dict(metadata)
+                metadata["saturated_pixels_coord"] = saturated_pixels_coord
+                metadata["saturated_pixels"] = len(saturated_pixels_coord[0])
+
+    elif options.datatype == "Gains":
+        if image.dtype != np.uint16:
+            return dict(shape=[1, 1]), np.zeros((1, 1), dtype="float32")
+
+        proc_image = jf_adapter.get_gains(
+            image,
+            metadata,
+            mask=options.mask,
+            gap_pixels=options.gap_pixels,
+            geometry=options.geometry,
+            n_rot=options.n_rot,
+        )
+        if proc_image is None:
+            return dict(shape=[1, 1]), np.zeros((1, 1), dtype="float32")
+
+    return metadata, proc_image
+
+
+def convert_buffered_frame(jf_adapter, buffer, version, options):
+    """Convert a frame kept in a ring buffer according to conversion options.
+
+    The frame is converted directly from its buffer slot, without copying it first. As the slot
+    can be reused during conversion, the result is only returned if the frame is still intact
+    afterwards.
+
+    Args:
+        jf_adapter (StreamAdapter): A jungfrau stream adapter.
+        buffer (RingBuffer): A ring buffer with the frame.
+        version (tuple): A version of the frame.
+        options (ConversionOptions): Conversion options.
+
+    Returns:
+        (dict, dict, ndarray): Metadata of the frame, resulting metadata and image, or None if the
+            frame has been overwritten.
+    """
+    if not buffer.is_intact(version):
+        return None
+
+    metadata, image = buffer.read(version)
+    # the result should not share memory with the buffer slot
+    proc_metadata, proc_image = convert_frame(jf_adapter, metadata, image, options, copy=True)
+    if not buffer.is_intact(version):
+        return None
+
+    return metadata, proc_metadata, proc_image
+
+
+class ConversionPool:
+    def __init__(self, jf_adapter, frame_cache=None, workers=2, request_timeout=10, receiver=None):
+        """Initialize a pool of threads that convert received frames in the background.
+
+        Each received frame is converted with all conversion options that are currently requested
+        by sessions, so that sessions only pick up finished results instead of converting frames
+        on the server event loop. There is at most one conversion in progress per options. If
+        frames arrive faster than they are converted, only the latest of waiting frames is kept
+        and the others are dropped, which bounds the latency of results.
+
+        Args:
+            jf_adapter (StreamAdapter): A jungfrau stream adapter.
+            frame_cache (FrameCache, optional): Add results to the cache of processed frames.
+                Defaults to None.
+            workers (int, optional): A number of conversion threads. Defaults to 2.
+            request_timeout (float, optional): Stop converting frames with options that have not
+                been requested for this number of seconds. Defaults to 10.
+            receiver (Receiver, optional): A receiver, whose buffer holds submitted frames. Such
+                frames are copied from the buffer right before their conversion, and frames that
+                have been overwritten in the meantime are dropped. Defaults to None.
+        """
+        self.jf_adapter = jf_adapter
+        self.receiver = receiver
+        self.frame_cache = frame_cache
+        self.request_timeout = request_timeout
+
+        self.converted = 0
+        self.dropped = 0
+        self.errors = 0
+
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers)
+        self._lock = Lock()
+
+        # last request times, conversions in progress, waiting frames and last results per options
+        self._requested = dict()
+        self._running = set()
+        self._pending = dict()
+        self._results = dict()
+
+    def request(self, options):
+        """Request conversion of the following frames with given options.
+
+        Args:
+            options (ConversionOptions): Conversion options.
+        """
+        with self._lock:
+            self._requested[options] = monotonic()
+
+    def get_result(self, options):
+        """Return the latest frame converted with given options.
+
+        Args:
+            options (ConversionOptions): Conversion options.
+
+        Returns:
+            (dict, ndarray): Resulting metadata and image, or None if there is no result yet.
+        """
+        with self._lock:
+            return self._results.get(options)
+
+    def submit(self, metadata, image):
+        """Submit a received frame for conversion with all requested options.
+
+        Args:
+            metadata (dict): Metadata of a received frame.
+            image (ndarray): Image of a received frame.
+        """
+        if image.shape == (2, 2):
+            # dummy images are not converted
+            return
+
+        if self.receiver is None:
+            frame = (metadata, image, None, None)
+        else:
+            # the image is a view on a buffer slot, which can be reused before it is converted
+            buffer = self.receiver.buffer
+            version = buffer.find_version(metadata)
+            if version is None:
+                return
+            frame = (metadata, image, buffer, version)
+
+        with self._lock:
+            expired = monotonic() - self.request_timeout
+            for options, request_time in list(self._requested.items()):
+                if request_time < expired:
+                    del self._requested[options]
+                    self._pending.pop(options, None)
+                    self._results.pop(options, None)
+                    continue
+
+                if options in self._running:
+                    if options in self._pending:
+                        self.dropped += 1
+                    self._pending[options] = frame
+                else:
+                    self._running.add(options)
+                    self._executor.submit(self._convert, options, frame)
+
+    def _convert(self, options, frame):
+        while True:
+            try:
+                result = self._convert_frame(options, *frame)
+            except Exception:
+                # the options should stay convertible for the following frames
+                logger.exception("Error converting frame")
+                result = None
+                with self._lock:
+                    self.errors += 1
+
+            with self._lock:
+                if result is not None:
+                    self.converted += 1
+                    if options in self._requested:
+                        self._results[options] = result
+
+                frame = self._pending.pop(options, None)
+                if frame is None:
+                    self._running.discard(options)
+                    return
+
+    def _convert_frame(self, options, metadata, image, buffer, version):
+        if buffer is None:
+            proc_metadata, proc_image = convert_frame(self.jf_adapter, metadata, image, options)
+        else:
+            converted = convert_buffered_frame(self.jf_adapter, buffer, version, options)
+            if converted is None:
+                # the frame has been overwritten before or during its conversion
+                with self._lock:
+                    self.dropped += 1
+                return None
+
+            _, proc_metadata, proc_image = converted
+
+        # results are shared by sessions
+        proc_image.flags.writeable = False
+        if self.frame_cache is not None:
+            self.frame_cache.put(metadata, options, proc_metadata, proc_image)
+
+        return proc_metadata, proc_image
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class FrameCache:
+    def __init__(self, memory):
+        """Initialize a cache of processed images shared by all sessions.
+
+        Entries are keyed by a received frame identity (its metadata object) together with
+        processing options, so that sessions with identical settings share a single processed
+        image. The least recently used entries are evicted once the total size of cached images
+        exceeds the memory budget. Cached images are read-only.
+
+        Args:
+            memory (int): A memory budget in bytes for all cached images.
+        """
+        self.memory = memory
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        """A total size of cached images in bytes (readonly).
+        """
+        return self._nbytes
+
+    def get(self, metadata, options):
+        """Return a processed frame.
+
+        Args:
+            metadata (dict): Metadata of a received frame.
+            options (tuple): Processing options.
+
+        Returns:
+            (dict, ndarray): Processed metadata and image, or None if they are not cached.
+        """
+        key = (id(metadata), options)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        _, proc_metadata, proc_image = entry
+        return proc_metadata, proc_image
+
+    def put(self, metadata, options, proc_metadata, proc_image):
+        """Add a processed frame, which makes its image read-only.
+
+        Args:
+            metadata (dict): Metadata of a received frame.
+            options (tuple): Processing options.
+            proc_metadata (dict): Processed metadata.
+            proc_image (ndarray): Processed image.
+        """
+        proc_image.flags.writeable = False
+        if proc_image.nbytes > self.memory:
+            return
+
+        # keeping a reference to the frame metadata guarantees that its id is not reused by
+        # another frame while the entry exists
+        key = (id(metadata), options)
+        with self._lock:
+            if key in self._entries:
+                return
+
+            self._entries[key] = (metadata, proc_metadata, proc_image)
+            self._nbytes += proc_image.nbytes
+
+            while self._nbytes > self.memory:
+                _, (_, _, evicted_image) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_image.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all cached frames.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
@@ -1,29 +1,50 @@
+import logging
 from ipaddress import ip_address, ip_network
 
 from bokeh.application.handlers import Handler
 from bokeh.models import Div
 
+from streamvis.profiler import Profiler
+
+logger = logging.getLogger(__name__)
+
+# log profiling data of each document every this number of seconds
+PROFILE_LOG_PERIOD = 10
+
 
 class StreamvisHandler(Handler):
     """Provides a mechanism for generic bokeh applications to build up new streamvis documents.
     """
 
-    def __init__(self, receiver, stats, jf_adapter, args):
+    def __init__(self, receivers, stats, jf_adapter, frame_cache, conversion_pools, args):
         """Initialize a streamvis handler for bokeh applications.
 
         Args:
-            receiver (Receiver): A streamvis receiver instance to be shared between all documents.
-            stats (StreamHandler): A streamvis statistics handler.
+            receivers (dict): Streamvis receiver instances to be shared between all documents, with
+                stream names as keys.
+            stats (dict): Streamvis statistics handlers, with stream names as keys.
             jf_adapter (StreamAdapter): A jungfrau stream adapter.
+            frame_cache (FrameCache): A cache of processed frames to be shared between all
+                documents.
+            conversion_pools (dict): Streamvis conversion pools, with stream names as keys.
             args (Namespace): Command line parsed arguments.
         """
         super().__init__()  # no-op
 
-        self.receiver = receiver
+        self.receivers = receivers
         self.stats = stats
         self.jf_adapter = jf_adapter
+        self.frame_cache = frame_cache
+        self.conversion_pools = conversion_pools
         self.title = args.page_title
         self.client_fps = args.client_fps
+        self.log_profile = args.profile
+
+        # the first stream is used if a document does not request a specific one
+        self.default_stream = next(iter(receivers))
+
+        # active sessions of all applications, with session ids as keys
+        self.sessions = dict()
 
     def modify_document(self, doc):
         """Modify an application document with streamvis specific features.
@@ -34,11 +55,48 @@ class StreamvisHandler(Handler):
         Returns:
             Document
         """
-        doc.receiver = self.receiver
-        doc.stats = self.stats
+        stream = self._get_stream_name(doc)
+
+        doc.stream = stream
+        doc.receiver = self.receivers[stream]
+        doc.stats = self.stats[stream]
         doc.jf_adapter = self.jf_adapter
+        doc.frame_cache = self.frame_cache
+        doc.conversion_pool = self.conversion_pools.get(stream)
         doc.title = self.title
         doc.client_fps = self.client_fps
+        doc.profiler = Profiler()
+        doc.sessions = self.sessions
+
+        if doc.session_context is not None:
+            app = doc.session_context.server_context.application_context.url
+            self.sessions[doc.session_context.id] = dict(
+                app=app, stream=stream, profiler=doc.profiler
+            )
+
+        if self.log_profile:
+            session_id = "" if doc.session_context is None else doc.session_context.id
+            doc.add_periodic_callback(
+                lambda: doc.profiler.log_summary(prefix=f"{session_id} "), PROFILE_LOG_PERIOD * 1000
+            )
+
+    async def on_session_destroyed(self, session_context):
+        self.sessions.pop(session_context.id, None)
+
+    def _get_stream_name(self, doc):
+        if doc.session_context is None:
+            return self.default_stream
+
+        stream = doc.session_context.request.arguments.get("stream")
+        if stream is None:
+            return self.default_stream
+
+        stream = stream[0].decode()
+        if stream not in self.receivers:
+            logger.warning(f"Unknown stream '{stream}', the default one is used instead")
+            return self.default_stream
+
+        return stream
 
 
 class StreamvisCheckHandler(Handler):
@@ -103,7 +161,11 @@ class StreamvisCheckHandler(Handler):
         doc.clear()
         del doc.receiver
         del doc.jf_adapter
+        del doc.frame_cache
+        del doc.conversion_pool
         del doc.stats
+        del doc.profiler
+        del doc.sessions
 
     async def on_session_destroyed(self, session_context):
         if hasattr(session_context._document, "receiver"):
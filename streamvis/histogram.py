@@ -17,6 +17,8 @@ from bokeh.models import (
     WheelZoomTool,
 )
 
+from streamvis.profiler import profile
+
 STEP = 0.1
 
 
@@ -163,6 +165,7 @@ class Histogram:
         """
         return self.nbins_spinner.value
 
+    @profile
     def update(self, input_data, accumulate=False):
         """Trigger an update for the histogram plots.
 
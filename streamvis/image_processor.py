@@ -1,6 +1,8 @@
 import numpy as np
 from bokeh.models import CheckboxGroup, Spinner, TextInput
 
+from streamvis.profiler import profile
+
 
 class ImageProcessor:
     def __init__(self):
@@ -67,6 +69,7 @@ class ImageProcessor:
     def aggregate_counter(self, value):
         self.aggregate_time_counter_textinput.value = str(value)
 
+    @profile
     def update(self, metadata, image):
         """Trigger an update for the image processor.
 
@@ -82,17 +85,22 @@ class ImageProcessor:
 
         counts = metadata.get("aggregated_images", 1)
 
-        thr_image = image.copy()
+        # images can be read-only and shared with other sessions, so they are copied only when
+        # their pixels are changed
+        thr_image = image
         if self.threshold_toggle.active:
             ind = (thr_image < self.threshold_min) | (self.threshold_max < thr_image)
-            thr_image[ind] = 0
+            thr_image = np.where(ind, np.float32(0), thr_image)
 
         if (
             self.aggregate_toggle.active
             and (self.aggregate_time == 0 or self.aggregate_time > self.aggregate_counter)
             and self.aggregated_image.shape == image.shape
         ):
-            self.aggregated_image += thr_image
+            if self.aggregated_image is thr_image or not self.aggregated_image.flags.writeable:
+                self.aggregated_image = self.aggregated_image + thr_image
+            else:
+                self.aggregated_image += thr_image
             self.aggregate_counter += counts
             reset = False
         else:
@@ -19,7 +19,12 @@ from bokeh.models import (
     Text,
     WheelZoomTool,
 )
-from PIL import Image as PIL_Image
+from numba import njit, prange
+
+from streamvis.profiler import profile
+
+# reductions of image pixels that are displayed by a single canvas pixel
+POOLING_MODES = ("max", "mean", "sum")
 
 js_move_zoom = """
     var data = source.data;
@@ -40,6 +45,7 @@ class ImageView:
         x_end=None,
         y_start=None,
         y_end=None,
+        pooling="mean",
     ):
         """Initialize image view plot.
 
@@ -56,7 +62,14 @@ class ImageView:
                 Defaults to None.
             y_end (int, optional): Initial y-axis end value. If None, then equals to image_height.
                 Defaults to None.
+            pooling (str, optional): A reduction of image pixels that are displayed by a single
+                canvas pixel, if the image is downsampled: "max", "mean" or "sum". Max pooling
+                keeps single bright pixels, e.g. Bragg peaks, visible. Projections are always
+                computed with mean pooling. Defaults to "mean".
         """
+        if pooling not in POOLING_MODES:
+            raise ValueError(f"Pooling mode should be one of {POOLING_MODES}")
+
         if x_start is None:
             x_start = 0
 
@@ -70,6 +83,13 @@ class ImageView:
             y_end = image_height
 
         self.zoom_views = []
+        self.pooling = pooling
+
+        # downsampled images are written into this buffer, which is reused while its shape is
+        # unchanged
+        self._pooled_image = np.zeros((0, 0), dtype=np.float32)
+        # mean pooled images for projections, if images are displayed with another pooling
+        self._proj_image = np.zeros((0, 0), dtype=np.float32)
 
         plot = Plot(
             x_range=Range1d(x_start, x_end, bounds=(0, image_width)),
@@ -215,44 +235,43 @@ class ImageView:
 
         self.zoom_views.append(image_view)
 
-    def update(self, image, pil_image=None):
+    @profile
+    def update(self, image):
         """Trigger an update for the image view plot.
 
         Args:
             image (ndarray): A source image for image view.
-            pil_image (Image, optional): A source image for image view converted to PIL Image.
-                Defaults to None.
         """
-        if pil_image is None:
-            # this makes an extra copy, see https://github.com/python-pillow/Pillow/issues/3336
-            pil_image = PIL_Image.fromarray(image.astype(np.float32, copy=False))
-
+        image_height, image_width = image.shape
         if (
-            self.plot.y_range.bounds[1] != pil_image.height
-            or self.plot.x_range.bounds[1] != pil_image.width
+            self.plot.y_range.bounds[1] != image_height
+            or self.plot.x_range.bounds[1] != image_width
         ):
             self.plot.x_range.start = 0
             self.plot.x_range.reset_start = 0
-            self.plot.x_range.end = pil_image.width
-            self.plot.x_range.reset_end = pil_image.width
-            self.plot.x_range.bounds = (0, pil_image.width)
+            self.plot.x_range.end = image_width
+            self.plot.x_range.reset_end = image_width
+            self.plot.x_range.bounds = (0, image_width)
 
             self.plot.y_range.start = 0
             self.plot.y_range.reset_start = 0
-            self.plot.y_range.end = pil_image.height
-            self.plot.y_range.reset_end = pil_image.height
-            self.plot.y_range.bounds = (0, pil_image.height)
+            self.plot.y_range.end = image_height
+            self.plot.y_range.reset_end = image_height
+            self.plot.y_range.bounds = (0, image_height)
 
         if (
             self.plot.inner_width < self.x_end - self.x_start
             or self.plot.inner_height < self.y_end - self.y_start
         ):
-            resized_image = np.asarray(
-                pil_image.resize(
-                    size=(self.plot.inner_width, self.plot.inner_height),
-                    box=(self.x_start, self.y_start, self.x_end, self.y_end),
-                    resample=PIL_Image.NEAREST,
-                )
+            shape = (self.plot.inner_height, self.plot.inner_width)
+            if self._pooled_image.shape != shape:
+                self._pooled_image = np.empty(shape, dtype=np.float32)
+
+            # the previous content of the buffer has already been sent to the client
+            resized_image = _pool(
+                image[self.y_start : self.y_end, self.x_start : self.x_end],
+                self._pooled_image,
+                self.pooling,
             )
 
         else:
@@ -283,6 +302,16 @@ class ImageView:
 
         # Draw projections
         if self.proj_toggle.active:
+            if resized_image is self._pooled_image and self.pooling != "mean":
+                if self._proj_image.shape != resized_image.shape:
+                    self._proj_image = np.empty(resized_image.shape, dtype=np.float32)
+
+                resized_image = _pool(
+                    image[self.y_start : self.y_end, self.x_start : self.x_end],
+                    self._proj_image,
+                    "mean",
+                )
+
             im_y_len, im_x_len = resized_image.shape
 
             h_x = np.linspace(self.x_start + 0.5, self.x_end - 0.5, im_x_len)
@@ -302,7 +331,63 @@ class ImageView:
 
         # Process all accociated zoom views
         for zoom_view in self.zoom_views:
-            zoom_view.update(image, pil_image)
+            zoom_view.update(image)
+
+
+def _pool(image, out, mode):
+    # reduce blocks of image pixels, each block corresponding to a single pixel of the output
+    _pool_njit(image, out, POOLING_MODES.index(mode))
+    return out
+
+
+@njit(parallel=True)
+def _pool_njit(image, out, mode):
+    sy, sx = image.shape
+    oy, ox = out.shape
+    for i in prange(oy):  # pylint: disable=not-an-iterable
+        y0 = i * sy // oy
+        y1 = max((i + 1) * sy // oy, y0 + 1)
+
+        # reduce image rows of a block elementwise first, and then reduce columns of the result,
+        # so that every image pixel is accessed in a simple contiguous loop
+        # nan values, e.g. masked pixels, are ignored, unless all values of a block are nan
+        acc = np.empty(sx, dtype=np.float64)
+        counts = np.zeros(sx, dtype=np.int64)
+        if mode == 0:
+            acc[:] = -np.inf
+            for y in range(y0, y1):
+                for x in range(sx):
+                    val = image[y, x]
+                    acc[x] = val if val > acc[x] else acc[x]
+        else:
+            acc[:] = 0
+            for y in range(y0, y1):
+                for x in range(sx):
+                    val = image[y, x]
+                    not_nan = val == val
+                    acc[x] += val if not_nan else 0
+                    counts[x] += not_nan
+
+        for j in range(ox):
+            x0 = j * sx // ox
+            x1 = max((j + 1) * sx // ox, x0 + 1)
+            if mode == 0:
+                res = -np.inf
+                for x in range(x0, x1):
+                    res = acc[x] if acc[x] > res else res
+                out[i, j] = np.nan if res == -np.inf else res
+            else:
+                res = 0.0
+                count = 0
+                for x in range(x0, x1):
+                    res += acc[x]
+                    count += counts[x]
+                if count == 0:
+                    out[i, j] = np.nan
+                elif mode == 1:
+                    out[i, j] = res / count
+                else:
+                    out[i, j] = res
 
 
 def _normalize(vec, start, end):
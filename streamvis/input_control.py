@@ -1,8 +1,14 @@
+import inspect
+from time import monotonic, perf_counter
+
 import numpy as np
 from bokeh.io import curdoc
 from bokeh.layouts import column
 from bokeh.models import CheckboxGroup, CustomJS, Div, RadioGroup, Select, Toggle
 
+from streamvis.conversion_pool import ConversionOptions, convert_buffered_frame, convert_frame
+from streamvis.profiler import profile
+
 js_backpressure_code = """
 if (cb_obj.tags[0]) return;
 cb_obj.tags = [true];
@@ -19,6 +25,8 @@ class StreamControl:
         self.receiver = doc.receiver
         self.stats = doc.stats
         self.jf_adapter = doc.jf_adapter
+        self.frame_cache = getattr(doc, "frame_cache", None)
+        self.conversion_pool = getattr(doc, "conversion_pool", None)
 
         # connect toggle button
         def toggle_callback(_active):
@@ -76,11 +84,78 @@ class StreamControl:
         """
         return self.receiver.state == "receiving"
 
-    def get_stream_data(self, index):
+    def add_update_callback(self, callback):
+        """Add a callback that updates an application with new stream data.
+
+        If the receiver pushes notifications about new frames, the callback is executed on arrival
+        of each frame, but not more often than the client update rate allows. It is also executed
+        once per second in case there are no new frames, e.g. to reflect changes of plot ranges.
+        Otherwise, the callback is executed periodically with the client update rate.
+
+        Args:
+            callback (function): A function or a coroutine function without arguments.
+        """
+        doc = curdoc()
+        period = 1 / doc.client_fps
+        profiler = getattr(doc, "profiler", None)
+
+        async def run_callback():
+            start = perf_counter()
+
+            result = callback()
+            if inspect.isawaitable(result):
+                await result
+
+            if profiler is not None:
+                profiler.record("update", perf_counter() - start)
+
+        if not self.receiver.push_updates:
+            doc.add_periodic_callback(run_callback, period * 1000)
+            return
+
+        last_update = 0
+        is_scheduled = False
+
+        async def update():
+            nonlocal last_update, is_scheduled
+            is_scheduled = False
+            last_update = monotonic()
+
+            await run_callback()
+
+        def schedule_update():
+            nonlocal is_scheduled
+            if is_scheduled:
+                return
+
+            is_scheduled = True
+            delay = max(last_update + period - monotonic(), 0)
+            doc.add_timeout_callback(update, delay * 1000)
+
+        def fallback_update():
+            if monotonic() - last_update >= 1:
+                schedule_update()
+
+        self.receiver.subscribe(schedule_update)
+        doc.on_session_destroyed(
+            lambda _session_context: self.receiver.unsubscribe(schedule_update)
+        )
+        doc.add_periodic_callback(fallback_update, 1000)
+
+    @profile
+    def get_stream_data(self, index, pulse_id=None):
         """Get data from the stream receiver.
 
+        Processed frames are shared with other sessions via the frame cache, so the returned image
+        is read-only. If the latest frame is requested and it has not been converted yet, the
+        latest result of the background conversion pool is returned instead. If the frame is
+        overwritten in the receiver buffer before or during its conversion, a dummy frame is
+        returned.
+
         Args:
             index (int): index into data buffer of receiver
+            pulse_id (int, optional): if provided, get data with the nearest pulse_id from the data
+                buffer of receiver instead of using the index. Defaults to None.
 
         Returns:
             (dict, ndarray): metadata and image at index
@@ -98,49 +173,64 @@ class StreamControl:
             double_pixels = "keep"
             self.double_pixels_rg.active = 0
 
+        is_latest = False
+        # images in the receiver buffer are overwritten once their slots are reused, so they are
+        # accessed via frame versions
+        version = None
+        buffer = self.receiver.buffer
         if self.show_only_events_toggle.active:
             # Show only events
             metadata, raw_image = self.stats.last_hit
+        elif pulse_id is not None:
+            # Show image with the nearest pulse_id
+            version = buffer.get_version_by_pulse_id(pulse_id, nearest=True)
         else:
             # Show image at index
-            metadata, raw_image = self.receiver.buffer[index]
-
-        if self.datatype_select.value == "Image":
-            image = self.jf_adapter.process(
-                raw_image,
-                metadata,
-                mask=mask,
-                gap_pixels=gap_pixels,
-                double_pixels=double_pixels,
-                geometry=geometry,
-            )
-
-            if (
-                self.jf_adapter.handler
-                and "saturated_pixels" not in metadata
-                and raw_image.dtype == np.uint16
-            ):
-                saturated_pixels_coord = self.jf_adapter.handler.get_saturated_pixels(
-                    raw_image, mask=mask, gap_pixels=gap_pixels, geometry=geometry
-                )
-
-                metadata["saturated_pixels_coord"] = saturated_pixels_coord
-                metadata["saturated_pixels"] = len(saturated_pixels_coord[0])
+            version = buffer.get_version(index)
+            is_latest = index == -1
+
+        if version is not None:
+            metadata, _ = buffer.read(version)
+
+        options = ConversionOptions(
+            datatype=self.datatype_select.value,
+            mask=mask,
+            gap_pixels=gap_pixels,
+            double_pixels=double_pixels,
+            geometry=geometry,
+            n_rot=int(self.rotate_image.value) // 90,
+        )
 
-        elif self.datatype_select.value == "Gains":
-            if raw_image.dtype != np.uint16:
+        if self.frame_cache is not None:
+            cached = self.frame_cache.get(metadata, options)
+            if cached is not None:
+                self.toggle.tags = [False]
+                return cached
+
+        if self.conversion_pool is not None and is_latest:
+            # pick up the latest frame that has been converted in the background
+            self.conversion_pool.request(options)
+            result = self.conversion_pool.get_result(options)
+            if result is not None:
+                self.toggle.tags = [False]
+                return result
+
+        if version is not None:
+            converted = convert_buffered_frame(self.jf_adapter, buffer, version, options)
+            if converted is None:
+                # the frame has been overwritten, so skip this update and try again with the next
                 return dict(shape=[1, 1]), np.zeros((1, 1), dtype="float32")
+            frame_metadata, metadata, image = converted
+        else:
+            # the last hit is a private copy that is replaced, but never modified, so the result
+            # can share its memory
+            frame_metadata = metadata
+            metadata, image = convert_frame(
+                self.jf_adapter, metadata, raw_image, options, copy=False
+            )
 
-            if self.jf_adapter.handler:
-                image = self.jf_adapter.handler.get_gains(
-                    raw_image, mask=mask, gap_pixels=gap_pixels, geometry=geometry
-                )
-
-        n_rot = int(self.rotate_image.value) // 90
-        if n_rot:
-            image = np.rot90(image, k=n_rot)
-
-        image = np.ascontiguousarray(image, dtype=np.float32)
+        if self.frame_cache is not None:
+            self.frame_cache.put(frame_metadata, options, metadata, image)
 
         self.toggle.tags = [False]
 
@@ -1,5 +1,7 @@
 from bokeh.models import CheckboxGroup, ColumnDataSource, Quad, Text
 
+from streamvis.profiler import profile
+
 
 class IntensityROI:
     def __init__(self, image_views, sv_metadata):
@@ -47,6 +49,7 @@ class IntensityROI:
                 left=[], right=[], bottom=[], top=[], text_x=[], text_y=[], text=[]
             )
 
+    @profile
     def update(self, metadata):
         """Trigger an update for the intensity ROI overlay.
 
@@ -3,6 +3,8 @@ from itertools import compress, repeat
 
 from bokeh.models import CheckboxGroup, ColumnDataSource, DataTable, StringFormatter, TableColumn
 
+from streamvis.profiler import profile
+
 # metadata entries that are always shown (if present)
 default_entries = ["frame", "pulse_id", "is_good_frame", "saturated_pixels", "time_poll"]
 
@@ -152,6 +154,7 @@ class MetadataHandler:
 
         return metadata_toshow
 
+    @profile
     def update(self, metadata):
         """Trigger an update for the metadata handler.
 
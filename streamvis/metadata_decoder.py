@@ -0,0 +1,73 @@
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# numeric list entries of metadata that are converted to numpy arrays right after decoding, so that
+# they are not converted again downstream; per-module lists (e.g. 'module_enabled',
+# 'pulse_id_diff') are kept as they are
+ARRAY_ENTRIES = [
+    "spot_x",
+    "spot_y",
+    "radint_I",
+    "saturated_pixels_coord",
+    "roi_intensities_normalised",
+]
+
+BACKENDS = ["auto", "json", "orjson"]
+
+
+class MetadataDecoder:
+    def __init__(self, backend="auto", array_entries=None):
+        """Initialize a decoder of json-encoded zmq message metadata.
+
+        Args:
+            backend (str, optional): A json parser, 'json' (standard library), 'orjson', or 'auto'
+                to use orjson if it is installed. Defaults to "auto".
+            array_entries (list, optional): Metadata entries to be converted to numpy arrays. If
+                None, ARRAY_ENTRIES are used. Defaults to None.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown metadata decoder backend '{backend}'")
+
+        if backend == "auto":
+            backend = "json" if orjson is None else "orjson"
+
+        if backend == "orjson":
+            if orjson is None:
+                raise RuntimeError("orjson package is required for 'orjson' metadata decoder")
+            self._loads = orjson.loads
+        else:
+            self._loads = json.loads
+
+        self.backend = backend
+        self.array_entries = ARRAY_ENTRIES if array_entries is None else array_entries
+
+    def __call__(self, data):
+        """Decode metadata.
+
+        Args:
+            data (bytes): A json-encoded metadata.
+
+        Returns:
+            dict: Decoded metadata.
+        """
+        metadata = self._loads(data)
+
+        for entry in self.array_entries:
+            value = metadata.get(entry)
+            if isinstance(value, list):
+                try:
+                    array = np.array(value)
+                except ValueError:
+                    continue
+
+                # keep ragged or non-numeric lists as they are
+                if array.dtype.kind in "biuf":
+                    metadata[entry] = array
+
+        return metadata
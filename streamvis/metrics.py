@@ -0,0 +1,261 @@
+import json
+import math
+import os
+import resource
+import sys
+from bisect import bisect_left
+from ipaddress import ip_address, ip_network
+from threading import Lock
+from time import monotonic
+
+import numpy as np
+from tornado.web import HTTPError, RequestHandler
+
+# histogram bin edges for durations in milliseconds
+TIME_BIN_EDGES = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+# histogram bin edges for a number of missed frames in a pulse_id gap
+GAP_BIN_EDGES = [2, 3, 5, 10, 20, 50, 100, 1000]
+
+# a number of last complete seconds to calculate rates
+RATE_WINDOW = 10
+
+# a number of the latest pulse_ids, within which frames can arrive out of order
+PULSE_ID_WINDOW = 100
+
+
+class Histogram:
+    def __init__(self, bin_edges):
+        """Initialize a histogram with fixed bins.
+
+        Values below the first edge and above the last edge are counted in the first and the last
+        bins, respectively.
+
+        Args:
+            bin_edges (list): Inner edges of histogram bins in increasing order.
+        """
+        self.bin_edges = np.array(bin_edges, dtype=np.float64)
+        self.counts = np.zeros(len(bin_edges) + 1, dtype=np.int64)
+        self.total = 0
+
+    def add(self, value):
+        """Add a value to the histogram.
+
+        Args:
+            value (float): A value to be counted.
+        """
+        self.counts[np.searchsorted(self.bin_edges, value, side="right")] += 1
+        self.total += value
+
+    def to_dict(self):
+        """Return histogram state as a json-serializable dict.
+        """
+        count = int(self.counts.sum())
+        return dict(
+            bin_edges=self.bin_edges.tolist(),
+            counts=self.counts.tolist(),
+            count=count,
+            mean=self.total / count if count else None,
+        )
+
+
+class ReceiverMetrics:
+    def __init__(self, pulse_id_window=PULSE_ID_WINDOW):
+        """Initialize counters of a receiver ingest.
+
+        Missed frames are detected via gaps in pulse_id sequence, where the pulse_id step is the
+        greatest common divisor of differences between received pulse_ids. This also covers
+        messages dropped by zmq due to the high-water mark, as zmq does not report such drops.
+
+        A gap is counted only once it leaves the window of the latest received pulse_ids, so that
+        frames arriving out of order within the window are not counted as missed. A frame that
+        arrives even later is subtracted from the missed frames.
+
+        Args:
+            pulse_id_window (int, optional): A number of the latest received pulse_ids, within
+                which frames are allowed to arrive out of order. Defaults to PULSE_ID_WINDOW.
+        """
+        self._lock = Lock()
+
+        self.messages = 0
+        self.bytes = 0
+        self.errors = 0
+        self.missed_frames = 0
+        self.out_of_order = 0
+
+        self.decode_time = Histogram(TIME_BIN_EDGES)
+        self.recv_time = Histogram(TIME_BIN_EDGES)
+        self.gaps = Histogram(GAP_BIN_EDGES)
+
+        self.pulse_id_window = pulse_id_window
+
+        # the first pulse_id, the latest pulse_id that left the window and pulse_ids in the window
+        self._first_pulse_id = None
+        self._settled_pulse_id = None
+        self._pulse_ids = []
+        self._pulse_id_step = None
+
+        # message and byte counts per second, for the last RATE_WINDOW seconds
+        self._rate_seconds = np.full(RATE_WINDOW + 1, -1, dtype=np.int64)
+        self._rate_messages = np.zeros(RATE_WINDOW + 1, dtype=np.int64)
+        self._rate_bytes = np.zeros(RATE_WINDOW + 1, dtype=np.int64)
+
+    def update(self, metadata, nbytes):
+        """Count a received message.
+
+        Args:
+            metadata (dict): Message metadata, with optional 'pulse_id', 'time_decode' and
+                'time_recv' entries.
+            nbytes (int): A number of received image bytes.
+        """
+        with self._lock:
+            self.messages += 1
+            self.bytes += nbytes
+
+            second = int(monotonic())
+            ind = second % len(self._rate_seconds)
+            if self._rate_seconds[ind] != second:
+                self._rate_seconds[ind] = second
+                self._rate_messages[ind] = 0
+                self._rate_bytes[ind] = 0
+            self._rate_messages[ind] += 1
+            self._rate_bytes[ind] += nbytes
+
+            time_decode = metadata.get("time_decode")
+            if time_decode is not None:
+                self.decode_time.add(time_decode.total_seconds() * 1000)
+
+            time_recv = metadata.get("time_recv")
+            if time_recv is not None:
+                self.recv_time.add(time_recv.total_seconds() * 1000)
+
+            pulse_id = metadata.get("pulse_id")
+            if pulse_id is not None:
+                self._update_pulse_id(pulse_id)
+
+    def add_error(self, count=1):
+        """Count messages that could not be received.
+
+        Args:
+            count (int, optional): A number of messages. Defaults to 1.
+        """
+        with self._lock:
+            self.errors += count
+
+    def to_dict(self):
+        """Return metrics as a json-serializable dict.
+        """
+        with self._lock:
+            # exclude the current incomplete second
+            second = int(monotonic())
+            age = second - self._rate_seconds
+            valid = (age >= 1) & (age <= RATE_WINDOW)
+
+            return dict(
+                messages=self.messages,
+                bytes=self.bytes,
+                errors=self.errors,
+                messages_per_second=int(self._rate_messages[valid].sum()) / RATE_WINDOW,
+                bytes_per_second=int(self._rate_bytes[valid].sum()) / RATE_WINDOW,
+                missed_frames=self.missed_frames,
+                out_of_order=self.out_of_order,
+                pulse_id_step=self._pulse_id_step,
+                decode_time_ms=self.decode_time.to_dict(),
+                recv_time_ms=self.recv_time.to_dict(),
+                gaps=self.gaps.to_dict(),
+            )
+
+    def _update_pulse_id(self, pulse_id):
+        pulse_ids = self._pulse_ids
+        if self._first_pulse_id is None:
+            self._first_pulse_id = pulse_id
+            pulse_ids.append(pulse_id)
+            return
+
+        diff = pulse_id - self._first_pulse_id
+        if diff:
+            if self._pulse_id_step is None:
+                self._pulse_id_step = abs(diff)
+            else:
+                self._pulse_id_step = math.gcd(self._pulse_id_step, diff)
+
+        if pulse_id <= pulse_ids[-1]:
+            self.out_of_order += 1
+
+        settled_pulse_id = self._settled_pulse_id
+        if settled_pulse_id is not None and pulse_id <= settled_pulse_id:
+            # the frame is late even for the window, so it has been counted as missed
+            if self._first_pulse_id < pulse_id < settled_pulse_id and self.missed_frames > 0:
+                self.missed_frames -= 1
+            return
+
+        ind = bisect_left(pulse_ids, pulse_id)
+        if ind < len(pulse_ids) and pulse_ids[ind] == pulse_id:
+            # a duplicate frame
+            return
+
+        pulse_ids.insert(ind, pulse_id)
+        if len(pulse_ids) > self.pulse_id_window:
+            oldest = pulse_ids.pop(0)
+            if settled_pulse_id is not None:
+                nframes = (oldest - settled_pulse_id) // self._pulse_id_step
+                if nframes > 1:
+                    self.missed_frames += nframes - 1
+                    self.gaps.add(nframes - 1)
+            self._settled_pulse_id = oldest
+
+
+def process_rss():
+    """Return the resident set size of the current process in bytes.
+
+    On systems without '/proc', the peak resident set size is returned instead.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is in kilobytes on linux, but in bytes on macos
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class MetricsHandler(RequestHandler):
+    """Serve metrics of all stream receivers as json.
+    """
+
+    def initialize(self, receivers, allow_client_subnet=None):  # pylint: disable=W0221
+        self.receivers = receivers
+        if allow_client_subnet is None:
+            self.allow_client_subnet = None
+        else:
+            self.allow_client_subnet = [ip_network(subnet) for subnet in allow_client_subnet]
+
+    def prepare(self):
+        if self.allow_client_subnet is not None:
+            remote_ip = ip_address(self.request.remote_ip)
+            if not any(remote_ip in subnet for subnet in self.allow_client_subnet):
+                # connection from a disallowed subnet, as for streamvis applications
+                raise HTTPError(403)
+
+    def get(self):
+        metrics = dict()
+        for name, receiver in self.receivers.items():
+            stream_metrics = receiver.metrics.to_dict()
+            stream_metrics["state"] = receiver.state
+            stream_metrics["buffer"] = dict(
+                frames=len(receiver.buffer),
+                size=receiver.buffer.size,
+                nbytes=receiver.buffer.nbytes,
+                memory=receiver.buffer.memory,
+            )
+            if receiver.reorder_buffer is not None:
+                stream_metrics["reorder"] = receiver.reorder_buffer.to_dict()
+            recorder = receiver.recorder
+            if recorder is not None:
+                stream_metrics["recorder"] = dict(
+                    recorded=recorder.recorded, dropped=recorder.dropped, filename=recorder.filename
+                )
+            metrics[name] = stream_metrics
+
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(metrics))
@@ -0,0 +1,195 @@
+import functools
+import logging
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+from bokeh.io import curdoc
+from bokeh.models import CheckboxGroup, ColumnDataSource, DataTable, NumberFormatter, TableColumn
+
+logger = logging.getLogger(__name__)
+
+# a number of last durations per stage to calculate percentiles
+PROFILER_BUFFER_SIZE = 1000
+
+PERCENTILES = [50, 90, 99]
+
+
+class Profiler:
+    def __init__(self, buffer_size=PROFILER_BUFFER_SIZE):
+        """Initialize a profiler that aggregates durations of document update stages.
+
+        Args:
+            buffer_size (int, optional): A number of last durations per stage to calculate
+                percentiles. Defaults to PROFILER_BUFFER_SIZE.
+        """
+        self.buffer_size = buffer_size
+        self._durations = dict()
+        self._counts = dict()
+        self._totals = dict()
+
+    @property
+    def stages(self):
+        """Names of recorded stages in the order of their first appearance (readonly).
+        """
+        return list(self._durations)
+
+    def record(self, stage, duration):
+        """Record a duration of a stage.
+
+        Args:
+            stage (str): A stage name.
+            duration (float): A duration in seconds.
+        """
+        durations = self._durations.get(stage)
+        if durations is None:
+            durations = self._durations[stage] = deque(maxlen=self.buffer_size)
+            self._counts[stage] = 0
+            self._totals[stage] = 0
+
+        durations.append(duration)
+        self._counts[stage] += 1
+        self._totals[stage] += duration
+
+    @contextmanager
+    def stage(self, name):
+        """Measure a duration of the enclosed code block as a stage.
+
+        Args:
+            name (str): A stage name.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - start)
+
+    def summary(self):
+        """Return statistics of stage durations in milliseconds.
+
+        Returns:
+            dict: A number of calls, mean, percentiles and max durations for each stage.
+        """
+        summary = dict()
+        for stage, durations in self._durations.items():
+            if not durations:
+                continue
+
+            values = np.array(durations) * 1000
+            stage_summary = dict(count=self._counts[stage], mean=values.mean())
+            for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                stage_summary[f"p{q}"] = value
+            stage_summary["max"] = values.max()
+
+            summary[stage] = stage_summary
+
+        return summary
+
+    def counters(self):
+        """Return cumulative counters of stages.
+
+        Rates and mean durations over any time interval can be calculated from differences of
+        counters at its ends.
+
+        Returns:
+            dict: A total number of calls and a total duration in seconds for each stage.
+        """
+        return {stage: (self._counts[stage], self._totals[stage]) for stage in self._counts}
+
+    def log_summary(self, prefix=""):
+        """Log statistics of stage durations.
+
+        Args:
+            prefix (str, optional): A prefix of log messages, e.g. a session id. Defaults to "".
+        """
+        for stage, stats in self.summary().items():
+            logger.info(
+                f"{prefix}{stage}: count={stats['count']} mean={stats['mean']:.2f} ms "
+                + " ".join(f"p{q}={stats[f'p{q}']:.2f}" for q in PERCENTILES)
+                + f" max={stats['max']:.2f} ms"
+            )
+
+    def clear(self):
+        """Drop all recorded durations.
+        """
+        self._durations.clear()
+        self._counts.clear()
+        self._totals.clear()
+
+
+def profile(func):
+    """Record durations of a component method call with the profiler of the current document.
+
+    The stage is named after the component class and the method, e.g. 'ImageView.update'. If the
+    current document has no profiler, the method is called without any measurements.
+    """
+    stage = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        profiler = getattr(curdoc(), "profiler", None)
+        if profiler is None:
+            return func(self, *args, **kwargs)
+
+        start = perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            profiler.record(stage, perf_counter() - start)
+
+    return wrapper
+
+
+class ProfilerPanel:
+    def __init__(self, datatable_height=300, datatable_width=700):
+        """Initialize a debug panel with durations of document update stages.
+
+        Args:
+            datatable_height (int, optional): Height of datatable in screen pixels. Defaults to 300.
+            datatable_width (int, optional): Width of plot area in screen pixels. Defaults to 700.
+        """
+        doc = curdoc()
+
+        columns = [TableColumn(field="stage", title="Stage", width=250)]
+        columns.append(TableColumn(field="count", title="Count"))
+        for name in ["mean", *(f"p{q}" for q in PERCENTILES), "max"]:
+            columns.append(
+                TableColumn(
+                    field=name, title=f"{name} (ms)", formatter=NumberFormatter(format="0.00")
+                )
+            )
+
+        datatable_source = ColumnDataSource(
+            dict(stage=[], count=[], mean=[], **{f"p{q}": [] for q in PERCENTILES}, max=[])
+        )
+        self.datatable = DataTable(
+            source=datatable_source,
+            columns=columns,
+            width=datatable_width,
+            height=datatable_height,
+            index_position=None,
+            selectable=False,
+        )
+        self._datatable_source = datatable_source
+
+        # show profiling data toggle
+        self.toggle = CheckboxGroup(labels=["Show Profiling"], default_size=145)
+
+        self._profiler = getattr(doc, "profiler", None)
+        doc.add_periodic_callback(self._update, 1000)
+
+    def _update(self):
+        profiler = self._profiler
+        if not self.toggle.active or profiler is None:
+            if self._datatable_source.data["stage"]:
+                self._datatable_source.data.update({key: [] for key in self._datatable_source.data})
+            return
+
+        summary = profiler.summary()
+        data = dict(stage=list(summary))
+        for key in self._datatable_source.data:
+            if key != "stage":
+                data[key] = [stats[key] for stats in summary.values()]
+
+        self._datatable_source.data.update(data)
@@ -1,5 +1,7 @@
 from bokeh.models import Plot, Range1d, ColumnDataSource, Quad, Text
 
+from streamvis.profiler import profile
+
 
 # TODO: this could be replaced with a bokeh ProgressBar widget
 # https://github.com/bokeh/bokeh/issues/6556
@@ -42,6 +44,7 @@ class ProgressBar:
 
         self.widget = plot
 
+    @profile
     def update(self, value, total):
         """Trigger an update for the progress bar.
 
@@ -2,6 +2,8 @@ import bottleneck as bn
 import numpy as np
 from bokeh.models import BasicTicker, ColumnDataSource, DataRange1d, Grid, Line, LinearAxis, Plot
 
+from streamvis.profiler import profile
+
 DEFAULT_PLOT_SIZE = 200
 
 
@@ -84,6 +86,7 @@ class Projection:
         """
         return self._line_source.data["y"]
 
+    @profile
     def update(self, image):
         """Trigger an update for the projection plot.
 
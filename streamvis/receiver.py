@@ -1,17 +1,82 @@
+import asyncio
 import logging
-from collections import deque
+import multiprocessing
+import os
+import signal
+import sys
+from collections import OrderedDict, deque
+from concurrent import futures
 from datetime import datetime
+from threading import Event, Lock
+from time import monotonic
 
 import numpy as np
 import zmq
+import zmq.asyncio
 from jungfrau_utils import JFDataHandler
-from numba import njit
+from numba import njit, prange
+
+from streamvis.metadata_decoder import MetadataDecoder
+from streamvis.metrics import ReceiverMetrics
+from streamvis.reorder_buffer import ReorderBuffer
+from streamvis.ring_buffer import RingBuffer
+from streamvis.statistics_handler import StatisticsHandler
+
+try:
+    import bitshuffle
+except ImportError:
+    bitshuffle = None
 
 logger = logging.getLogger(__name__)
 
+SUPPORTED_COMPRESSION = ["bitshuffle_lz4"]
+
+# poll timeout in milliseconds, while there are images being decompressed
+DECOMPRESSION_POLL_TIMEOUT = 5
+
+# check modification times of gain and pedestal files at most once per this number of seconds
+MTIME_CHECK_PERIOD = 1
+
+# a changed file is loaded only once its modification time and size have not changed for this
+# number of seconds, so that files are not loaded while they are being written
+MTIME_STABLE_PERIOD = 2
+
+# a default maximal number of jungfrau data handler configurations kept in memory
+HANDLER_POOL_SIZE = 8
+
+# a maximal number of geometry lookup tables with folded pixel masks and rotations kept in memory
+LUT_CACHE_SIZE = 16
+
+# special values of geometry lookup tables for pixels without a source pixel
+GAP_PIXEL = -1
+MASKED_PIXEL = -2
+
+# raw values of saturated pixels in normal and highgain modes
+SATURATED_VALUE = 0xC000
+SATURATED_VALUE_HIGHGAIN = 0x3FFF
+
+# additional ring buffer slots for a receiver running in a separate process, so that frames are
+# rarely overwritten while their metadata is still in transit to the main process, such frames are
+# detected by their slot generations and dropped
+PROCESS_SPARE_SLOTS = 4
+
+# send statistics from a receiver process to the main process at most once per this number of
+# seconds
+STATS_SYNC_PERIOD = 0.5
+
 
 class Receiver:
-    def __init__(self, on_receive=None, buffer_size=1):
+    def __init__(
+        self,
+        on_receive=None,
+        buffer_size=1,
+        buffer_memory=None,
+        decompression_threads=2,
+        reorder_window=None,
+        reorder_window_ms=None,
+        metadata_decoder=None,
+        recorder=None,
+    ):
         """Initialize a jungfrau receiver.
 
         Args:
@@ -19,10 +84,71 @@ class Receiver:
                 as input arguments. Defaults to None.
             buffer_size (int, optional): A number of last received zmq messages to keep in memory.
                 Defaults to 1.
+            buffer_memory (int, optional): A memory budget in bytes for received images. If
+                provided, the number of kept zmq messages is derived from the budget and the image
+                size instead of using buffer_size. Defaults to None.
+            decompression_threads (int, optional): A number of threads to decompress images, which
+                are marked as compressed by a 'compression' metadata entry. Defaults to 2.
+            reorder_window (int, optional): Pass received frames to on_receive in pulse_id order
+                within a window of this number of pulses. Defaults to None.
+            reorder_window_ms (float, optional): Pass received frames to on_receive in pulse_id
+                order within a window of this number of milliseconds. Defaults to None.
+            metadata_decoder (function, optional): Decode json-encoded metadata of zmq messages
+                into a dict. If None, MetadataDecoder with default settings is used.
+                Defaults to None.
+            recorder (Recorder, optional): Record received frames selected by the recorder
+                trigger. Defaults to None.
         """
-        self.buffer = deque(maxlen=buffer_size)
+        # one more image than the number of threads can be waiting for decompression, so that the
+        # threads do not idle while the next image is being received
+        self._max_decompressing = decompression_threads + 1
+        self._decompressing = deque()
+        self._executor = futures.ThreadPoolExecutor(max_workers=decompression_threads)
+
+        self.buffer = RingBuffer(
+            size=buffer_size, spare=self._max_decompressing, memory=buffer_memory
+        )
         self.state = "polling"
         self.on_receive = on_receive
+        self.metrics = ReceiverMetrics()
+        self.recorder = recorder
+
+        if metadata_decoder is None:
+            metadata_decoder = MetadataDecoder()
+        self.decode_metadata = metadata_decoder
+
+        if reorder_window is None and reorder_window_ms is None:
+            self.reorder_buffer = None
+        else:
+            # frames are released before they leave the ring buffer, so that their images are
+            # still valid when passed to on_receive
+            self.reorder_buffer = ReorderBuffer(
+                window_pulses=reorder_window, window_ms=reorder_window_ms, max_frames=buffer_size
+            )
+
+        # subscribers are notified about new frames only by a receiver running on the server's
+        # event loop, otherwise documents should poll the receiver state
+        self.push_updates = False
+        self._subscribers = []
+
+        self._stopped = Event()
+        self._process = None
+
+    def subscribe(self, callback):
+        """Subscribe to notifications about received frames.
+
+        Args:
+            callback (function): Execute function without arguments on each received frame.
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Unsubscribe from notifications about received frames.
+
+        Args:
+            callback (function): A previously subscribed function.
+        """
+        self._subscribers.remove(callback)
 
     def start(self, io_threads, connection_mode, address):
         """Start the receiver loop.
@@ -36,188 +162,1095 @@ class Receiver:
             RuntimeError: Unknown connection mode.
         """
         zmq_context = zmq.Context(io_threads=io_threads)
-        zmq_socket = zmq_context.socket(zmq.SUB)  # pylint: disable=E1101
-        zmq_socket.setsockopt_string(zmq.SUBSCRIBE, "")  # pylint: disable=E1101
-
-        if connection_mode == "connect":
-            zmq_socket.connect(address)
-        elif connection_mode == "bind":
-            zmq_socket.bind(address)
-        else:
-            raise RuntimeError("Unknown connection mode {connection_mode}")
+        zmq_socket = _create_socket(zmq_context, connection_mode, address)
 
         poller = zmq.Poller()
         poller.register(zmq_socket, zmq.POLLIN)
 
-        while True:
-            events = dict(poller.poll(1000))
-            if zmq_socket not in events:
-                self.state = "polling"
+        try:
+            while not self._stopped.is_set():
+                self._commit_decompressed()
+
+                events = dict(poller.poll(self._get_poll_timeout()))
+                if zmq_socket not in events:
+                    self._on_idle()
+                    continue
+
+                time_poll = datetime.now()
+                metadata = self.decode_metadata(zmq_socket.recv(flags=0))
+                metadata["time_decode"] = datetime.now() - time_poll
+
+                futures.wait(self._get_futures_to_wait(metadata))
+                self._commit_decompressed()
+
+                image = self._reserve(metadata)
+                if image is None:
+                    zmq_socket.recv(flags=0, copy=False, track=False)
+                    self.metrics.add_error()
+                    continue
+
+                if metadata.get("compression") is None:
+                    nbytes = zmq_socket.recv_into(image, flags=0)
+                    self._commit(metadata, image, nbytes, time_poll)
+                else:
+                    data = zmq_socket.recv(flags=0, copy=False, track=False)
+                    self._decompress(metadata, image, data, time_poll)
+        finally:
+            zmq_context.destroy(linger=0)
+
+    async def start_async(self, io_threads, connection_mode, address):
+        """Start the receiver loop as a coroutine on the current event loop.
+
+        In this mode, subscribers are notified about each received frame.
+
+        Args:
+            io_threads (int): The size of the zmq thread pool to handle I/O operations.
+            connection_mode (str): Use either 'connect' or 'bind' zmq_socket methods.
+            address (str): The address string, e.g. 'tcp://127.0.0.1:9001'.
+
+        Raises:
+            RuntimeError: Unknown connection mode.
+        """
+        self.push_updates = True
+
+        zmq_context = zmq.asyncio.Context(io_threads=io_threads)
+        zmq_socket = _create_socket(zmq_context, connection_mode, address)
+
+        try:
+            while not self._stopped.is_set():
+                self._commit_decompressed()
+
+                if not await zmq_socket.poll(self._get_poll_timeout()):
+                    self._on_idle()
+                    continue
+
+                time_poll = datetime.now()
+                metadata = self.decode_metadata(await zmq_socket.recv(flags=0))
+                metadata["time_decode"] = datetime.now() - time_poll
+
+                futures_to_wait = self._get_futures_to_wait(metadata)
+                if futures_to_wait:
+                    await asyncio.wait([asyncio.wrap_future(future) for future in futures_to_wait])
+                self._commit_decompressed()
+
+                image = self._reserve(metadata)
+                if image is None:
+                    await zmq_socket.recv(flags=0, copy=False, track=False)
+                    self.metrics.add_error()
+                    continue
+
+                if metadata.get("compression") is None:
+                    nbytes = await zmq_socket.recv_into(image, flags=0)
+                    self._commit(metadata, image, nbytes, time_poll)
+                else:
+                    data = await zmq_socket.recv(flags=0, copy=False, track=False)
+                    self._decompress(metadata, image, data, time_poll)
+        finally:
+            zmq_context.destroy(linger=0)
+
+    def start_process(self, io_threads, connection_mode, address, stats=None):
+        """Start the receiver loop in a separate process.
+
+        The child process receives zmq messages into a shared memory ring buffer and sends
+        metadata of each frame through a pipe. Here, the receiver buffer gets attached to the
+        shared memory block and `on_receive` is executed with each received metadata and image,
+        so that images are not copied between processes. Frames that have been overwritten by the
+        child process before their metadata arrives are dropped.
+
+        If a statistics handler is provided, statistics are extracted from metadata in the child
+        process and periodically passed to the handler, so that `on_receive` should only keep hits
+        with `StatisticsHandler.parse_hit`.
+
+        Args:
+            io_threads (int): The size of the zmq thread pool to handle I/O operations.
+            connection_mode (str): Use either 'connect' or 'bind' zmq_socket methods.
+            address (str): The address string, e.g. 'tcp://127.0.0.1:9001'.
+            stats (StatisticsHandler, optional): A statistics handler to be updated by the child
+                process. Defaults to None.
+        """
+        spare = self._max_decompressing + PROCESS_SPARE_SLOTS
+        self.buffer = RingBuffer(size=self.buffer.size, spare=spare, memory=self.buffer.memory)
+
+        if stats is None:
+            stats_args = None
+        else:
+            stats_args = (stats.hit_threshold, stats.peakfinder_buffer.maxlen)
+
+        if self.reorder_buffer is None:
+            reorder_args = None
+        else:
+            reorder_args = (self.reorder_buffer.window_pulses, self.reorder_buffer.window_ms)
+
+        ctx = multiprocessing.get_context("spawn")
+        conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(
+            target=_receiver_process,
+            args=(
+                child_conn,
+                self.buffer.size,
+                self.buffer.memory,
+                self._max_decompressing - 1,
+                self.decode_metadata,
+                stats_args,
+                reorder_args,
+                io_threads,
+                connection_mode,
+                address,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+
+        try:
+            self._receive_from_process(conn, stats)
+        finally:
+            conn.close()
+            self._process.terminate()
+            self._process.join()
+            # remove the shared memory block, if the child process could not do that itself
+            self.buffer.close(unlink=True)
+
+    def stop(self):
+        """Stop the receiver loop.
+
+        A receiver process is terminated, so that it removes its shared memory blocks.
+        """
+        self._stopped.set()
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+
+    def _receive_from_process(self, conn, stats):
+        shm_name = None
+        child_errors = 0
+        while not self._stopped.is_set():
+            if not conn.poll(self._get_poll_timeout() / 1000):
+                self._on_idle()
                 continue
 
-            time_poll = datetime.now()
-            metadata = zmq_socket.recv_json(flags=0)
-            image = zmq_socket.recv(flags=0, copy=False, track=False)
-            metadata["time_poll"] = time_poll
-            metadata["time_recv"] = datetime.now() - time_poll
+            try:
+                message = conn.recv()
+            except EOFError:
+                if not self._stopped.is_set():
+                    logger.error("Receiver process has exited")
+                return
 
-            dtype = metadata.get("type")
-            shape = metadata.get("shape")
-            if dtype is None or shape is None:
-                logger.error("Cannot find 'type' and/or 'shape' in received metadata")
+            if message[0] == "stats":
+                _, reset_count, state, errors = message
+                self.metrics.add_error(errors - child_errors)
+                child_errors = errors
+
+                if stats is not None:
+                    if reset_count == stats.reset_count:
+                        stats.set_state(state)
+                    else:
+                        # statistics have been reset here, but not yet in the child process
+                        conn.send(("reset", stats.reset_count))
                 continue
 
-            image = np.frombuffer(image.buffer, dtype=dtype).reshape(shape)
+            _, name, slot, generation, metadata, image = message
+            if image is None:
+                if name != shm_name:
+                    try:
+                        self.buffer.attach(name, metadata["type"], metadata["shape"])
+                    except FileNotFoundError:
+                        # the shared memory block has already been replaced by the child process
+                        self.metrics.add_error()
+                        continue
+                    shm_name = name
+
+                if not self.buffer.commit_slot(slot, metadata, generation):
+                    # the slot has been reused by the child process in the meantime
+                    self.metrics.add_error()
+                    continue
+                _, image = self.buffer[-1]
 
-            # add to buffer only if the recieved image is not dummy
-            if image.shape != (2, 2):
-                self.buffer.append((metadata, image))
+                if self.recorder is not None:
+                    self.recorder.update(self.buffer)
 
+            self.metrics.update(metadata, image.nbytes)
             self.state = "receiving"
+            self._release(metadata, image)
 
-            if self.on_receive is not None:
+    def _reserve(self, metadata):
+        dtype = metadata.get("type")
+        shape = metadata.get("shape")
+        if dtype is None or shape is None:
+            logger.error("Cannot find 'type' and/or 'shape' in received metadata")
+            return None
+
+        compression = metadata.get("compression")
+        if compression is not None and compression not in SUPPORTED_COMPRESSION:
+            logger.error(f"Unsupported image compression '{compression}'")
+            return None
+
+        if tuple(shape) == (2, 2):
+            # do not add a dummy image to the buffer
+            return np.empty(shape, dtype=dtype)
+
+        # receive image directly into the next ring buffer slot
+        return self.buffer.reserve(dtype, shape)
+
+    def _decompress(self, metadata, image, data, time_poll):
+        future = self._executor.submit(_decompress_bitshuffle_lz4, data.buffer, image)
+        self._decompressing.append((future, metadata, image, time_poll))
+
+    def _commit_decompressed(self):
+        # commit images in the order they were received
+        while self._decompressing and self._decompressing[0][0].done():
+            future, metadata, image, time_poll = self._decompressing.popleft()
+            try:
+                nbytes = future.result()
+            except Exception:
+                logger.exception("Error decompressing image")
+                if image.shape != (2, 2):
+                    self.buffer.discard()
+                self.metrics.add_error()
+                continue
+
+            self._commit(metadata, image, nbytes, time_poll)
+
+    def _get_futures_to_wait(self, metadata):
+        if not self._decompressing:
+            return []
+
+        # wait for all images being decompressed if the next image is not compressed or has
+        # a different layout, thus keeping the image order and the buffer layout
+        _, _, image, _ = self._decompressing[-1]
+        if (
+            metadata.get("compression") is None
+            or metadata.get("type") != str(image.dtype)
+            or metadata.get("shape") != list(image.shape)
+        ):
+            return [future for future, *_ in self._decompressing]
+
+        # wait for the oldest image if there are no spare buffer slots left
+        if len(self._decompressing) >= self._max_decompressing:
+            return [self._decompressing[0][0]]
+
+        return []
+
+    def _commit(self, metadata, image, nbytes, time_poll):
+        is_dummy = image.shape == (2, 2)
+
+        if nbytes != image.nbytes:
+            logger.error(
+                f"Received image size {nbytes} does not match the expected size {image.nbytes} "
+                f"for type '{image.dtype}' and shape {image.shape}"
+            )
+            if not is_dummy:
+                self.buffer.discard()
+            self.metrics.add_error()
+            return
+
+        metadata["time_poll"] = time_poll
+        metadata["time_recv"] = datetime.now() - time_poll
+
+        if not is_dummy:
+            self.buffer.commit(metadata)
+
+            if self.recorder is not None:
+                self.recorder.update(self.buffer)
+
+        self.metrics.update(metadata, nbytes)
+
+        self.state = "receiving"
+        self._release(metadata, image)
+
+        for callback in self._subscribers:
+            callback()
+
+    def _release(self, metadata, image):
+        if self.reorder_buffer is None:
+            frames = [(metadata, image)]
+        else:
+            # the number of kept frames changes with the image size for a buffer with memory budget
+            self.reorder_buffer.max_frames = self.buffer.size
+            frames = self.reorder_buffer.push(metadata.get("pulse_id"), (metadata, image))
+
+        if self.on_receive is not None:
+            for metadata, image in frames:
                 self.on_receive(metadata, image)
 
+    def _get_poll_timeout(self):
+        if self._decompressing:
+            return DECOMPRESSION_POLL_TIMEOUT
+
+        if self.reorder_buffer is not None and len(self.reorder_buffer):
+            if self.reorder_buffer.window_ms is not None:
+                return min(self.reorder_buffer.window_ms, 1000)
+
+        return 1000
+
+    def _on_idle(self):
+        if self._decompressing:
+            return
+
+        self.state = "polling"
+
+        if self.reorder_buffer is not None:
+            # the stream has paused, so there is no point to wait for frames to reorder
+            frames = self.reorder_buffer.flush()
+            if self.on_receive is not None:
+                for metadata, image in frames:
+                    self.on_receive(metadata, image)
+
+
+def _create_socket(zmq_context, connection_mode, address):
+    zmq_socket = zmq_context.socket(zmq.SUB)  # pylint: disable=E1101
+    zmq_socket.setsockopt_string(zmq.SUBSCRIBE, "")  # pylint: disable=E1101
+
+    if connection_mode == "connect":
+        zmq_socket.connect(address)
+    elif connection_mode == "bind":
+        zmq_socket.bind(address)
+    else:
+        raise RuntimeError("Unknown connection mode {connection_mode}")
+
+    return zmq_socket
+
+
+def _receiver_process(
+    conn,
+    buffer_size,
+    buffer_memory,
+    decompression_threads,
+    metadata_decoder,
+    stats_args,
+    reorder_args,
+    io_threads,
+    connection_mode,
+    address,
+):
+    # the main process terminates the receiver process with SIGTERM, so exit via an exception to
+    # remove the shared memory blocks
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+
+    receiver = _ProcessReceiver(
+        conn,
+        stats_args,
+        reorder_args,
+        buffer_size=buffer_size,
+        decompression_threads=decompression_threads,
+        metadata_decoder=metadata_decoder,
+    )
+    spare = receiver._max_decompressing + PROCESS_SPARE_SLOTS
+    receiver.buffer = RingBuffer(size=buffer_size, spare=spare, shared=True, memory=buffer_memory)
+
+    try:
+        receiver.start(io_threads, connection_mode, address)
+    except (BrokenPipeError, ConnectionResetError):
+        # the main process has exited
+        pass
+    finally:
+        receiver.buffer.close()
+
+
+class _ProcessReceiver(Receiver):
+    def __init__(self, conn, stats_args, reorder_args, **kwargs):
+        """Initialize a receiver that passes frames and statistics to the main process.
+
+        Frames are passed to the main process in the order they are received, where they can be
+        reordered, but statistics are extracted here, so metadata is reordered for them here.
+
+        Args:
+            conn (Connection): A pipe connection to the main process.
+            stats_args (tuple): Arguments of a StatisticsHandler to extract statistics from
+                metadata, or None to skip statistics.
+            reorder_args (tuple): A reordering window in pulses and in milliseconds for
+                statistics, or None to extract statistics in the received order.
+        """
+        super().__init__(**kwargs)
+        self.on_receive = self._send_frame
+
+        self._conn = conn
+        self._parent = multiprocessing.parent_process()
+        self._stats = None if stats_args is None else StatisticsHandler(*stats_args)
+        self._stats_time = monotonic()
+        if self._stats is None or reorder_args is None:
+            self._stats_reorder_buffer = None
+        else:
+            self._stats_reorder_buffer = ReorderBuffer(*reorder_args)
+
+    def _send_frame(self, metadata, image):
+        if self._stats is not None:
+            if self._stats_reorder_buffer is None:
+                self._stats.parse_metadata(metadata)
+            else:
+                # the same bound as for frames released by the main process
+                self._stats_reorder_buffer.max_frames = self.buffer.size
+                for released in self._stats_reorder_buffer.push(metadata.get("pulse_id"), metadata):
+                    self._stats.parse_metadata(released)
+
+        if image.shape == (2, 2):
+            # dummy images are not buffered, so send them as they are
+            self._conn.send(("frame", None, None, None, metadata, image))
+        else:
+            # the slot generation allows the main process to detect that the slot has been reused
+            _, slot, generation = self.buffer.get_version(-1)
+            self._conn.send(("frame", self.buffer.shm_name, slot, generation, metadata, None))
+
+        if monotonic() - self._stats_time >= STATS_SYNC_PERIOD:
+            self._send_stats()
+
+    def _get_poll_timeout(self):
+        timeout = super()._get_poll_timeout()
+
+        reorder_buffer = self._stats_reorder_buffer
+        if reorder_buffer is not None and len(reorder_buffer):
+            if reorder_buffer.window_ms is not None:
+                timeout = min(timeout, reorder_buffer.window_ms)
+
+        return timeout
+
+    def _on_idle(self):
+        super()._on_idle()
+
+        if self._stats_reorder_buffer is not None and not self._decompressing:
+            # the stream has paused, so there is no point to wait for metadata to reorder
+            for metadata in self._stats_reorder_buffer.flush():
+                self._stats.parse_metadata(metadata)
+
+        if self._parent is not None and not self._parent.is_alive():
+            # the main process has exited without terminating this process
+            self._stopped.set()
+            return
+
+        if monotonic() - self._stats_time >= STATS_SYNC_PERIOD:
+            self._send_stats()
+
+    def _send_stats(self):
+        while self._conn.poll():
+            _, reset_count = self._conn.recv()
+            if self._stats is not None and reset_count != self._stats.reset_count:
+                self._stats.reset()
+                self._stats.reset_count = reset_count
+
+        if self._stats is None:
+            reset_count = 0
+            state = None
+        else:
+            reset_count = self._stats.reset_count
+            state = self._stats.get_state()
+
+        self._conn.send(("stats", reset_count, state, self.metrics.errors))
+        self._stats_time = monotonic()
+
+
+def _decompress_bitshuffle_lz4(data, image):
+    if bitshuffle is None:
+        raise RuntimeError("bitshuffle package is required to decompress images")
+
+    data = np.frombuffer(data, dtype=np.uint8)
+
+    # the header contains the uncompressed size (uint64) and the block size in bytes (uint32),
+    # both in big-endian byte order
+    nbytes = int.from_bytes(data[:8].tobytes(), "big")
+    block_size = int.from_bytes(data[8:12].tobytes(), "big") // image.itemsize
+
+    if nbytes == image.nbytes:
+        image[:] = bitshuffle.decompress_lz4(data[12:], image.shape, image.dtype, block_size)
+
+    return nbytes
+
 
 class StreamAdapter:
-    def __init__(self):
-        # a placeholder for jf data handler to be initiated with detector name
-        self.handler = None
-
-        # Buffer image mask data
-        self._inv_mask = None
-        self._pedestal_file = ""
-        self._mask_gap_pixels = None
-        self._mask_double_pixels = None
-        self._mask_geometry = None
-        self._module_map = None
+    def __init__(self, pool_size=HANDLER_POOL_SIZE):
+        """Initialize a jungfrau stream adapter, which can be shared between threads.
+
+        Jungfrau data handlers are pooled by their configuration, i.e. detector name, gain and
+        pedestal files, module map and highgain flag of received frames, together with pixel masks
+        for each combination of gap pixels, double pixels and geometry options. Each configuration
+        is set up only once and stays unchanged afterwards, so that frames with different
+        configurations can be processed concurrently. The least recently used configurations are
+        dropped once there are more than pool_size of them.
+
+        Gain and pedestal files are identified by their paths and modification times, and are
+        loaded by a background thread. A changed file is picked up only once it has stayed
+        unchanged for MTIME_STABLE_PERIOD. Until a new calibration is loaded, frames are processed
+        with the last loaded calibration of the same detector, module map and highgain flag.
+
+        Geometry lookup tables do not depend on a calibration, so they are shared by all
+        configurations of the same detector and module map. Their variants with folded pixel masks
+        and rotations are kept for the LUT_CACHE_SIZE most recently used combinations.
+
+        Args:
+            pool_size (int, optional): A maximal number of handler configurations kept in memory.
+                Defaults to HANDLER_POOL_SIZE.
+        """
+        self.pool_size = pool_size
+        self._handlers = OrderedDict()
+        self._lock = Lock()
+
+        # the last successfully loaded handler states, with (detector_name, module_map, highgain) as
+        # keys
+        self._current = dict()
+        # check times, last seen modification times and sizes, times of their last change and
+        # settled modification times of files, with file paths as keys
+        self._mtimes = dict()
+        self._loader = futures.ThreadPoolExecutor(max_workers=1)
+
+        # geometry lookup tables with their gap fill values and whether converted pixels stay at
+        # their received positions, None if they are not applicable, and their variants with folded
+        # pixel masks and rotations
+        self._luts = OrderedDict()
+        self._lut_variants = OrderedDict()
+
+    def get_handler(self, metadata):
+        """Return a jungfrau data handler configured for a received frame.
+
+        Args:
+            metadata (dict): A received frame metadata.
+
+        Returns:
+            JFDataHandler: A data handler, or None if the frame is not from a known detector.
+        """
+        state = self._get_state(metadata)
+        return None if state is None else state.handler
 
     def process(
-        self, image, metadata, mask=True, gap_pixels=True, double_pixels="keep", geometry=True
+        self,
+        image,
+        metadata,
+        mask=True,
+        gap_pixels=True,
+        double_pixels="keep",
+        geometry=True,
+        n_rot=0,
+        saturated_pixels=False,
+        copy=True,
     ):
         """Perform jungfrau detector data processing on an image received via stream.
 
+        Masking, casting to float32 and rotation of the processed image are done in a single
+        parallel pass. Saturated pixels are detected within the same pass, if possible.
+
         Args:
             image (ndarray): An image to be processed.
             metadata (dict): A corresponding image metadata.
+            n_rot (int, optional): A number of times the image is rotated by 90 degrees
+                counterclockwise, as in np.rot90. Defaults to 0.
+            saturated_pixels (bool, optional): Also return coordinates of saturated pixels in the
+                resulting image. Defaults to False.
+            copy (bool, optional): If False, return a read-only view of the input image when
+                processing does not change any pixel, e.g. for float32 images without a mask and
+                rotation. The input image should then stay unchanged for as long as the result is
+                in use. Defaults to True.
 
         Returns:
-            ndarray: Resulting image.
+            ndarray: Resulting C-contiguous float32 image. If saturated pixels are requested, a
+                tuple of the image and y, x coordinate arrays of saturated pixels, which are None
+                if there are no data to detect them.
         """
-        # as a first step, try to set the detector_name, skip if detector_name is empty
-        detector_name = metadata.get("detector_name")
-        if detector_name:
-            # check if jungfrau data handler is already set for this detector
-            if self.handler is None or self.handler.detector_name != detector_name:
-                try:
-                    self.handler = JFDataHandler(detector_name)
-                except KeyError:
-                    logging.exception(f"Error creating data handler for detector {detector_name}")
-                    self.handler = None
-        else:
-            self.handler = None
+        state = self._get_state(metadata)
 
         # return a copy of input image if jf data handler creation failed for that detector_name
-        if self.handler is None:
-            return np.copy(image)
+        if state is None or state.handler is None:
+            proc_image = _mask_cast_rotate(image, None, n_rot, copy=copy)
+            return (proc_image, None) if saturated_pixels else proc_image
 
         # still try to apply mask if data type differs from 'uint16' (probably, it is already been
         # processed)
         if image.dtype != np.uint16:
-            image = image.astype(np.float32, copy=True)
-            if mask:
-                image = self._apply_mask(image, gap_pixels, double_pixels, geometry)
-            return image
+            inv_mask = self._get_mask(state, gap_pixels, double_pixels, geometry) if mask else None
+            proc_image = _mask_cast_rotate(image, inv_mask, n_rot, copy=copy)
+            return (proc_image, None) if saturated_pixels else proc_image
 
-        # parse metadata
-        self._update_handler(metadata)
+        handler = state.handler
+        saturated_value = SATURATED_VALUE_HIGHGAIN if handler.highgain else SATURATED_VALUE
 
         # skip conversion step if jungfrau data handler cannot do it, thus avoiding Exception raise
-        conversion = self.handler.can_convert()
-        proc_image = self.handler.process(
-            image,
-            conversion=conversion,
-            mask=False,
-            gap_pixels=gap_pixels,
-            double_pixels=double_pixels,
-            geometry=geometry,
+        conversion = handler.can_convert()
+
+        lut = self._get_lut(
+            state, image, conversion, gap_pixels, double_pixels, geometry, mask, n_rot
         )
+        if lut is not None:
+            # convert pixels in the received layout, then assemble, mask and rotate them in a
+            # single gather pass
+            conv_image = handler.process(
+                image,
+                conversion=conversion,
+                mask=False,
+                gap_pixels=False,
+                double_pixels="keep",
+                geometry=False,
+            )
+            lut, fill_value, conv_is_raw = lut
+            if not saturated_pixels:
+                return _gather(conv_image, lut, fill_value)
 
-        if mask:
-            proc_image = self._apply_mask(proc_image, gap_pixels, double_pixels, geometry)
+            if conv_is_raw:
+                # received pixels are at the same positions in the converted image, so saturated
+                # ones can be picked up while gathering
+                return _gather(conv_image, lut, fill_value, image, saturated_value)
 
-        return proc_image
+            proc_image = _gather(conv_image, lut, fill_value)
 
-    def _update_handler(self, md_dict):
-        # gain file
-        gain_file = md_dict.get("gain_file", "")
-        try:
-            self.handler.gain_file = gain_file
-        except Exception:
-            logging.exception(f"Error loading gain file {gain_file}")
-            self.handler.gain_file = ""
+        else:
+            proc_image = handler.process(
+                image,
+                conversion=conversion,
+                mask=False,
+                gap_pixels=gap_pixels,
+                double_pixels=double_pixels,
+                geometry=geometry,
+            )
+
+            inv_mask = self._get_mask(state, gap_pixels, double_pixels, geometry) if mask else None
+
+            # the processed image is a new array, so it can be overwritten
+            proc_image = _mask_cast_rotate(proc_image, inv_mask, n_rot, inplace=True)
 
-        # pedestal file
+            if not saturated_pixels:
+                return proc_image
+
+        y, x = handler.get_saturated_pixels(
+            image, mask=mask, gap_pixels=gap_pixels, geometry=geometry
+        )
+        return proc_image, _rotate_coords(y, x, proc_image.shape, n_rot)
+
+    def get_gains(self, image, metadata, mask=True, gap_pixels=True, geometry=True, n_rot=0):
+        """Return gains of a raw image received via stream.
+
+        Args:
+            image (ndarray): A raw image.
+            metadata (dict): A corresponding image metadata.
+            n_rot (int, optional): A number of times the gains are rotated by 90 degrees
+                counterclockwise, as in np.rot90. Defaults to 0.
+
+        Returns:
+            ndarray: Resulting C-contiguous float32 gains, or None if the image is not from a known
+                detector.
+        """
+        handler = self.get_handler(metadata)
+        if handler is None:
+            return None
+
+        gains = handler.get_gains(image, mask=mask, gap_pixels=gap_pixels, geometry=geometry)
+        return _mask_cast_rotate(gains, None, n_rot, inplace=True)
+
+    def _get_state(self, md_dict):
+        # skip if detector_name is empty
+        detector_name = md_dict.get("detector_name")
+        if not detector_name:
+            return None
+
+        gain_file = md_dict.get("gain_file", "")
         pedestal_file = md_dict.get("pedestal_file", "")
+        module_map = md_dict.get("module_map")
+        if module_map is not None:
+            module_map = tuple(module_map)
+        daq_rec = md_dict.get("daq_rec")
+        highgain = False if (daq_rec is None) else bool(daq_rec & 0b1)
+
+        # file system calls can be slow, so they are not made under the lock
+        gain_mtime = self._get_mtime(gain_file)
+        pedestal_mtime = self._get_mtime(pedestal_file)
+
+        with self._lock:
+            key = (
+                detector_name,
+                gain_file,
+                gain_mtime,
+                pedestal_file,
+                pedestal_mtime,
+                module_map,
+                highgain,
+            )
+            calibration_key = (detector_name, module_map, highgain)
+            state = self._handlers.get(key)
+            if state is None:
+                future = self._loader.submit(
+                    _create_handler, detector_name, gain_file, pedestal_file, module_map, highgain
+                )
+                state = self._handlers[key] = _HandlerState(
+                    future, calibration_key, (detector_name, module_map)
+                )
+                self._evict()
+            else:
+                self._handlers.move_to_end(key)
+
+            previous_state = self._current.get(calibration_key)
+            if state.future.done():
+                return self._set_current(state, previous_state)
+
+        if previous_state is not None:
+            # keep using the previous calibration, while the new one is being loaded
+            return previous_state
+
+        # there is no calibration to fall back to
+        state.future.result()
+        with self._lock:
+            return self._set_current(state, self._current.get(calibration_key))
+
+    def _set_current(self, state, previous_state):
+        if state.handler is None:
+            # the failed handler stays in the pool, so that it is not created again for each frame,
+            # and the previous calibration is kept
+            return state if previous_state is None else previous_state
+
+        self._current[state.calibration_key] = state
+        return state
+
+    def _evict(self):
+        while len(self._handlers) > self.pool_size:
+            _, state = self._handlers.popitem(last=False)
+            if self._current.get(state.calibration_key) is state:
+                del self._current[state.calibration_key]
+
+    def _get_mtime(self, path):
+        if not path:
+            return None
+
+        now = monotonic()
+        entry = self._mtimes.get(path)
+        if entry is not None and now - entry[0] < MTIME_CHECK_PERIOD:
+            return entry[3]
+
         try:
-            self.handler.pedestal_file = pedestal_file
-        except Exception:
-            logging.exception(f"Error loading pedestal file {pedestal_file}")
-            self.handler.pedestal_file = ""
+            stat = os.stat(path)
+            stat = (stat.st_mtime, stat.st_size)
+        except OSError:
+            stat = None
 
+        if entry is None:
+            # there is no calibration to keep using, so the file is not waited for
+            changed = now
+            mtime = None if stat is None else stat[0]
+        else:
+            _, last_stat, changed, mtime = entry
+            if stat != last_stat:
+                changed = now
+
+            if now - changed >= MTIME_STABLE_PERIOD:
+                mtime = None if stat is None else stat[0]
+
+        self._mtimes[path] = (now, stat, changed, mtime)
+        return mtime
+
+    def _get_lut(self, state, image, conversion, gap_pixels, double_pixels, geometry, mask, n_rot):
+        if double_pixels == "interp":
+            # interpolated double pixels are not a plain rearrangement of received pixels
+            return None
+
+        key = state.geometry_key + (image.shape, conversion, gap_pixels, double_pixels, geometry)
+        inv_mask = self._get_mask(state, gap_pixels, double_pixels, geometry) if mask else None
+        # pixel masks are kept per calibration, so they are identified by their objects
+        variant_key = key + (None if inv_mask is None else id(inv_mask), n_rot % 4)
+
+        with self._lock:
+            variant = self._lut_variants.get(variant_key)
+            if variant is not None and variant[0] is inv_mask:
+                self._lut_variants.move_to_end(variant_key)
+                return variant[1]
+
+            found = key in self._luts
+            base_lut = self._luts.get(key)
+            if found:
+                self._luts.move_to_end(key)
+
+        if not found:
+            # lookup tables are built outside of the lock, as it takes a while
+            try:
+                base_lut = _build_lut(
+                    state.handler, image, conversion, gap_pixels, double_pixels, geometry
+                )
+            except Exception:
+                logger.exception("Error building a geometry lookup table")
+                base_lut = None
+
+        if base_lut is None:
+            lut = None
+        else:
+            # fold the pixel mask and the rotation into the lookup table
+            lut, fill_value, conv_is_raw = base_lut
+            if inv_mask is not None:
+                lut = lut.copy()
+                lut[inv_mask] = MASKED_PIXEL
+            lut = (np.ascontiguousarray(np.rot90(lut, k=n_rot)), fill_value, conv_is_raw)
+
+        with self._lock:
+            if not found:
+                self._luts[key] = base_lut
+                while len(self._luts) > self.pool_size:
+                    self._luts.popitem(last=False)
+
+            self._lut_variants[variant_key] = (inv_mask, lut)
+            while len(self._lut_variants) > LUT_CACHE_SIZE:
+                self._lut_variants.popitem(last=False)
+
+        return lut
+
+    def _get_mask(self, state, gap_pixels, double_pixels, geometry):
+        if state.handler.pixel_mask is None:
+            return None
+
+        options = (gap_pixels, double_pixels, geometry)
+        inv_mask = state.masks.get(options)
+        if inv_mask is None:
+            with state.lock:
+                inv_mask = state.masks.get(options)
+                if inv_mask is None:
+                    inv_mask = np.invert(
+                        state.handler.get_pixel_mask(
+                            gap_pixels=gap_pixels, double_pixels=double_pixels, geometry=geometry
+                        )
+                    )
+                    state.masks[options] = inv_mask
+
+        return inv_mask
+
+
+class _HandlerState:
+    def __init__(self, future, calibration_key, geometry_key):
+        # a future of jf data handler that is being created
+        self.future = future
+        # (detector_name, module_map, highgain) of the handler
+        self.calibration_key = calibration_key
+        # (detector_name, module_map) of the handler, which define its geometry lookup tables
+        self.geometry_key = geometry_key
+        # inverted pixel masks, with (gap_pixels, double_pixels, geometry) as keys
+        self.masks = dict()
+        self.lock = Lock()
+
+    @property
+    def handler(self):
+        return self.future.result()
+
+
+def _create_handler(detector_name, gain_file, pedestal_file, module_map, highgain):
+    try:
+        handler = JFDataHandler(detector_name)
+    except Exception:
+        logging.exception(f"Error creating data handler for detector {detector_name}")
+        return None
+
+    # gain file
+    try:
+        handler.gain_file = gain_file
+    except Exception:
+        logging.exception(f"Error loading gain file {gain_file}")
+        handler.gain_file = ""
+
+    # pedestal file
+    try:
+        handler.pedestal_file = pedestal_file
+    except Exception:
+        logging.exception(f"Error loading pedestal file {pedestal_file}")
+        handler.pedestal_file = ""
+
+    try:
         # module map
-        module_map = md_dict.get("module_map")
-        self.handler.module_map = None if (module_map is None) else np.array(module_map)
+        handler.module_map = None if (module_map is None) else np.array(module_map)
 
         # highgain
-        daq_rec = md_dict.get("daq_rec")
-        self.handler.highgain = False if (daq_rec is None) else bool(daq_rec & 0b1)
-
-    def _apply_mask(self, image, gap_pixels, double_pixels, geometry):
-        # assign masked values to np.nan
-        if self.handler.pixel_mask is not None:
-            # check if mask needs to be refreshed
-            if (
-                self._pedestal_file != self.handler.pedestal_file
-                or np.any(self._module_map != self.handler.module_map)
-                or self._mask_gap_pixels != gap_pixels
-                or self._mask_double_pixels != double_pixels
-                or self._mask_geometry != geometry
-            ):
-                self._inv_mask = np.invert(
-                    self.handler.get_pixel_mask(
-                        gap_pixels=gap_pixels, double_pixels=double_pixels, geometry=geometry
-                    )
-                )
-                self._pedestal_file = self.handler.pedestal_file
-                self._module_map = self.handler.module_map
-                self._mask_gap_pixels = gap_pixels
-                self._mask_double_pixels = double_pixels
-                self._mask_geometry = geometry
-
-            # cast to np.float32 in case there was no conversion, but mask should still be applied
-            if image.dtype != np.float32:
-                image = image.astype(np.float32)
-
-            if image.shape == self._inv_mask.shape:
-                _apply_mask_njit(image, self._inv_mask)
-            else:
-                raise ValueError("Image and mask shapes are not the same")
+        handler.highgain = highgain
+    except Exception:
+        logging.exception(f"Error setting up data handler for detector {detector_name}")
+        return None
+
+    return handler
+
+
+def _build_lut(handler, image, conversion, gap_pixels, double_pixels, geometry):
+    # pass images of received pixel indices through the handler, and find the source pixel of each
+    # assembled pixel in an image that is only converted, but not assembled
+    def process_indices(**kwargs):
+        # indices start from 1, so that 0 marks gap pixels, and are split into two uint16 halves
+        indices = np.arange(1, image.size + 1, dtype=np.int64).reshape(image.shape)
+        low = handler.process(
+            (indices & 0xFFFF).astype(np.uint16), conversion=False, mask=False, **kwargs
+        )
+        high = handler.process(
+            (indices >> 16).astype(np.uint16), conversion=False, mask=False, **kwargs
+        )
+        low = np.nan_to_num(low).astype(np.int64)
+        high = np.nan_to_num(high).astype(np.int64)
+        return (high << 16) | low
+
+    conv_indices = process_indices(gap_pixels=False, double_pixels="keep", geometry=False)
+    proc_indices = process_indices(
+        gap_pixels=gap_pixels, double_pixels=double_pixels, geometry=geometry
+    )
+
+    # positions in the converted image of each received pixel, GAP_PIXEL for missing ones
+    positions = np.full(image.size + 1, GAP_PIXEL, dtype=np.int64)
+    conv_indices = conv_indices.ravel()
+    conv_is_raw = np.array_equal(conv_indices, np.arange(1, image.size + 1))
+    present = conv_indices > 0
+    positions[conv_indices[present]] = np.flatnonzero(present)
+
+    dtype = np.int32 if conv_indices.size < np.iinfo(np.int32).max else np.int64
+    lut = positions[proc_indices].astype(dtype)
+
+    # verify the lookup table with the received image and find the value of gap pixels
+    proc_image = handler.process(
+        image,
+        conversion=conversion,
+        mask=False,
+        gap_pixels=gap_pixels,
+        double_pixels=double_pixels,
+        geometry=geometry,
+    ).astype(np.float32)
+    conv_image = handler.process(
+        image,
+        conversion=conversion,
+        mask=False,
+        gap_pixels=False,
+        double_pixels="keep",
+        geometry=False,
+    )
+
+    gaps = lut == GAP_PIXEL
+    fill_value = proc_image[gaps][0] if gaps.any() else np.float32(np.nan)
+    if not np.array_equal(_gather(conv_image, lut, fill_value), proc_image, equal_nan=True):
+        logger.warning(
+            f"Geometry lookup table is not applicable for gap_pixels={gap_pixels}, "
+            f"double_pixels={double_pixels}, geometry={geometry}"
+        )
+        return None
+
+    return lut, fill_value, conv_is_raw
 
+
+def _gather(image, lut, fill_value, raw_image=None, saturated_value=0):
+    out = np.empty(lut.shape, dtype=np.float32)
+    image = np.ascontiguousarray(image).ravel()
+    if raw_image is None:
+        _gather_njit(image, lut.ravel(), fill_value, out.ravel())
+        return out
+
+    # count saturated pixels per output row while gathering, so that coordinates are only
+    # searched for in rows that have any
+    raw_image = np.ascontiguousarray(raw_image).ravel()
+    counts = np.empty(lut.shape[0], dtype=np.int64)
+    _gather_saturated_njit(image, raw_image, lut, fill_value, saturated_value, out, counts)
+    if not counts.any():
+        return out, (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    return out, _find_saturated_njit(raw_image, lut, saturated_value, counts)
+
+
+@njit(parallel=True)
+def _gather_njit(image, lut, fill_value, out):
+    for i in prange(lut.size):  # pylint: disable=not-an-iterable
+        ind = lut[i]
+        if ind >= 0:
+            out[i] = image[ind]
+        elif ind == GAP_PIXEL:
+            out[i] = fill_value
         else:
-            self._inv_mask = None
-            self._pedestal_file = ""
-            self._module_map = None
-            self._mask_gap_pixels = None
-            self._mask_geometry = None
+            out[i] = np.nan
+
 
-        return image
+@njit(parallel=True)
+def _gather_saturated_njit(image, raw_image, lut, fill_value, saturated_value, out, counts):
+    sy, sx = lut.shape
+    for i in prange(sy):  # pylint: disable=not-an-iterable
+        count = 0
+        for j in range(sx):
+            ind = lut[i, j]
+            if ind >= 0:
+                out[i, j] = image[ind]
+                if raw_image[ind] == saturated_value:
+                    count += 1
+            elif ind == GAP_PIXEL:
+                out[i, j] = fill_value
+            else:
+                out[i, j] = np.nan
+        counts[i] = count
 
 
 @njit
-def _apply_mask_njit(image, mask):
+def _find_saturated_njit(raw_image, lut, saturated_value, counts):
+    y = np.empty(counts.sum(), dtype=np.int64)
+    x = np.empty_like(y)
+    k = 0
+    for i in np.flatnonzero(counts):
+        for j in range(lut.shape[1]):
+            ind = lut[i, j]
+            if ind >= 0 and raw_image[ind] == saturated_value:
+                y[k] = i
+                x[k] = j
+                k += 1
+
+    return y, x
+
+
+def _rotate_coords(y, x, shape, n_rot):
+    # transform pixel coordinates of an image into coordinates of the image rotated as in np.rot90,
+    # where shape is the one of the rotated image
+    y = np.asarray(y, dtype=np.int64)
+    x = np.asarray(x, dtype=np.int64)
+    sy, sx = shape
+    n_rot %= 4
+    if n_rot == 1:
+        return sy - 1 - x, y
+    if n_rot == 2:
+        return sy - 1 - y, sx - 1 - x
+    if n_rot == 3:
+        return x, sx - 1 - y
+    return y, x
+
+
+def _mask_cast_rotate(image, inv_mask, n_rot, inplace=False, copy=True):
+    # assign masked values to np.nan, cast to np.float32 and rotate in one pass
+    if inv_mask is None:
+        inv_mask = _NO_MASK
+    elif image.shape != inv_mask.shape:
+        raise ValueError("Image and mask shapes are not the same")
+
+    n_rot %= 4
+    unchanged = n_rot == 0 and image.dtype == np.float32 and image.flags.c_contiguous
+    if unchanged and inv_mask is _NO_MASK and not copy and not inplace:
+        # there is nothing to change, so pixels are only copied once a writable image is needed
+        view = image.view()
+        view.flags.writeable = False
+        return view
+
+    if inplace and unchanged:
+        if inv_mask is _NO_MASK:
+            return image
+        out = image
+    else:
+        sy, sx = image.shape
+        out = np.empty((sx, sy) if n_rot % 2 else (sy, sx), dtype=np.float32)
+
+    _mask_cast_rotate_njit(image, inv_mask, n_rot, out)
+
+    return out
+
+
+_NO_MASK = np.zeros((0, 0), dtype=bool)
+
+
+@njit(parallel=True)
+def _mask_cast_rotate_njit(image, mask, n_rot, out):
+    # iterate over output rows, so that each thread writes a contiguous block of the output
     sy, sx = image.shape
-    for i in range(sx):
-        for j in range(sy):
-            if mask[j, i]:
-                image[j, i] = np.nan
+    use_mask = mask.size > 0
+    if n_rot == 0:
+        for i in prange(sy):  # pylint: disable=not-an-iterable
+            for j in range(sx):
+                out[i, j] = np.nan if use_mask and mask[i, j] else image[i, j]
+
+    elif n_rot == 1:
+        for i in prange(sx):  # pylint: disable=not-an-iterable
+            x = sx - 1 - i
+            for j in range(sy):
+                out[i, j] = np.nan if use_mask and mask[j, x] else image[j, x]
+
+    elif n_rot == 2:
+        for i in prange(sy):  # pylint: disable=not-an-iterable
+            y = sy - 1 - i
+            for j in range(sx):
+                x = sx - 1 - j
+                out[i, j] = np.nan if use_mask and mask[y, x] else image[y, x]
+
+    else:
+        for i in prange(sx):  # pylint: disable=not-an-iterable
+            for j in range(sy):
+                y = sy - 1 - j
+                out[i, j] = np.nan if use_mask and mask[y, i] else image[y, i]
@@ -0,0 +1,245 @@
+import logging
+import os
+import queue
+from datetime import datetime
+from threading import Thread
+from time import monotonic
+
+import h5py
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TRIGGERS = ["all", "hits", "around"]
+
+# metadata entries that are recorded along with images (if present)
+default_entries = [
+    "pulse_id",
+    "frame",
+    "is_good_frame",
+    "daq_rec",
+    "laser_on",
+    "number_of_spots",
+    "sfx_hit",
+    "saturated_pixels",
+]
+
+# flush recorded data to disk at least every this number of seconds
+FLUSH_PERIOD = 1
+
+
+class Recorder:
+    def __init__(
+        self,
+        directory,
+        prefix="streamvis",
+        trigger="all",
+        hit_threshold=0,
+        frames_around=0,
+        queue_size=100,
+        entries=None,
+    ):
+        """Initialize a recorder of received frames to hdf5 files.
+
+        Versions of selected frames are put to a bounded queue, and the frames are copied from
+        the receiver buffer and written by a separate thread, so that recording never blocks a
+        receiver. If the queue is full, or a frame has been overwritten in the buffer before its
+        copy, the frame is dropped. A new file is started on each change of the frame layout (data
+        type and shape).
+
+        Args:
+            directory (str): A directory for output files.
+            prefix (str, optional): A prefix of output file names. Defaults to "streamvis".
+            trigger (str, optional): Record 'all' frames, only 'hits', or frames 'around' each hit.
+                Defaults to "all".
+            hit_threshold (int, optional): A number of spots, above which a frame is registered as
+                'hit', if there is no 'sfx_hit' metadata entry. Defaults to 0.
+            frames_around (int, optional): A number of frames to record before and after each
+                hit for the 'around' trigger. Frames before a hit are taken from the receiver
+                buffer, so their number is limited by its size. Defaults to 0.
+            queue_size (int, optional): A maximal number of frames waiting to be written.
+                Defaults to 100.
+            entries (list, optional): Metadata entries to record. If None, default_entries are
+                recorded. Defaults to None.
+        """
+        if trigger not in TRIGGERS:
+            raise ValueError(f"Unknown recorder trigger '{trigger}'")
+
+        self.directory = directory
+        self.prefix = prefix
+        self.trigger = trigger
+        self.hit_threshold = hit_threshold
+        self.frames_around = frames_around
+        self.entries = default_entries if entries is None else entries
+
+        self.recorded = 0
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._last_seq = -1
+        self._post_frames = 0
+
+        self._file = None
+        self._thread = Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def filename(self):
+        """A name of the currently written file or None (readonly).
+        """
+        return None if self._file is None else self._file.filename
+
+    def update(self, buffer):
+        """Record the newest frame of a receiver buffer, if it is selected by the trigger.
+
+        Args:
+            buffer (RingBuffer): A receiver buffer.
+        """
+        metadata, _ = buffer[-1]
+
+        if self.trigger == "all":
+            self._record(buffer, 1)
+
+        elif self._is_hit(metadata):
+            if self.trigger == "hits":
+                self._record(buffer, 1)
+            else:
+                self._record(buffer, self.frames_around + 1)
+                self._post_frames = self.frames_around
+
+        elif self._post_frames > 0:
+            self._record(buffer, 1)
+            self._post_frames -= 1
+
+    def close(self):
+        """Write all queued frames and close the current file.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _is_hit(self, metadata):
+        sfx_hit = metadata.get("sfx_hit")
+        if sfx_hit is None:
+            number_of_spots = metadata.get("number_of_spots")
+            sfx_hit = number_of_spots and number_of_spots > self.hit_threshold
+
+        return sfx_hit
+
+    def _record(self, buffer, nframes):
+        for index in range(-min(nframes, len(buffer)), 0):
+            seq = buffer.get_seq(index)
+            if seq <= self._last_seq:
+                # the frame has already been recorded
+                continue
+            self._last_seq = seq
+
+            if self._queue.full():
+                self.dropped += 1
+                continue
+
+            self._queue.put_nowait((buffer, buffer.get_version(index)))
+
+    def _write_loop(self):
+        last_flush = monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=FLUSH_PERIOD)
+            except queue.Empty:
+                item = ()
+
+            if item is None:
+                break
+
+            try:
+                if item:
+                    self._write_frame(*item)
+
+                if self._file is not None and monotonic() - last_flush >= FLUSH_PERIOD:
+                    self._file.flush()
+                    last_flush = monotonic()
+
+            except Exception:
+                logger.exception("Error writing recorded frame")
+                self._close_file()
+
+        self._close_file()
+
+    def _write_frame(self, buffer, version):
+        # the frame slot gets overwritten by the next frames, so it is copied only if still intact
+        snapshot = buffer.snapshot(version)
+        if snapshot is None:
+            self.dropped += 1
+            return
+
+        metadata, image = snapshot
+        entries = {entry: metadata[entry] for entry in self.entries if entry in metadata}
+        self._write(entries, image)
+
+    def _write(self, entries, image):
+        if self._file is not None:
+            data = self._file["data"]
+            if data.dtype != image.dtype or data.shape[1:] != image.shape:
+                self._close_file()
+
+        if self._file is None:
+            self._open_file(image)
+
+        data = self._file["data"]
+        ind = data.shape[0]
+        data.resize(ind + 1, axis=0)
+        data[ind] = image
+
+        for entry, value in entries.items():
+            value = np.asarray(value)
+            if value.ndim != 0 or value.dtype.kind not in "biuf":
+                # only scalar numeric values are recorded
+                continue
+
+            if entry not in self._file:
+                self._file.create_dataset(
+                    entry,
+                    shape=(ind + 1,),
+                    maxshape=(None,),
+                    chunks=(1024,),
+                    dtype=value.dtype,
+                    fillvalue=np.nan if value.dtype.kind == "f" else 0,
+                )
+            dataset = self._file[entry]
+            if dataset.shape[0] < ind + 1:
+                dataset.resize(ind + 1, axis=0)
+            dataset[ind] = value
+
+        self.recorded += 1
+
+    def _open_file(self, image):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = os.path.join(self.directory, f"{self.prefix}_{timestamp}.h5")
+
+        h5_file = h5py.File(filename, "w")
+        try:
+            h5_file.create_dataset(
+                "data",
+                shape=(0, *image.shape),
+                maxshape=(None, *image.shape),
+                chunks=(1, *image.shape),
+                dtype=image.dtype,
+            )
+        except Exception:
+            h5_file.close()
+            raise
+
+        self._file = h5_file
+        logger.info(f"Recording frames to {filename}")
+
+    def _close_file(self):
+        if self._file is None:
+            return
+
+        nframes = self._file["data"].shape[0]
+        # metadata datasets of entries that were missing for the last frames are shorter
+        for entry in self.entries:
+            if entry in self._file and self._file[entry].shape[0] < nframes:
+                self._file[entry].resize(nframes, axis=0)
+
+        self._file.close()
+        self._file = None
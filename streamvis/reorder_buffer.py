@@ -0,0 +1,156 @@
+import heapq
+from collections import deque
+from time import monotonic
+
+
+class ReorderBuffer:
+    def __init__(self, window_pulses=None, window_ms=None, max_frames=None):
+        """Initialize a buffer that releases frames in pulse_id order.
+
+        A frame is held until its pulse_id falls behind the latest pushed pulse_id by at least
+        `window_pulses`, or until it is held for at least `window_ms`, whichever comes first.
+        Frames that arrive after a frame with a larger pulse_id has already been released can not
+        be reordered anymore and are released immediately as late frames.
+
+        Args:
+            window_pulses (int, optional): A reordering window in pulses. Defaults to None.
+            window_ms (float, optional): A reordering window in milliseconds. Defaults to None.
+            max_frames (int, optional): A frame is released after this number of newer frames has
+                been pushed regardless of the window, e.g. to keep it within a ring buffer of
+                limited size. Defaults to None.
+        """
+        if window_pulses is None and window_ms is None:
+            raise ValueError("Either a window in pulses or in milliseconds should be provided")
+
+        self.window_pulses = window_pulses
+        self.window_ms = window_ms
+        self.max_frames = max_frames
+
+        # held frames as (pulse_id, push number, push time, frame) entries
+        self._heap = []
+        # push numbers of held frames in the push order, which may also contain released ones
+        self._pushed = deque()
+        self._released = set()
+        self._npushed = 0
+
+        self._latest_pulse_id = None
+        self._last_released_pulse_id = None
+
+        self.late = 0
+        self.released = 0
+        self.max_latency = 0
+        self._total_latency = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    @property
+    def mean_latency(self):
+        """Average time in seconds that frames have been held (readonly).
+        """
+        if self.released == 0:
+            return 0
+        return self._total_latency / self.released
+
+    def to_dict(self):
+        """Return reordering counters as a json-serializable dict.
+        """
+        return dict(
+            held=len(self._heap),
+            released=self.released,
+            late=self.late,
+            max_latency_ms=self.max_latency * 1000,
+            mean_latency_ms=self.mean_latency * 1000,
+        )
+
+    def push(self, pulse_id, frame):
+        """Add a frame and release frames that are ready.
+
+        Args:
+            pulse_id (int): A pulse_id of the frame, frames without pulse_id are released
+                immediately.
+            frame (object): A frame to be released in pulse_id order.
+
+        Returns:
+            list: Released frames in pulse_id order.
+        """
+        if pulse_id is None:
+            return [*self.pop_ready(), frame]
+
+        if self._last_released_pulse_id is not None and pulse_id < self._last_released_pulse_id:
+            self.late += 1
+            self.released += 1
+            return [*self.pop_ready(), frame]
+
+        if self._latest_pulse_id is None or self._latest_pulse_id < pulse_id:
+            self._latest_pulse_id = pulse_id
+
+        heapq.heappush(self._heap, (pulse_id, self._npushed, monotonic(), frame))
+        if self.max_frames is not None:
+            self._pushed.append(self._npushed)
+        self._npushed += 1
+
+        return self.pop_ready()
+
+    def pop_ready(self):
+        """Release frames that have left the reordering window.
+
+        Returns:
+            list: Released frames in pulse_id order.
+        """
+        frames = []
+        now = monotonic()
+
+        # release all frames up to the oldest one, if it has been held for too many pushes
+        if self.max_frames is not None:
+            while self._pushed and self._pushed[0] in self._released:
+                self._released.remove(self._pushed.popleft())
+
+            if self._pushed and self._npushed - self._pushed[0] >= self.max_frames:
+                oldest = self._pushed[0]
+                while oldest not in self._released:
+                    frames.append(self._pop(now))
+
+        while self._heap:
+            pulse_id, _, time_push, _ = self._heap[0]
+            if (
+                self.window_pulses is not None
+                and self._latest_pulse_id - pulse_id >= self.window_pulses
+            ) or (self.window_ms is not None and (now - time_push) * 1000 >= self.window_ms):
+                frames.append(self._pop(now))
+            else:
+                break
+
+        return frames
+
+    def flush(self):
+        """Release all held frames.
+
+        This also resets the pulse_id tracking, so that a restarted stream is not treated as late.
+
+        Returns:
+            list: Released frames in pulse_id order.
+        """
+        now = monotonic()
+        frames = [self._pop(now) for _ in range(len(self._heap))]
+
+        self._pushed.clear()
+        self._released.clear()
+        self._latest_pulse_id = None
+        self._last_released_pulse_id = None
+
+        return frames
+
+    def _pop(self, now):
+        pulse_id, npushed, time_push, frame = heapq.heappop(self._heap)
+        if self.max_frames is not None:
+            self._released.add(npushed)
+
+        self._last_released_pulse_id = pulse_id
+
+        latency = now - time_push
+        self.max_latency = max(self.max_latency, latency)
+        self._total_latency += latency
+        self.released += 1
+
+        return frame
@@ -0,0 +1,251 @@
+import argparse
+import logging
+from itertools import count
+from time import perf_counter, sleep
+
+import h5py
+import numpy as np
+import zmq
+
+from streamvis import __version__
+
+logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# report the achieved rate every this number of seconds
+REPORT_PERIOD = 1
+
+
+def main():
+    """The streamvis-replay command line interface.
+
+    Publish images and metadata recorded to hdf5 files (e.g. by 'streamvis --record-dir') over
+    a zmq PUB socket in the same message format as detector streams.
+    """
+    parser = argparse.ArgumentParser(
+        prog="streamvis-replay", formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument("-v", "--version", action="version", version=f"%(prog)s {__version__}")
+
+    parser.add_argument("files", type=str, nargs="+", help="hdf5 files to replay")
+
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        default="data",
+        help="a path to the image dataset, scalar datasets of the same length in the same group "
+        "are sent as metadata",
+    )
+
+    parser.add_argument(
+        "--address",
+        type=str,
+        default="tcp://127.0.0.1:9001",
+        help="an address string for zmq socket",
+    )
+
+    parser.add_argument(
+        "--connection-mode",
+        type=str,
+        choices=["connect", "bind"],
+        default="bind",
+        help="whether to bind a socket to an address or connect to a remote socket with an address",
+    )
+
+    parser.add_argument(
+        "--rate", type=float, default=10, help="a message rate in Hz, 0 to send without pauses",
+    )
+
+    parser.add_argument(
+        "--loop", type=int, default=1, help="a number of times to replay files, 0 to loop forever",
+    )
+
+    parser.add_argument(
+        "--burst-size",
+        type=int,
+        default=0,
+        help="a number of messages in a burst sent with the given rate, 0 to disable bursts",
+    )
+
+    parser.add_argument(
+        "--burst-pause", type=float, default=1, help="a pause between bursts in seconds",
+    )
+
+    parser.add_argument(
+        "--pulse-id-step",
+        type=int,
+        default=None,
+        help="generate pulse_ids with this step instead of sending recorded ones, e.g. to keep "
+        "pulse_ids increasing when looping",
+    )
+
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="read all images into memory before sending, which is needed for high rates",
+    )
+
+    parser.add_argument(
+        "--sndhwm", type=int, default=None, help="a high-water mark of the zmq socket",
+    )
+
+    args = parser.parse_args()
+
+    zmq_context = zmq.Context()
+    zmq_socket = zmq_context.socket(zmq.PUB)  # pylint: disable=E1101
+    if args.sndhwm is not None:
+        zmq_socket.setsockopt(zmq.SNDHWM, args.sndhwm)  # pylint: disable=E1101
+
+    if args.connection_mode == "connect":
+        zmq_socket.connect(args.address)
+    else:
+        zmq_socket.bind(args.address)
+
+    # give subscribers time to connect, otherwise the first messages are lost
+    sleep(1)
+
+    sources = [Recording(file, args.dataset, preload=args.preload) for file in args.files]
+    stats = RateStats()
+    pulse_ids = None if args.pulse_id_step is None else count(step=args.pulse_id_step)
+
+    period = 1 / args.rate if args.rate > 0 else 0
+    loops = count() if args.loop == 0 else range(args.loop)
+
+    try:
+        start_time = perf_counter()
+        nsent = 0
+        for _ in loops:
+            for source in sources:
+                for metadata, image in source:
+                    if pulse_ids is not None:
+                        metadata["pulse_id"] = next(pulse_ids)
+
+                    if args.burst_size and nsent and nsent % args.burst_size == 0:
+                        sleep(args.burst_pause)
+                        # start the next burst from now
+                        start_time = perf_counter() - nsent * period
+
+                    # schedule messages relative to the start to avoid accumulating delays
+                    delay = start_time + nsent * period - perf_counter()
+                    if delay > 0:
+                        sleep(delay)
+
+                    zmq_socket.send_json(metadata, flags=zmq.SNDMORE)  # pylint: disable=E1101
+                    zmq_socket.send(image, copy=False)
+                    nsent += 1
+
+                    stats.update(image.nbytes)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        stats.report(final=True)
+        for source in sources:
+            source.close()
+        zmq_socket.close(linger=1000)
+        zmq_context.term()
+
+
+class Recording:
+    def __init__(self, file, dataset="data", preload=False):
+        """Initialize a source of recorded images and metadata.
+
+        Args:
+            file (str): A path to hdf5 file.
+            dataset (str, optional): A path to the image dataset. Defaults to "data".
+            preload (bool, optional): Read all images into memory. Defaults to False.
+        """
+        self._file = h5py.File(file, "r")
+        self._data = self._file[dataset]
+        if preload:
+            self._data = self._data[:]
+
+        nframes = self._data.shape[0]
+
+        # scalar metadata datasets next to the image dataset
+        self._metadata = dict()
+        group = self._file[dataset].parent
+        for name, value in group.items():
+            if isinstance(value, h5py.Dataset) and value.shape == (nframes,):
+                values = value[:]
+                if values.dtype.kind == "f":
+                    # missing values are recorded as nan, which is not valid in json
+                    values = np.where(np.isnan(values), None, values)
+                self._metadata[name] = values.tolist()
+
+        logger.info(
+            f"{file}: {nframes} images of type '{self._data.dtype}' and shape "
+            f"{self._data.shape[1:]}, metadata entries {list(self._metadata)}"
+        )
+
+    def __iter__(self):
+        for ind in range(self._data.shape[0]):
+            metadata = dict(
+                htype=["array-1.0"], type=str(self._data.dtype), shape=list(self._data.shape[1:])
+            )
+            for name, values in self._metadata.items():
+                metadata[name] = values[ind]
+
+            yield metadata, np.ascontiguousarray(self._data[ind])
+
+    def close(self):
+        """Close the hdf5 file.
+        """
+        self._file.close()
+
+
+class RateStats:
+    def __init__(self):
+        """Initialize statistics of the achieved message rate.
+        """
+        self.start_time = perf_counter()
+        self.messages = 0
+        self.bytes = 0
+
+        self._report_time = self.start_time
+        self._report_messages = 0
+        self._report_bytes = 0
+
+    def update(self, nbytes):
+        """Count a sent message and periodically report the rate.
+
+        Args:
+            nbytes (int): A number of sent image bytes.
+        """
+        self.messages += 1
+        self.bytes += nbytes
+
+        if perf_counter() - self._report_time >= REPORT_PERIOD:
+            self.report()
+
+    def report(self, final=False):
+        """Log the achieved rate since the last report, or since the start if final.
+
+        Args:
+            final (bool, optional): Report totals since the start. Defaults to False.
+        """
+        now = perf_counter()
+        if final:
+            elapsed = now - self.start_time
+            messages = self.messages
+            nbytes = self.bytes
+        else:
+            elapsed = now - self._report_time
+            messages = self.messages - self._report_messages
+            nbytes = self.bytes - self._report_bytes
+
+        if elapsed > 0:
+            logger.info(
+                f"{'Total: ' if final else ''}{messages} messages, "
+                f"{messages / elapsed:.1f} Hz, {nbytes / elapsed / 1e6:.1f} MB/s"
+            )
+
+        self._report_time = now
+        self._report_messages = self.messages
+        self._report_bytes = self.bytes
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,8 @@ from bokeh.models import (
     Text,
 )
 
+from streamvis.profiler import profile
+
 js_resolution = """
     var detector_distance = params.data.detector_distance
     var beam_energy = params.data.beam_energy
@@ -97,6 +99,7 @@ class ResolutionRings:
         if len(self._source.data["x"]):
             self._source.data.update(x=[], y=[], w=[], h=[], text_x=[], text_y=[], text=[])
 
+    @profile
     def update(self, metadata):
         """Trigger an update for the resolution rings overlay.
 
@@ -0,0 +1,548 @@
+import logging
+import os
+from bisect import bisect_left, insort
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    def __init__(self, size=1, spare=1, shared=False, memory=None):
+        """Initialize a ring buffer of preallocated frame slots.
+
+        All slots share a single contiguous array, which is (re)allocated only when the frame
+        layout (data type and shape) changes. Frames are written in place, e.g. with
+        `zmq_socket.recv_into`, so that the steady-state ingest does not allocate image memory.
+
+        Each slot has a write generation, which is odd while the slot is being written and even
+        otherwise. A frame version, i.e. its slot and generation at commit, allows readers to
+        check whether the frame is still intact after they have used its image view, and to take
+        consistent copies of frames without locking the writer.
+
+        Args:
+            size (int, optional): A number of last received frames to keep. Defaults to 1.
+            spare (int, optional): A number of additional slots that can be reserved for writing
+                without overwriting any of the kept frames. Defaults to 1.
+            shared (bool, optional): Allocate slots in a shared memory block, which can be attached
+                to a ring buffer in another process. Defaults to False.
+            memory (int, optional): A memory budget in bytes for all slots. If provided, the number
+                of kept frames is derived from the budget on each frame layout change instead of
+                being fixed by `size`. Defaults to None.
+        """
+        if size < 1:
+            raise ValueError("Ring buffer size should be a positive number")
+
+        if spare < 1:
+            raise ValueError("Ring buffer should have at least one spare slot")
+
+        self._size = size
+        self._spare = spare
+        self._shared = shared
+        self._memory = memory
+
+        self._shm = None
+        # shared memory blocks that can not be closed yet, because their views are still in use
+        self._retired_shm = []
+
+        self._dtype = None
+        self._shape = None
+        self._frames = np.empty((0, 0), dtype=np.uint8)
+
+        self._metadata = []
+        self._seq = []
+        # write generations of slots, which are in the shared memory block for a shared buffer,
+        # and generations of slots at their commit
+        self._generations = np.zeros(0, dtype=np.int64)
+        self._committed = []
+        # incremented on each reallocation, so that versions of frames in old slots get invalid
+        self._epoch = 0
+
+        # slots of kept frames, ordered from the oldest to the newest
+        self._order = deque()
+        # reserved slots, ordered from the oldest to the newest
+        self._reserved = deque()
+        # slots that are either kept or reserved
+        self._in_use = []
+
+        # index of kept frames by pulse_id, and sorted pulse_ids for the nearest neighbour search
+        self._pulse_id_slots = dict()
+        self._pulse_ids = []
+
+        self._next_slot = 0
+        self._ncommitted = 0
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, index):
+        """Return metadata and image of a kept frame.
+
+        The image is a read-only view on the slot memory. It stays valid until the slot is
+        reused, i.e. at least while the next `spare` frames are being received. Use frame versions
+        to check whether the slot has been reused.
+
+        Args:
+            index (int): Position of a frame in the buffer, supports negative values.
+
+        Returns:
+            (dict, ndarray): metadata and image at index
+        """
+        slot = self._order[index]
+        image = self._frames[slot]
+        image.flags.writeable = False
+
+        return self._metadata[slot], image
+
+    @property
+    def size(self):
+        """A maximal number of kept frames (readonly).
+        """
+        return self._size
+
+    @property
+    def memory(self):
+        """A memory budget in bytes for all slots or None (readonly).
+        """
+        return self._memory
+
+    @property
+    def seq(self):
+        """A total number of committed frames (readonly).
+        """
+        return self._ncommitted
+
+    @property
+    def nbytes(self):
+        """A number of bytes allocated for all slots (readonly).
+        """
+        return self._frames.nbytes
+
+    @property
+    def shm_name(self):
+        """A name of the shared memory block with slots or None (readonly).
+        """
+        return None if self._shm is None else self._shm.name
+
+    @property
+    def num_slots(self):
+        """A total number of slots, including spare ones (readonly).
+        """
+        return self._size + self._spare
+
+    def get_seq(self, index):
+        """Return a sequence number of a kept frame.
+
+        Args:
+            index (int): Position of a frame in the buffer, supports negative values.
+
+        Returns:
+            int: A sequence number of the frame, starting from 0 for the first committed frame.
+        """
+        return self._seq[self._order[index]]
+
+    def get_slot(self, index):
+        """Return a slot number of a kept frame.
+
+        Args:
+            index (int): Position of a frame in the buffer, supports negative values.
+
+        Returns:
+            int: A slot number of the frame.
+        """
+        return self._order[index]
+
+    def get_version(self, index):
+        """Return a version of a kept frame.
+
+        Args:
+            index (int): Position of a frame in the buffer, supports negative values.
+
+        Returns:
+            tuple: A version of the frame.
+        """
+        return self._get_version(self._order[index])
+
+    def get_version_by_pulse_id(self, pulse_id, nearest=False):
+        """Return a version of a kept frame with the given pulse_id.
+
+        Args:
+            pulse_id (int): A pulse_id of the frame.
+            nearest (bool, optional): Return a version of a frame with the nearest pulse_id if
+                there is no exact match. Defaults to False.
+
+        Raises:
+            KeyError: There is no kept frame with such pulse_id, or no kept frames with pulse_id at
+                all in case of the nearest neighbour search.
+
+        Returns:
+            tuple: A version of the frame.
+        """
+        return self._get_version(self._find_pulse_id_slot(pulse_id, nearest))
+
+    def find_version(self, metadata):
+        """Return a version of a kept frame with the given metadata object.
+
+        Args:
+            metadata (dict): Metadata of the frame.
+
+        Returns:
+            tuple: A version of the frame, or None if the frame is not kept.
+        """
+        # the frame is most likely one of the newest
+        for slot in reversed(self._order):
+            if self._metadata[slot] is metadata:
+                return self._get_version(slot)
+
+        return None
+
+    def read(self, version):
+        """Return metadata and image of a frame with the given version.
+
+        The image is a read-only view on the slot memory, see `is_intact`.
+
+        Args:
+            version (tuple): A version of the frame.
+
+        Returns:
+            (dict, ndarray): metadata and image of the frame
+        """
+        _, slot, _ = version
+        image = self._frames[slot]
+        image.flags.writeable = False
+
+        return self._metadata[slot], image
+
+    def is_intact(self, version):
+        """Check whether a frame with the given version has not been overwritten.
+
+        Args:
+            version (tuple): A version of the frame.
+
+        Returns:
+            bool: True if the frame slot has not been reused since the frame commit.
+        """
+        epoch, slot, generation = version
+        return epoch == self._epoch and self._generations[slot] == generation
+
+    def snapshot(self, version):
+        """Return metadata and a copy of image of a frame with the given version.
+
+        Args:
+            version (tuple): A version of the frame.
+
+        Returns:
+            (dict, ndarray): metadata and a writable copy of image of the frame, or None if the
+                frame has been overwritten before the copy was complete.
+        """
+        if not self.is_intact(version):
+            return None
+
+        metadata, image = self.read(version)
+        image = image.copy()
+        if not self.is_intact(version):
+            return None
+
+        return metadata, image
+
+    def get_by_pulse_id(self, pulse_id, nearest=False):
+        """Return metadata and image of a kept frame with the given pulse_id.
+
+        Args:
+            pulse_id (int): A pulse_id of the frame.
+            nearest (bool, optional): Return a frame with the nearest pulse_id if there is no exact
+                match. Defaults to False.
+
+        Raises:
+            KeyError: There is no kept frame with such pulse_id, or no kept frames with pulse_id at
+                all in case of the nearest neighbour search.
+
+        Returns:
+            (dict, ndarray): metadata and image with the pulse_id
+        """
+        slot = self._find_pulse_id_slot(pulse_id, nearest)
+        image = self._frames[slot]
+        image.flags.writeable = False
+
+        return self._metadata[slot], image
+
+    def reserve(self, dtype, shape):
+        """Reserve a slot for the next frame.
+
+        The slot memory is reallocated if the frame layout changes, in which case all kept frames
+        are dropped. Previously returned image views remain valid, as they keep a reference to the
+        old memory.
+
+        Args:
+            dtype (str or dtype): Data type of the frame.
+            shape (tuple): Shape of the frame.
+
+        Returns:
+            ndarray: A writable view on the reserved slot memory.
+        """
+        if len(self._reserved) >= self._spare:
+            raise RuntimeError("All spare slots of the ring buffer are already reserved")
+
+        dtype = np.dtype(dtype)
+        shape = tuple(shape)
+        if self._dtype != dtype or self._shape != shape:
+            if self._reserved:
+                raise RuntimeError("Can not change frame layout while there are reserved slots")
+            self._allocate(dtype, shape)
+
+        # look for the least recently used free slot, there is always at least one, because
+        # a number of kept and reserved frames is less than the total number of slots
+        slot = self._next_slot
+        while self._in_use[slot]:
+            slot = (slot + 1) % self.num_slots
+
+        self._next_slot = (slot + 1) % self.num_slots
+        self._in_use[slot] = True
+        self._reserved.append(slot)
+        # the slot is being written
+        self._generations[slot] += 1
+
+        return self._frames[slot]
+
+    def commit(self, metadata):
+        """Commit the oldest reserved slot as a new frame.
+
+        Args:
+            metadata (dict): Metadata associated with the frame.
+        """
+        slot = self._reserved.popleft()
+        self._in_use[slot] = False
+        self._generations[slot] += 1
+        self.commit_slot(slot, metadata)
+
+    def commit_slot(self, slot, metadata, generation=None):
+        """Commit a slot as a new frame.
+
+        This is used by a ring buffer attached to a shared memory block of another ring buffer,
+        which writes the slot data.
+
+        Args:
+            slot (int): A slot number of the frame.
+            metadata (dict): Metadata associated with the frame.
+            generation (int, optional): A slot generation at commit, as reported by the writer.
+                Defaults to None, which is the current generation of the slot.
+
+        Returns:
+            bool: False if the slot has already been reused by the writer, in which case the frame
+                is not committed.
+        """
+        if generation is None:
+            generation = int(self._generations[slot])
+        elif self._generations[slot] != generation:
+            # the frame has been overwritten while its metadata was in transit
+            return False
+
+        if self._in_use[slot]:
+            # the slot of a kept frame has been overwritten by the other ring buffer
+            self._order.remove(slot)
+            self._unindex(slot)
+
+        if len(self._order) == self._size:
+            oldest_slot = self._order.popleft()
+            self._in_use[oldest_slot] = False
+            self._unindex(oldest_slot)
+
+        pulse_id = metadata.get("pulse_id")
+        if pulse_id is not None:
+            if pulse_id not in self._pulse_id_slots:
+                insort(self._pulse_ids, pulse_id)
+            # a repeated pulse_id refers to the newest frame
+            self._pulse_id_slots[pulse_id] = slot
+
+        # metadata is updated before the committed generation, so that readers get consistent
+        # versions
+        self._metadata[slot] = metadata
+        self._committed[slot] = generation
+        self._seq[slot] = self._ncommitted
+        self._ncommitted += 1
+        self._order.append(slot)
+        self._in_use[slot] = True
+
+        return True
+
+    def discard(self):
+        """Release the oldest reserved slot without committing it.
+        """
+        slot = self._reserved.popleft()
+        self._in_use[slot] = False
+        self._generations[slot] += 1
+
+    def clear(self):
+        """Drop all kept frames.
+        """
+        for slot in self._order:
+            self._in_use[slot] = False
+        self._order.clear()
+        self._pulse_id_slots.clear()
+        self._pulse_ids.clear()
+
+    def attach(self, name, dtype, shape):
+        """Attach slots to a shared memory block of another ring buffer.
+
+        The other ring buffer should have the same size and number of spare slots.
+
+        Args:
+            name (str): A name of the shared memory block.
+            dtype (str or dtype): Data type of the frames.
+            shape (tuple): Shape of the frames.
+        """
+        dtype = np.dtype(dtype)
+        shape = tuple(shape)
+        self._resize(dtype, shape)
+
+        shm = shared_memory.SharedMemory(name=name)
+        # the creator of the block is responsible for removing it, so that it should not be
+        # removed by the resource tracker of this process at exit
+        _untrack_shm(shm)
+        self._set_frames(dtype, shape, shm)
+
+    def close(self, unlink=False):
+        """Release the shared memory block, if there is any.
+
+        Args:
+            unlink (bool, optional): Also remove an attached shared memory block, e.g. if its
+                creator has exited without removing it. Defaults to False.
+        """
+        if unlink and not self._shared and self._shm is not None:
+            _track_shm(self._shm)
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                # the block has already been removed by its creator
+                _untrack_shm(self._shm)
+
+        self._retire_shm()
+        self._close_retired_shm()
+
+    def _resize(self, dtype, shape):
+        if self._memory is None:
+            return
+
+        frame_nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        size = self._memory // frame_nbytes - self._spare
+        if size < 1:
+            logger.warning(
+                f"Memory budget of {self._memory / 1e6:.1f} MB is too small for frames of type "
+                f"'{dtype}' and shape {shape}, keeping a single frame"
+            )
+            size = 1
+
+        self._size = size
+
+    def _allocate(self, dtype, shape):
+        self._resize(dtype, shape)
+
+        if self._shared:
+            nbytes = _frames_nbytes(self.num_slots, dtype, shape) + self.num_slots * 8
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            shm = None
+
+        self._set_frames(dtype, shape, shm)
+
+    def _set_frames(self, dtype, shape, shm):
+        self._retire_shm()
+        self._shm = shm
+
+        self._dtype = dtype
+        self._shape = shape
+        if shm is None:
+            self._frames = np.empty((self.num_slots, *shape), dtype=dtype)
+            self._generations = np.zeros(self.num_slots, dtype=np.int64)
+        else:
+            self._frames = np.ndarray((self.num_slots, *shape), dtype=dtype, buffer=shm.buf)
+            # generations follow the frames in the shared memory block, which is zero-filled on
+            # creation
+            self._generations = np.ndarray(
+                self.num_slots,
+                dtype=np.int64,
+                buffer=shm.buf,
+                offset=_frames_nbytes(self.num_slots, dtype, shape),
+            )
+        self._metadata = [None] * self.num_slots
+        self._seq = [None] * self.num_slots
+        self._committed = [None] * self.num_slots
+        self._epoch += 1
+        self._in_use = [False] * self.num_slots
+        self._order.clear()
+        self._pulse_id_slots.clear()
+        self._pulse_ids.clear()
+        self._next_slot = 0
+
+        logger.info(
+            f"Ring buffer of {self.num_slots} slots for frames of type '{dtype}' and shape {shape} "
+            f"uses {self.nbytes / 1e6:.1f} MB"
+        )
+
+    def _get_version(self, slot):
+        return self._epoch, slot, self._committed[slot]
+
+    def _find_pulse_id_slot(self, pulse_id, nearest):
+        slot = self._pulse_id_slots.get(pulse_id)
+        if slot is None:
+            if not nearest or not self._pulse_ids:
+                raise KeyError(pulse_id)
+
+            pos = bisect_left(self._pulse_ids, pulse_id)
+            if pos == len(self._pulse_ids) or (
+                pos > 0 and pulse_id - self._pulse_ids[pos - 1] <= self._pulse_ids[pos] - pulse_id
+            ):
+                pos -= 1
+
+            slot = self._pulse_id_slots[self._pulse_ids[pos]]
+
+        return slot
+
+    def _unindex(self, slot):
+        pulse_id = self._metadata[slot].get("pulse_id")
+        if pulse_id is not None and self._pulse_id_slots.get(pulse_id) == slot:
+            del self._pulse_id_slots[pulse_id]
+            del self._pulse_ids[bisect_left(self._pulse_ids, pulse_id)]
+
+    def _retire_shm(self):
+        if self._shm is not None:
+            if self._shared:
+                # the creator of the block is responsible for removing it, other processes that
+                # have it attached can continue using it until they close it
+                _track_shm(self._shm)
+                self._shm.unlink()
+            self._retired_shm.append(self._shm)
+            self._shm = None
+            self._frames = np.empty((0, 0), dtype=np.uint8)
+            self._generations = np.zeros(0, dtype=np.int64)
+
+        self._close_retired_shm()
+
+    def _close_retired_shm(self):
+        still_in_use = []
+        for shm in self._retired_shm:
+            try:
+                shm.close()
+            except BufferError:
+                still_in_use.append(shm)
+        self._retired_shm = still_in_use
+
+
+def _frames_nbytes(num_slots, dtype, shape):
+    # frames are followed by int64 slot generations, so their size is rounded up to 8 bytes
+    nbytes = num_slots * int(np.prod(shape)) * dtype.itemsize
+    return (nbytes + 7) // 8 * 8
+
+
+def _track_shm(shm):
+    # unlink() unregisters the block from the resource tracker, which can be shared with processes
+    # that have already unregistered the block on attach, so register it again beforehand
+    if os.name != "nt":
+        resource_tracker.register(shm._name, "shared_memory")  # pylint: disable=W0212
+
+
+def _untrack_shm(shm):
+    if os.name != "nt":
+        resource_tracker.unregister(shm._name, "shared_memory")  # pylint: disable=W0212
@@ -1,6 +1,8 @@
 import numpy as np
 from bokeh.models import Asterisk, CheckboxGroup, ColumnDataSource
 
+from streamvis.profiler import profile
+
 
 class SaturatedPixels:
     def __init__(self, image_views, sv_metadata):
@@ -28,6 +30,7 @@ class SaturatedPixels:
         if len(self._source.data["x"]):
             self._source.data.update(x=[], y=[])
 
+    @profile
     def update(self, metadata):
         """Trigger an update for the saturated pixels overlay.
 
@@ -46,8 +49,8 @@ class SaturatedPixels:
             return
 
         y, x = saturated_pixels_coord
-        # convert coordinates to numpy arrays, because if these values were received as a part
-        # of a zmq message, they will be lists (ndarray is not JSON serializable)
+        # coordinates detected during image conversion are already numpy arrays, but received
+        # ones can be lists (ndarray is not JSON serializable), in which case they are converted
         y = np.array(y, copy=False)
         x = np.array(x, copy=False)
         self._source.data.update(x=x + 0.5, y=y + 0.5)
@@ -1,5 +1,7 @@
 from bokeh.models import Circle, ColumnDataSource
 
+from streamvis.profiler import profile
+
 
 class Spots:
     def __init__(self, image_views, sv_metadata):
@@ -22,6 +24,7 @@ class Spots:
         if len(self._source.data["x"]):
             self._source.data.update(x=[], y=[])
 
+    @profile
     def update(self, metadata):
         """Trigger an update for the spots overlay.
 
@@ -24,6 +24,7 @@ class StatisticsHandler:
         # TODO: fix maximum number of deques in the buffer
         self.roi_intensities_buffers = [deque(maxlen=50) for _ in range(9)]
         self.radial_profile = RadialProfile()
+        self.reset_count = 0
         self._lock = RLock()
 
         self.data = dict(
@@ -39,6 +40,9 @@ class StatisticsHandler:
             laser_off_hits_ratio=[],
         )
 
+        # indexes of pulse_id bins in data lists
+        self._bin_inds = dict()
+
         self.sum_data = copy.deepcopy(self.data)
         for key, val in self.sum_data.items():
             if key == "pulse_id_bins":
@@ -53,16 +57,16 @@ class StatisticsHandler:
         js_code = """
         switch (this.item) {
             case "Statistics":
-                window.open('/statistics');
+                window.open('/statistics' + window.location.search);
                 break;
             case "Hitrate":
-                window.open('/hitrate');
+                window.open('/hitrate' + window.location.search);
                 break;
             case "ROI Intensities":
-                window.open('/roi_intensities');
+                window.open('/roi_intensities' + window.location.search);
                 break;
             case "Radial Profile":
-                window.open('/radial_profile');
+                window.open('/radial_profile' + window.location.search);
                 break;
         }
         """
@@ -82,14 +86,29 @@ class StatisticsHandler:
             metadata (dict): A dictionary with metadata.
             image (ndarray): An associated image.
         """
-        number_of_spots = metadata.get("number_of_spots")
-        sfx_hit = metadata.get("sfx_hit")
-        if sfx_hit is None:
-            sfx_hit = number_of_spots and number_of_spots > self.hit_threshold
+        self.parse_hit(metadata, image)
+        self.parse_metadata(metadata)
+
+    def parse_hit(self, metadata, image):
+        """Keep an image associated with a metadata as the last hit, if the metadata is a hit.
+
+        Args:
+            metadata (dict): A dictionary with metadata.
+            image (ndarray): An associated image.
+        """
+        if image.shape != (2, 2) and self._is_hit(metadata):
+            # add to buffer only if the recieved image is not dummy, the image is copied, because
+            # it is a view on a receiver buffer slot that gets overwritten by the next frames
+            self.last_hit = (metadata, image.copy())
+
+    def parse_metadata(self, metadata):
+        """Extract statistics from a metadata.
 
-        if image.shape != (2, 2) and sfx_hit:
-            # add to buffer only if the recieved image is not dummy
-            self.last_hit = (metadata, image)
+        Args:
+            metadata (dict): A dictionary with metadata.
+        """
+        number_of_spots = metadata.get("number_of_spots")
+        sfx_hit = self._is_hit(metadata)
 
         roi_intensities = metadata.get("roi_intensities_normalised")
         if roi_intensities is not None:
@@ -112,15 +131,11 @@ class StatisticsHandler:
 
         pulse_id_bin = pulse_id // PULSE_ID_STEP * PULSE_ID_STEP
         with self._lock:
-            try:
-                # since messages can have mixed pulse_id order, search for the current pulse_id_bin
-                # in the last 5 entries (5 should be large enough for all data analysis to finish)
-                bin_ind = self.data["pulse_id_bins"].index(pulse_id_bin, -5)
-            except ValueError:
+            # messages can have mixed pulse_id order, so look up the bin of each message
+            bin_ind = self._bin_inds.get(pulse_id_bin)
+            if bin_ind is None:
                 # this is a new bin
-                bin_ind = -1
-
-            if bin_ind == -1:
+                bin_ind = self._bin_inds[pulse_id_bin] = len(self.data["pulse_id_bins"])
                 self.peakfinder_buffer.clear()
                 for key, val in self.data.items():
                     if key == "pulse_id_bins":
@@ -178,6 +193,42 @@ class StatisticsHandler:
                 self.data["laser_off_hits"][bin_ind] = np.nan
                 self.data["laser_off_hits_ratio"][bin_ind] = np.nan
 
+    def get_state(self):
+        """Return statistics extracted from metadata, e.g. to pass them to another process.
+
+        Returns:
+            dict: Statistics that can be restored with `set_state`.
+        """
+        with self._lock:
+            return dict(
+                data=self.data,
+                sum_data=self.sum_data,
+                _bin_inds=self._bin_inds,
+                peakfinder_buffer=self.peakfinder_buffer,
+                hitrate_fast=self.hitrate_fast,
+                hitrate_slow=self.hitrate_slow,
+                roi_intensities_buffers=self.roi_intensities_buffers,
+                radial_profile=self.radial_profile,
+            )
+
+    def set_state(self, state):
+        """Replace statistics extracted from metadata.
+
+        Args:
+            state (dict): Statistics returned by `get_state`.
+        """
+        with self._lock:
+            for key, value in state.items():
+                setattr(self, key, value)
+
+    def _is_hit(self, metadata):
+        sfx_hit = metadata.get("sfx_hit")
+        if sfx_hit is None:
+            number_of_spots = metadata.get("number_of_spots")
+            sfx_hit = number_of_spots and number_of_spots > self.hit_threshold
+
+        return sfx_hit
+
     def _increment(self, key, ind):
         self.data[key][ind] += 1
         self.sum_data[key][-1] += 1
@@ -186,6 +237,8 @@ class StatisticsHandler:
         """Reset statistics entries.
         """
         with self._lock:
+            self.reset_count += 1
+            self._bin_inds.clear()
             for val in self.data.values():
                 val.clear()
 
@@ -262,6 +315,9 @@ class MaxlenDict(OrderedDict):
         if len(self) > self._maxlen:
             self.popitem(False)
 
+    def __reduce__(self):
+        return self.__class__, (self._maxlen,), None, None, iter(self.items())
+
 
 class RadialProfile:
     def __init__(self, step_size=100, max_steps=100):
@@ -285,7 +341,7 @@ class RadialProfile:
             # probably an old message sent before q has changed
             return
 
-        I = np.array(I)
+        I = np.asarray(I)
         bin_id = pulse_id // self._step_size
 
         if bin_id not in self._profiles:
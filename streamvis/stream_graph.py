@@ -21,6 +21,8 @@ from bokeh.models import (
     WheelZoomTool,
 )
 
+from streamvis.profiler import profile
+
 MAXLEN = 100
 
 
@@ -132,6 +134,7 @@ class StreamGraph:
         reset_button.on_click(reset_button_callback)
         self.reset_button = reset_button
 
+    @profile
     def update(self, values):
         """Trigger an update for the stream graph plots.
 
@@ -0,0 +1,185 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+from streamvis.conversion_pool import ConversionOptions, ConversionPool, convert_frame
+from streamvis.frame_cache import FrameCache
+from streamvis.ring_buffer import RingBuffer
+
+options = ConversionOptions(
+    datatype="Image", mask=True, gap_pixels=True, double_pixels="keep", geometry=True, n_rot=1
+)
+
+
+class Adapter:
+    def __init__(self):
+        self.processed = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def process(self, image, metadata, n_rot=0, saturated_pixels=False, **_kwargs):
+        self.started.set()
+        self.release.wait()
+        self.processed.append(metadata["frame"])
+        proc_image = np.ascontiguousarray(np.rot90(image, k=n_rot), dtype=np.float32)
+        if saturated_pixels:
+            saturated_pixels_coord = np.nonzero(proc_image == 0xC000)
+            return proc_image, saturated_pixels_coord if metadata.get("detector_name") else None
+        return proc_image
+
+
+def frame(ind):
+    return dict(frame=ind), np.arange(6, dtype=np.uint16).reshape(2, 3) + ind
+
+
+def test_convert_frame():
+    metadata, image = frame(0)
+    proc_metadata, proc_image = convert_frame(Adapter(), metadata, image, options)
+
+    assert proc_metadata is metadata
+    assert proc_image.dtype == np.float32
+    np.testing.assert_array_equal(proc_image, np.rot90(image))
+
+
+def test_convert_frame_saturated_pixels():
+    metadata, image = frame(0)
+    metadata["detector_name"] = "JF01T03V01"
+    image[0, 1] = 0xC000
+    proc_metadata, _ = convert_frame(Adapter(), metadata, image, options)
+
+    # received metadata is not modified
+    assert "saturated_pixels" not in metadata
+    assert proc_metadata["saturated_pixels"] == 1
+    y, x = proc_metadata["saturated_pixels_coord"]
+    np.testing.assert_array_equal(y, [1])
+    np.testing.assert_array_equal(x, [0])
+
+    # saturated pixels provided by a detector are kept
+    metadata["saturated_pixels"] = 0
+    proc_metadata, _ = convert_frame(Adapter(), metadata, image, options)
+    assert proc_metadata is metadata
+
+
+def test_convert_requested():
+    adapter = Adapter()
+    frame_cache = FrameCache(memory=1000)
+    pool = ConversionPool(adapter, frame_cache=frame_cache, workers=1)
+
+    # frames are not converted without requests
+    pool.submit(*frame(0))
+    pool.request(options)
+    assert pool.get_result(options) is None
+
+    metadata, image = frame(1)
+    pool.submit(metadata, image)
+    pool._executor.shutdown(wait=True)
+
+    proc_metadata, proc_image = pool.get_result(options)
+    assert proc_metadata is metadata
+    assert not proc_image.flags.writeable
+    assert frame_cache.get(metadata, options) == (proc_metadata, proc_image)
+    assert adapter.processed == [1]
+
+
+def test_drop_frames():
+    adapter = Adapter()
+    pool = ConversionPool(adapter, workers=1)
+    pool.request(options)
+
+    adapter.release.clear()
+    for ind in range(5):
+        pool.submit(*frame(ind))
+    adapter.release.set()
+    pool._executor.shutdown(wait=True)
+
+    # only the latest of waiting frames is converted after the first one
+    assert adapter.processed == [0, 4]
+    assert pool.converted == 2
+    assert pool.dropped == 3
+    assert pool.get_result(options)[0]["frame"] == 4
+
+
+def test_request_timeout():
+    adapter = Adapter()
+    pool = ConversionPool(adapter, workers=1, request_timeout=0)
+    pool.request(options)
+    pool.submit(*frame(0))
+    pool._executor.shutdown(wait=True)
+
+    assert adapter.processed == []
+    assert pool.get_result(options) is None
+
+
+def test_drop_overwritten_frames():
+    adapter = Adapter()
+    receiver = SimpleNamespace(buffer=RingBuffer(size=1, spare=1))
+    pool = ConversionPool(adapter, workers=1, receiver=receiver)
+    pool.request(options)
+
+    def receive(ind):
+        metadata, image = frame(ind)
+        receiver.buffer.reserve(image.dtype, image.shape)[:] = image
+        receiver.buffer.commit(metadata)
+        pool.submit(*receiver.buffer[-1])
+
+    adapter.release.clear()
+    receive(0)
+    adapter.started.wait()
+    receive(1)
+
+    # slots of the frame in conversion and the waiting frame are reused
+    for ind in range(2, 4):
+        metadata, image = frame(ind)
+        receiver.buffer.reserve(image.dtype, image.shape)[:] = image
+        receiver.buffer.commit(metadata)
+
+    adapter.release.set()
+    pool._executor.submit(lambda: None).result()
+
+    # the waiting frame is not converted, and the result of the first frame is dropped
+    assert adapter.processed == [0]
+    assert pool.converted == 0
+    assert pool.dropped == 2
+    assert pool.get_result(options) is None
+
+    # frames are converted directly from buffer slots
+    receive(4)
+    pool._executor.shutdown(wait=True)
+
+    assert adapter.processed == [0, 4]
+    assert pool.converted == 1
+    proc_metadata, proc_image = pool.get_result(options)
+    assert proc_metadata["frame"] == 4
+    np.testing.assert_array_equal(proc_image, np.rot90(frame(4)[1]))
+
+
+def test_convert_error():
+    class FailingAdapter(Adapter):
+        def process(self, image, metadata, *args, **kwargs):
+            if metadata["frame"] == 0:
+                raise ValueError("conversion error")
+            return super().process(image, metadata, *args, **kwargs)
+
+    class FailingFrameCache(FrameCache):
+        def put(self, metadata, *args):
+            if metadata["frame"] == 1:
+                raise MemoryError
+            super().put(metadata, *args)
+
+    adapter = FailingAdapter()
+    pool = ConversionPool(adapter, frame_cache=FailingFrameCache(memory=1000), workers=1)
+    pool.request(options)
+
+    # failed conversions do not stop the following frames from being converted
+    for ind in range(3):
+        pool.submit(*frame(ind))
+        pool._executor.submit(lambda: None).result()
+
+    pool._executor.shutdown(wait=True)
+
+    assert adapter.processed == [1, 2]
+    assert pool.errors == 2
+    assert pool.converted == 1
+    assert pool.get_result(options)[0]["frame"] == 2
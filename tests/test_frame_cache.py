@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from streamvis.frame_cache import FrameCache
+
+
+def test_get_put():
+    cache = FrameCache(memory=1000)
+    metadata = dict(pulse_id=1)
+    image = np.zeros((10, 10), dtype=np.float32)
+
+    assert cache.get(metadata, ("Image", True)) is None
+
+    cache.put(metadata, ("Image", True), metadata, image)
+    assert cache.get(metadata, ("Image", True)) == (metadata, image)
+    # same frame, but different options
+    assert cache.get(metadata, ("Image", False)) is None
+    # a different frame with equal metadata
+    assert cache.get(dict(pulse_id=1), ("Image", True)) is None
+
+    assert cache.hits == 1
+    assert cache.misses == 3
+    assert cache.nbytes == image.nbytes
+
+    with pytest.raises(ValueError):
+        image[0, 0] = 1
+
+
+def test_memory():
+    cache = FrameCache(memory=1000)
+    frames = [dict(pulse_id=i) for i in range(4)]
+    for frame in frames[:2]:
+        cache.put(frame, (), frame, np.zeros(100, dtype=np.float32))
+
+    # the first frame becomes the most recently used
+    cache.get(frames[0], ())
+    cache.put(frames[2], (), frames[2], np.zeros(100, dtype=np.float32))
+
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    assert cache.get(frames[1], ()) is None
+    assert cache.get(frames[0], ()) is not None
+
+    # images larger than the memory budget are not cached
+    cache.put(frames[3], (), frames[3], np.zeros(1000, dtype=np.float32))
+    assert cache.get(frames[3], ()) is None
+    assert cache.nbytes == 800
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
@@ -1,12 +1,11 @@
 import bokeh
 import numpy as np
-from PIL import Image as PIL_Image
 
 import pytest
 import streamvis as sv
+from streamvis.image_view import _pool
 
 test_image = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.float32)
-test_pil_image = PIL_Image.fromarray(test_image)
 
 
 @pytest.fixture(name="im_plot_with_cm", scope="function")
@@ -26,6 +25,72 @@ def test_glyph_class(im_plot_with_cm):
 
 # TODO: the following code should be tested with a client
 # def test_update(im_plot_with_cm):
-#     image_out = im_plot_with_cm.update(test_image, test_pil_image)
+#     image_out = im_plot_with_cm.update(test_image)
 
 #     assert image_out.shape == (800, 800)
+
+
+@pytest.mark.parametrize("pooling", ["max", "mean", "sum"])
+@pytest.mark.parametrize("out_shape", [(4, 3), (7, 7), (1, 10)])
+def test_pool(pooling, out_shape):
+    rng = np.random.default_rng(0)
+    image = rng.random((13, 10)).astype(np.float32)
+    image[rng.random(image.shape) > 0.8] = np.nan
+    image[:2, :4] = np.nan
+
+    out = np.empty(out_shape, dtype=np.float32)
+    result = _pool(image, out, pooling)
+    assert result is out
+
+    # blocks split the image evenly, with at least one pixel per block
+    sy, sx = image.shape
+    oy, ox = out_shape
+    for i in range(oy):
+        y0 = i * sy // oy
+        y1 = max((i + 1) * sy // oy, y0 + 1)
+        for j in range(ox):
+            x0 = j * sx // ox
+            x1 = max((j + 1) * sx // ox, x0 + 1)
+            block = image[y0:y1, x0:x1]
+            if np.isnan(block).all():
+                assert np.isnan(out[i, j])
+            else:
+                expected = dict(max=np.nanmax, mean=np.nanmean, sum=np.nansum)[pooling](block)
+                np.testing.assert_allclose(out[i, j], expected, rtol=1e-6)
+
+
+def test_pool_keeps_peaks():
+    im_plot = sv.ImageView(plot_height=10, plot_width=20, pooling="max")
+    # there is no browser to report the actual canvas size, which is a readonly property
+    im_plot.plot._property_values.update(inner_width=20, inner_height=10)
+
+    image = np.zeros((100, 200), dtype=np.float32)
+    image[37, 123] = 1000
+    im_plot.update(image)
+
+    displayed_image = im_plot.displayed_image
+    assert displayed_image.shape == (10, 20)
+    assert displayed_image[3, 12] == 1000
+    assert displayed_image.sum() == 1000
+
+    # the output buffer is reused
+    im_plot.update(image * 2)
+    assert im_plot.displayed_image is displayed_image
+    assert displayed_image[3, 12] == 2000
+
+
+def test_projections_with_mean_pooling():
+    rng = np.random.default_rng(0)
+    image = rng.random((100, 200)).astype(np.float32)
+
+    projections = []
+    for pooling in ["mean", "max"]:
+        im_plot = sv.ImageView(plot_height=10, plot_width=20, pooling=pooling)
+        im_plot.plot._property_values.update(inner_width=20, inner_height=10)
+        im_plot.proj_toggle.active = [0]
+        im_plot.update(image)
+        projections.append((im_plot._hproj_source.data["y"], im_plot._vproj_source.data["x"]))
+
+    # projections do not depend on the pooling of displayed images
+    for mean_proj, max_proj in zip(*projections):
+        np.testing.assert_allclose(mean_proj, max_proj)
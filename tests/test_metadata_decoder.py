@@ -0,0 +1,40 @@
+import json
+
+import numpy as np
+
+import pytest
+from streamvis.metadata_decoder import MetadataDecoder, orjson
+
+backends = ["json"] if orjson is None else ["json", "orjson"]
+
+metadata = dict(
+    pulse_id=1,
+    type="uint16",
+    shape=[512, 1024],
+    spot_x=[1.5, 2.5],
+    spot_y=[3, 4],
+    saturated_pixels_coord=[[1, 2, 3], [4, 5, 6]],
+    radint_I=[1, None],
+    module_enabled=[1, 0],
+)
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_decode(backend):
+    decoded = MetadataDecoder(backend=backend)(json.dumps(metadata).encode())
+
+    assert decoded["pulse_id"] == 1
+    assert decoded["shape"] == [512, 1024]
+    assert decoded["module_enabled"] == [1, 0]
+
+    assert isinstance(decoded["spot_x"], np.ndarray)
+    np.testing.assert_array_equal(decoded["spot_y"], [3, 4])
+    assert decoded["saturated_pixels_coord"].shape == (2, 3)
+
+    # non-numeric lists are not converted
+    assert decoded["radint_I"] == [1, None]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        MetadataDecoder(backend="simdjson")
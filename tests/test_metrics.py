@@ -0,0 +1,136 @@
+import json
+from datetime import timedelta
+from types import SimpleNamespace
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.testing import bind_unused_port
+from tornado.web import Application
+
+from streamvis.metrics import Histogram, MetricsHandler, ReceiverMetrics
+from streamvis.reorder_buffer import ReorderBuffer
+from streamvis.ring_buffer import RingBuffer
+
+
+def test_histogram():
+    hist = Histogram([1, 10])
+    for value in [0.5, 1, 5, 10, 100]:
+        hist.add(value)
+
+    np.testing.assert_array_equal(hist.counts, [1, 2, 2])
+    assert hist.to_dict()["mean"] == 116.5 / 5
+
+
+def test_missed_frames():
+    metrics = ReceiverMetrics(pulse_id_window=2)
+    for pulse_id in [10, 12, 14, 20, 22, 30, 32, 34]:
+        metrics.update(dict(pulse_id=pulse_id), 100)
+
+    assert metrics.messages == 8
+    assert metrics.bytes == 800
+    assert metrics.missed_frames == 2 + 3
+    assert metrics.gaps.counts.sum() == 2
+
+
+def test_missed_frames_within_window():
+    metrics = ReceiverMetrics(pulse_id_window=3)
+    for pulse_id in [10, 12, 14, 20]:
+        metrics.update(dict(pulse_id=pulse_id), 0)
+
+    # the gap is still in the window
+    assert metrics.missed_frames == 0
+
+
+def test_first_frames_gap():
+    metrics = ReceiverMetrics(pulse_id_window=2)
+    for pulse_id in [1, 3, 4, 5, 6, 7]:
+        metrics.update(dict(pulse_id=pulse_id), 0)
+
+    assert metrics.to_dict()["pulse_id_step"] == 1
+    assert metrics.missed_frames == 1
+
+
+def test_out_of_order():
+    metrics = ReceiverMetrics()
+    for pulse_id in [1, 2, 4, 3, 5]:
+        metrics.update(dict(pulse_id=pulse_id), 0)
+
+    assert metrics.out_of_order == 1
+    assert metrics.missed_frames == 0
+
+
+def test_late_frame():
+    metrics = ReceiverMetrics(pulse_id_window=2)
+    for pulse_id in [1, 2, 4, 5, 6]:
+        metrics.update(dict(pulse_id=pulse_id), 0)
+    assert metrics.missed_frames == 1
+
+    # a frame arriving after its gap has left the window
+    metrics.update(dict(pulse_id=3), 0)
+    assert metrics.out_of_order == 1
+    assert metrics.missed_frames == 0
+
+
+def test_to_dict_is_serializable():
+    metrics = ReceiverMetrics()
+    metrics.update(dict(time_decode=timedelta(milliseconds=1), time_recv=timedelta(seconds=1)), 1)
+    metrics.add_error()
+
+    data = json.loads(json.dumps(metrics.to_dict()))
+    assert data["errors"] == 1
+    assert data["decode_time_ms"]["count"] == 1
+    assert data["recv_time_ms"]["mean"] == 1000
+
+
+def _fetch_metrics(allow_client_subnet):
+    receiver = SimpleNamespace(
+        metrics=ReceiverMetrics(),
+        state="polling",
+        buffer=RingBuffer(size=1),
+        reorder_buffer=ReorderBuffer(window_pulses=1),
+        recorder=None,
+    )
+    receiver.reorder_buffer.push(2, None)
+    receiver.reorder_buffer.push(1, None)
+    app = Application(
+        [
+            (
+                "/metrics",
+                MetricsHandler,
+                dict(receivers=dict(stream=receiver), allow_client_subnet=allow_client_subnet),
+            )
+        ]
+    )
+
+    async def fetch():
+        sock, port = bind_unused_port()
+        server = HTTPServer(app)
+        server.add_sockets([sock])
+        try:
+            return await AsyncHTTPClient().fetch(
+                f"http://127.0.0.1:{port}/metrics", raise_error=False
+            )
+        finally:
+            server.stop()
+
+    io_loop = IOLoop()
+    try:
+        return io_loop.run_sync(fetch, timeout=10)
+    finally:
+        io_loop.close(all_fds=True)
+
+
+def test_metrics_handler():
+    response = _fetch_metrics(allow_client_subnet=["127.0.0.0/8"])
+    assert response.code == 200
+    stream_metrics = json.loads(response.body)["stream"]
+    assert stream_metrics["state"] == "polling"
+    assert stream_metrics["reorder"]["held"] == 1
+    assert stream_metrics["reorder"]["released"] == 1
+
+
+def test_metrics_handler_denied_subnet():
+    response = _fetch_metrics(allow_client_subnet=["10.0.0.0/8"])
+    assert response.code == 403
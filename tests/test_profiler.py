@@ -0,0 +1,68 @@
+import pytest
+
+from streamvis.profiler import Profiler, profile
+
+
+class Component:
+    def update(self, value):
+        return value
+
+
+def test_record_summary():
+    profiler = Profiler(buffer_size=10)
+    for duration in range(1, 21):
+        profiler.record("update", duration / 1000)
+
+    summary = profiler.summary()
+    assert profiler.stages == ["update"]
+    assert summary["update"]["count"] == 20
+    # only the last 10 durations are kept for statistics
+    assert summary["update"]["mean"] == pytest.approx(15.5)
+    assert summary["update"]["max"] == pytest.approx(20)
+    assert summary["update"]["p50"] == pytest.approx(15.5)
+
+
+def test_stage():
+    profiler = Profiler()
+    with profiler.stage("a"):
+        pass
+
+    with pytest.raises(ValueError):
+        with profiler.stage("b"):
+            raise ValueError
+
+    assert profiler.stages == ["a", "b"]
+    assert profiler.summary()["b"]["count"] == 1
+
+    profiler.clear()
+    assert profiler.summary() == {}
+
+
+def test_profile(monkeypatch):
+    component = Component()
+    update = profile(Component.update)
+
+    class Doc:
+        profiler = None
+
+    doc = Doc()
+    monkeypatch.setattr("streamvis.profiler.curdoc", lambda: doc)
+
+    # no measurements without a document profiler
+    assert update(component, 1) == 1
+
+    doc.profiler = Profiler()
+    assert update(component, 2) == 2
+    assert doc.profiler.stages == ["Component.update"]
+
+
+def test_counters():
+    profiler = Profiler(buffer_size=2)
+    for duration in [1, 2, 3]:
+        profiler.record("update", duration)
+
+    # counters are cumulative, regardless of the buffer size
+    assert profiler.counters() == {"update": (3, 6)}
+
+    profiler.clear()
+    assert profiler.counters() == {}
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent import futures
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+import zmq
+from tornado.ioloop import IOLoop
+
+pytest.importorskip("jungfrau_utils")
+
+import streamvis.receiver  # pylint: disable=C0413
+from streamvis.receiver import Receiver  # pylint: disable=C0413
+from streamvis.statistics_handler import StatisticsHandler  # pylint: disable=C0413
+
+
+def _send(zmq_socket, pulse_id, shape=(4, 5)):
+    image = np.full(shape, pulse_id or 0, dtype=np.uint16)
+    metadata = dict(pulse_id=pulse_id, type="uint16", shape=list(shape), number_of_spots=pulse_id)
+    zmq_socket.send(json.dumps(metadata).encode(), flags=zmq.SNDMORE)
+    zmq_socket.send(image)
+
+
+class CompressedData:
+    # a zmq frame with a compressed image, which is the value of all pixels here
+    def __init__(self, value):
+        self.buffer = value
+
+
+def _receive_compressed(receiver, pulse_id):
+    metadata = dict(pulse_id=pulse_id, type="uint16", shape=[4, 5], compression="bitshuffle_lz4")
+    futures.wait(receiver._get_futures_to_wait(metadata))
+    receiver._commit_decompressed()
+    image = receiver._reserve(metadata)
+    receiver._decompress(metadata, image, CompressedData(pulse_id), datetime.now())
+
+
+def _wait_decompressed(receiver):
+    futures.wait([future for future, *_ in receiver._decompressing])
+    receiver._commit_decompressed()
+
+
+def test_decompress_in_order(monkeypatch):
+    decompressed = {pulse_id: threading.Event() for pulse_id in (1, 2)}
+
+    def decompress(data, image):
+        decompressed[data].wait(10)
+        image[:] = data
+        return image.nbytes
+
+    monkeypatch.setattr(streamvis.receiver, "_decompress_bitshuffle_lz4", decompress)
+
+    received = []
+    receiver = Receiver(
+        on_receive=lambda metadata, image: received.append((metadata, image.copy())),
+        buffer_size=2,
+        decompression_threads=2,
+    )
+    for pulse_id in (1, 2):
+        _receive_compressed(receiver, pulse_id)
+
+    # the second image is decompressed first, but it is committed after the first one
+    decompressed[2].set()
+    receiver._decompressing[1][0].result()
+    receiver._commit_decompressed()
+    assert received == []
+
+    decompressed[1].set()
+    _wait_decompressed(receiver)
+
+    assert [metadata["pulse_id"] for metadata, _ in received] == [1, 2]
+    for ind, (metadata, image) in enumerate(received):
+        assert np.all(image == metadata["pulse_id"])
+        assert receiver.buffer[ind][0] is metadata
+
+
+def test_decompress_error(monkeypatch):
+    def decompress(data, image):
+        if data % 2:
+            raise ValueError("corrupted image")
+        if data % 4 == 2:
+            # an image of an unexpected size
+            return image.nbytes // 2
+        image[:] = data
+        return image.nbytes
+
+    monkeypatch.setattr(streamvis.receiver, "_decompress_bitshuffle_lz4", decompress)
+
+    received = []
+    receiver = Receiver(
+        on_receive=lambda metadata, image: received.append(metadata["pulse_id"]),
+        buffer_size=2,
+        decompression_threads=2,
+    )
+
+    # reserved slots of failed images are released, otherwise the spare slots would run out
+    for pulse_id in range(1, 13):
+        _receive_compressed(receiver, pulse_id)
+    _wait_decompressed(receiver)
+
+    assert received == [4, 8, 12]
+    assert receiver.metrics.errors == 9
+    assert [metadata["pulse_id"] for metadata, _ in receiver.buffer] == [8, 12]
+    for metadata, image in receiver.buffer:
+        assert np.all(image == metadata["pulse_id"])
+
+
+def test_start_async():
+    zmq_context = zmq.Context()
+    zmq_socket = zmq_context.socket(zmq.PUB)  # pylint: disable=E1101
+    port = zmq_socket.bind_to_random_port("tcp://127.0.0.1")
+
+    received = []
+    notifications = []
+
+    def on_receive(metadata, image):
+        received.append((metadata, image.copy()))
+
+    receiver = Receiver(on_receive=on_receive, buffer_size=2)
+    receiver.subscribe(lambda: notifications.append(receiver.state))
+
+    async def send():
+        # the receiver subscribes only after its start
+        pulse_id = 0
+        while len(received) < 10:
+            pulse_id += 1
+            _send(zmq_socket, pulse_id)
+            await asyncio.sleep(0.02)
+        receiver.stop()
+
+    async def run():
+        await asyncio.gather(receiver.start_async(1, "connect", f"tcp://127.0.0.1:{port}"), send())
+
+    io_loop = IOLoop()
+    try:
+        io_loop.run_sync(run, timeout=30)
+    finally:
+        io_loop.close()
+        zmq_context.destroy(linger=0)
+
+    assert receiver.push_updates
+    assert len(received) >= 10
+    assert notifications == ["receiving"] * len(received)
+    for metadata, image in received:
+        assert image.shape == (4, 5)
+        assert np.all(image == metadata["pulse_id"])
+
+    # images are received into the ring buffer
+    metadata, image = receiver.buffer[-1]
+    assert metadata is received[-1][0]
+    assert np.all(image == metadata["pulse_id"])
+
+
+def test_start_process():
+    zmq_context = zmq.Context()
+    zmq_socket = zmq_context.socket(zmq.PUB)  # pylint: disable=E1101
+    port = zmq_socket.bind_to_random_port("tcp://127.0.0.1")
+
+    received = []
+
+    def on_receive(metadata, image):
+        received.append((metadata, image.copy()))
+
+    stats = StatisticsHandler(hit_threshold=2)
+    receiver = Receiver(on_receive=on_receive, buffer_size=2)
+    thread = threading.Thread(
+        target=receiver.start_process,
+        args=(1, "connect", f"tcp://127.0.0.1:{port}"),
+        kwargs=dict(stats=stats),
+        daemon=True,
+    )
+    thread.start()
+
+    try:
+        # the receiver process subscribes only after its start
+        pulse_id = 0
+        deadline = time.monotonic() + 60
+        while len(received) < 10 and time.monotonic() < deadline:
+            pulse_id += 1
+            _send(zmq_socket, pulse_id)
+            time.sleep(0.02)
+
+        # statistics are passed from the receiver process periodically, after the last frames
+        time.sleep(0.5)
+        while sum(stats.data["nframes"]) < len(received) and time.monotonic() < deadline:
+            time.sleep(0.1)
+    finally:
+        shm_name = receiver.buffer.shm_name
+        receiver.stop()
+        thread.join(10)
+        zmq_context.destroy(linger=0)
+
+    assert len(received) >= 10
+    for metadata, image in received:
+        assert image.shape == (4, 5)
+        assert np.all(image == metadata["pulse_id"])
+
+    assert receiver.metrics.messages == len(received)
+    assert sum(stats.data["nframes"]) == len(received)
+
+    # the receiver process removes its shared memory block on exit
+    assert not thread.is_alive()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=shm_name)
+
+
+def test_start_process_reorder():
+    zmq_context = zmq.Context()
+    zmq_socket = zmq_context.socket(zmq.PUB)  # pylint: disable=E1101
+    port = zmq_socket.bind_to_random_port("tcp://127.0.0.1")
+
+    received = []
+    stats = StatisticsHandler(hit_threshold=2)
+    receiver = Receiver(
+        on_receive=lambda metadata, _: received.append(metadata.get("pulse_id")),
+        buffer_size=10,
+        reorder_window=5,
+    )
+    thread = threading.Thread(
+        target=receiver.start_process,
+        args=(1, "connect", f"tcp://127.0.0.1:{port}"),
+        kwargs=dict(stats=stats),
+        daemon=True,
+    )
+    thread.start()
+
+    try:
+        # frames without pulse_id are not reordered and do not add statistics
+        deadline = time.monotonic() + 60
+        while not received and time.monotonic() < deadline:
+            _send(zmq_socket, None)
+            time.sleep(0.02)
+
+        # statistics are extracted in the receiver process in pulse_id order as well
+        _send(zmq_socket, 20000)
+        _send(zmq_socket, 10000)
+        while sum(stats.data["nframes"]) < 2 and time.monotonic() < deadline:
+            time.sleep(0.1)
+    finally:
+        receiver.stop()
+        thread.join(10)
+        zmq_context.destroy(linger=0)
+
+    assert received[-2:] == [10000, 20000]
+    assert stats.data["pulse_id_bins"] == [10000, 20000]
@@ -0,0 +1,101 @@
+import time
+from threading import Event
+
+import h5py
+import numpy as np
+
+import pytest
+from streamvis.recorder import Recorder
+from streamvis.ring_buffer import RingBuffer
+
+
+def _receive(recorder, buffer, pulse_ids, hits=(), shape=(2, 3)):
+    for pulse_id in pulse_ids:
+        image = buffer.reserve(np.uint16, shape)
+        image[:] = pulse_id
+        buffer.commit(dict(pulse_id=pulse_id, sfx_hit=pulse_id in hits, shape=list(shape)))
+        recorder.update(buffer)
+
+
+def _wait_written(recorder, nframes):
+    deadline = time.monotonic() + 10
+    while recorder.recorded < nframes and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def _read(path):
+    (filename,) = path.glob("*.h5")
+    with h5py.File(filename, "r") as f:
+        return f["data"][:], f["pulse_id"][:]
+
+
+@pytest.mark.parametrize(
+    "trigger,recorded",
+    [("all", list(range(10))), ("hits", [3, 7]), ("around", [2, 3, 4, 6, 7, 8])],
+)
+def test_trigger(tmp_path, trigger, recorded):
+    # frames are copied by the writer thread, so the buffer keeps all frames until then
+    buffer = RingBuffer(size=10)
+    recorder = Recorder(tmp_path, trigger=trigger, frames_around=1)
+    _receive(recorder, buffer, range(10), hits=(3, 7))
+    recorder.close()
+
+    data, pulse_id = _read(tmp_path)
+    np.testing.assert_array_equal(pulse_id, recorded)
+    np.testing.assert_array_equal(data[:, 0, 0], recorded)
+    assert recorder.recorded == len(recorded)
+    assert recorder.dropped == 0
+
+
+def test_layout_change_starts_new_file(tmp_path):
+    buffer = RingBuffer(size=5)
+    recorder = Recorder(tmp_path)
+    _receive(recorder, buffer, range(3))
+    # the buffer is reallocated on a layout change, which drops frames that are not yet written
+    _wait_written(recorder, 3)
+    _receive(recorder, buffer, range(3), shape=(4, 4))
+    recorder.close()
+
+    assert len(list(tmp_path.glob("*.h5"))) == 2
+
+
+def test_full_queue_drops_frames(tmp_path):
+    buffer = RingBuffer(size=5)
+    recorder = Recorder(tmp_path, queue_size=1)
+
+    # block the writer thread
+    writing = Event()
+    recorder._write = lambda *_args: writing.wait()
+    _receive(recorder, buffer, range(4))
+
+    assert recorder.dropped >= 2
+
+    writing.set()
+    recorder.close()
+
+
+def test_overwritten_frames_are_dropped(tmp_path):
+    buffer = RingBuffer(size=2)
+    recorder = Recorder(tmp_path, queue_size=10)
+
+    # block the writer thread after the first frame is copied
+    written = []
+    writing = Event()
+    released = Event()
+
+    def write(_entries, image):
+        writing.set()
+        released.wait()
+        written.append(image[0, 0])
+
+    recorder._write = write
+    _receive(recorder, buffer, [0])
+    writing.wait(10)
+    _receive(recorder, buffer, range(1, 8))
+
+    released.set()
+    recorder.close()
+
+    # only frames with slots that have not been reused yet are written
+    assert written == [0, 5, 6, 7]
+    assert recorder.dropped == 4
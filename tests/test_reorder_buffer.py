@@ -0,0 +1,50 @@
+import pytest
+from streamvis.reorder_buffer import ReorderBuffer
+
+
+def _push_all(buffer, pulse_ids):
+    released = []
+    for pulse_id in pulse_ids:
+        released.extend(buffer.push(pulse_id, pulse_id))
+    return released
+
+
+def test_window_pulses():
+    buffer = ReorderBuffer(window_pulses=3)
+    released = _push_all(buffer, [1, 3, 2, 5, 4, 6, 8, 7])
+
+    assert released == [1, 2, 3, 4, 5]
+    assert buffer.flush() == [6, 7, 8]
+    assert buffer.late == 0
+
+
+def test_late_frames():
+    buffer = ReorderBuffer(window_pulses=1)
+    released = _push_all(buffer, [1, 2, 3, 1])
+
+    assert released == [1, 2, 1]
+    assert buffer.late == 1
+    assert buffer.to_dict()["late"] == 1
+
+
+def test_window_ms():
+    buffer = ReorderBuffer(window_ms=0)
+    assert _push_all(buffer, [2, 1]) == [2, 1]
+    assert len(buffer) == 0
+
+
+@pytest.mark.parametrize("max_frames", [1, 2, 5])
+def test_max_frames(max_frames):
+    buffer = ReorderBuffer(window_pulses=1000, max_frames=max_frames)
+    released = []
+    for pulse_id in [5, 4, 3, 2, 1, 0, 6, 7]:
+        released.extend(buffer.push(pulse_id, pulse_id))
+        assert len(buffer) < max_frames
+
+    released.extend(buffer.flush())
+    assert sorted(released) == list(range(8))
+
+
+def test_no_window():
+    with pytest.raises(ValueError):
+        ReorderBuffer()
@@ -0,0 +1,25 @@
+import h5py
+import numpy as np
+
+from streamvis.replay import Recording
+
+
+def test_recording(tmp_path):
+    filename = tmp_path / "recording.h5"
+    with h5py.File(filename, "w") as f:
+        f["data"] = np.arange(3 * 2 * 4, dtype=np.uint16).reshape(3, 2, 4)
+        f["pulse_id"] = [10, 20, 30]
+        f["number_of_spots"] = [1.0, np.nan, 3.0]
+
+    recording = Recording(filename, preload=True)
+    messages = list(recording)
+    recording.close()
+
+    assert len(messages) == 3
+
+    metadata, image = messages[1]
+    assert metadata["type"] == "uint16"
+    assert metadata["shape"] == [2, 4]
+    assert metadata["pulse_id"] == 20
+    assert metadata["number_of_spots"] is None
+    np.testing.assert_array_equal(image, np.arange(8, 16).reshape(2, 4))
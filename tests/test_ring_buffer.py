@@ -0,0 +1,230 @@
+import numpy as np
+
+import pytest
+from streamvis.ring_buffer import RingBuffer
+
+
+def _put(buffer, value, shape=(2, 3), dtype=np.uint16):
+    image = buffer.reserve(dtype, shape)
+    image[:] = value
+    buffer.commit(dict(value=value))
+
+
+@pytest.mark.parametrize("size", [1, 3, 10])
+def test_maxlen(size):
+    buffer = RingBuffer(size=size)
+    for i in range(2 * size):
+        _put(buffer, i)
+
+    assert len(buffer) == size
+    assert buffer.seq == 2 * size
+
+
+def test_getitem_order():
+    buffer = RingBuffer(size=3)
+    for i in range(5):
+        _put(buffer, i)
+
+    for index, value in zip([0, 1, 2, -1, -2, -3], [2, 3, 4, 4, 3, 2]):
+        metadata, image = buffer[index]
+        assert metadata["value"] == value
+        assert np.all(image == value)
+        assert buffer.get_seq(index) == value
+
+
+def test_kept_frames_are_not_overwritten():
+    buffer = RingBuffer(size=2, spare=1)
+    _put(buffer, 1)
+    _put(buffer, 2)
+    _, newest = buffer[-1]
+
+    image = buffer.reserve(np.uint16, (2, 3))
+    image[:] = 42
+
+    assert np.all(newest == 2)
+    assert np.all(buffer[0][1] == 1)
+
+
+def test_views_are_readonly():
+    buffer = RingBuffer()
+    _put(buffer, 1)
+    _, image = buffer[-1]
+
+    with pytest.raises(ValueError):
+        image[0, 0] = 0
+
+
+def test_no_reallocation_in_steady_state():
+    buffer = RingBuffer(size=4)
+    _put(buffer, 0)
+    frames = buffer._frames
+    for i in range(20):
+        _put(buffer, i)
+
+    assert buffer._frames is frames
+    assert buffer.nbytes == buffer.num_slots * 2 * 3 * 2
+
+
+def test_layout_change():
+    buffer = RingBuffer(size=3)
+    _put(buffer, 1)
+    _put(buffer, 2)
+    _, old_image = buffer[-1]
+    _put(buffer, 3, shape=(4, 4), dtype=np.float32)
+
+    assert len(buffer) == 1
+    assert buffer[-1][1].shape == (4, 4)
+    assert np.all(old_image == 2)
+
+
+def test_discard():
+    buffer = RingBuffer(size=2)
+    _put(buffer, 1)
+    buffer.reserve(np.uint16, (2, 3))
+    buffer.discard()
+    _put(buffer, 2)
+
+    assert len(buffer) == 2
+    assert buffer.seq == 2
+
+
+def test_spare_slots_exhausted():
+    buffer = RingBuffer(size=2, spare=1)
+    buffer.reserve(np.uint16, (2, 3))
+
+    with pytest.raises(RuntimeError):
+        buffer.reserve(np.uint16, (2, 3))
+
+
+def test_commit_reserved_in_order():
+    buffer = RingBuffer(size=2, spare=3)
+    images = [buffer.reserve(np.uint16, (2, 3)) for _ in range(3)]
+    for i, image in enumerate(images):
+        image[:] = i
+
+    buffer.commit(dict(value=0))
+    buffer.discard()
+    buffer.commit(dict(value=2))
+
+    assert buffer[0][0]["value"] == 0
+    assert np.all(buffer[-1][1] == 2)
+    assert buffer.seq == 2
+
+
+def test_get_by_pulse_id():
+    buffer = RingBuffer(size=3)
+    for pulse_id in [10, 30, 20, 40]:
+        image = buffer.reserve(np.uint16, (2, 3))
+        image[:] = pulse_id
+        buffer.commit(dict(pulse_id=pulse_id))
+
+    metadata, image = buffer.get_by_pulse_id(20)
+    assert metadata["pulse_id"] == 20
+    assert np.all(image == 20)
+
+    # pulse_id 10 has been evicted
+    with pytest.raises(KeyError):
+        buffer.get_by_pulse_id(10)
+
+
+@pytest.mark.parametrize(
+    "pulse_id,nearest_pulse_id", [(0, 20), (24, 20), (25, 20), (26, 30), (36, 40), (100, 40)]
+)
+def test_get_by_pulse_id_nearest(pulse_id, nearest_pulse_id):
+    buffer = RingBuffer(size=3)
+    for i in [10, 20, 30, 40]:
+        buffer.reserve(np.uint16, (2, 3))
+        buffer.commit(dict(pulse_id=i))
+
+    metadata, _ = buffer.get_by_pulse_id(pulse_id, nearest=True)
+    assert metadata["pulse_id"] == nearest_pulse_id
+
+
+def test_memory_budget():
+    buffer = RingBuffer(size=1, spare=2, memory=1000)
+    _put(buffer, 1, shape=(10, 10), dtype=np.uint16)
+    assert buffer.size == 3
+    assert buffer.nbytes <= buffer.memory
+
+    _put(buffer, 1, shape=(5, 5), dtype=np.uint16)
+    assert buffer.size == 18
+    assert buffer.nbytes <= buffer.memory
+
+    # a single frame exceeds the memory budget
+    _put(buffer, 1, shape=(100, 100), dtype=np.uint16)
+    assert buffer.size == 1
+
+
+def test_reused_slot_is_detected():
+    buffer = RingBuffer(size=1, spare=3)
+    _put(buffer, 1)
+    version = buffer.get_version(-1)
+    metadata, image = buffer.read(version)
+
+    assert buffer.is_intact(version)
+    snapshot_metadata, snapshot = buffer.snapshot(version)
+    assert snapshot_metadata is metadata
+    assert np.all(snapshot == 1)
+
+    # the slot is reused after size + spare commits
+    for i in range(2, 6):
+        _put(buffer, i)
+
+    assert np.all(image == 5)
+    assert not buffer.is_intact(version)
+    assert buffer.snapshot(version) is None
+
+
+def test_slot_being_written_is_not_intact():
+    buffer = RingBuffer(size=1, spare=1)
+    _put(buffer, 1)
+    _put(buffer, 2)
+    version = buffer.get_version(-1)
+    old_version = buffer.find_version(buffer[-1][0])
+    assert old_version == version
+
+    # the first slot is free again, and the second one is kept
+    buffer.reserve(np.uint16, (2, 3))
+    assert buffer.is_intact(version)
+
+    buffer.commit(dict(value=3))
+    image = buffer.reserve(np.uint16, (2, 3))
+    assert not buffer.is_intact(version)
+
+    image[:] = 4
+    buffer.discard()
+    assert not buffer.is_intact(version)
+    assert buffer.find_version(dict(value=2)) is None
+
+
+def test_layout_change_invalidates_versions():
+    buffer = RingBuffer(size=3)
+    _put(buffer, 1)
+    version = buffer.get_version(-1)
+    _put(buffer, 2, shape=(4, 4))
+
+    assert not buffer.is_intact(version)
+
+
+def test_shared_commit_slot():
+    writer = RingBuffer(size=1, spare=1, shared=True)
+    reader = RingBuffer(size=1, spare=1)
+    try:
+        _put(writer, 1)
+        slot, generation = writer.get_slot(-1), writer.get_version(-1)[2]
+        reader.attach(writer.shm_name, np.uint16, (2, 3))
+        assert reader.commit_slot(slot, dict(value=1), generation)
+
+        version = reader.get_version(-1)
+        assert np.all(reader.read(version)[1] == 1)
+
+        # the writer reuses the slot before the reader commits the next frame
+        _put(writer, 2)
+        next_slot, next_generation = writer.get_slot(-1), writer.get_version(-1)[2]
+        _put(writer, 3)
+        _put(writer, 4)
+        assert not reader.is_intact(version)
+        assert not reader.commit_slot(next_slot, dict(value=2), next_generation)
+    finally:
+        reader.close()
+        writer.close()
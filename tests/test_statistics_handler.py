@@ -0,0 +1,19 @@
+from streamvis.statistics_handler import PULSE_ID_STEP, StatisticsHandler
+
+
+def test_pulse_id_bins():
+    stats = StatisticsHandler(hit_threshold=2)
+    for pulse_id in range(0, 10 * PULSE_ID_STEP, PULSE_ID_STEP // 2):
+        stats.parse_metadata(dict(pulse_id=pulse_id))
+
+    # a late message is counted in its bin
+    stats.parse_metadata(dict(pulse_id=1))
+
+    assert stats.data["pulse_id_bins"] == list(range(0, 10 * PULSE_ID_STEP, PULSE_ID_STEP))
+    assert stats.data["nframes"] == [3] + [2] * 9
+    assert stats.sum_data["nframes"] == [21]
+
+    stats.reset()
+    stats.parse_metadata(dict(pulse_id=1))
+    assert stats.data["pulse_id_bins"] == [0]
+    assert stats.data["nframes"] == [1]
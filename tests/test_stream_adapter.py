@@ -0,0 +1,382 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("jungfrau_utils")
+
+import streamvis.receiver  # pylint: disable=C0413
+from streamvis.receiver import StreamAdapter, _mask_cast_rotate  # pylint: disable=C0413
+
+
+GOOD_PIXELS = np.array([[1, 1, 0, 1], [1, 1, 1, 1]], dtype=bool)
+
+
+class Handler:
+    instances = 0
+    loading = threading.Event()
+
+    def __init__(self, detector_name):
+        if detector_name == "unknown":
+            raise KeyError(detector_name)
+
+        Handler.instances += 1
+        self.detector_name = detector_name
+        self.gain_file = ""
+        self.pedestal_file = ""
+        self.module_map = None
+        self.highgain = False
+        self.mask_requests = 0
+        self.assembled = 0
+
+    @property
+    def pedestal_file(self):
+        return self._pedestal_file
+
+    @pedestal_file.setter
+    def pedestal_file(self, value):
+        Handler.loading.wait()
+        self._pedestal_file = value
+
+    @property
+    def pixel_mask(self):
+        return np.invert(GOOD_PIXELS) if self.pedestal_file else None
+
+    def get_pixel_mask(self, gap_pixels=True, double_pixels="keep", geometry=True):
+        self.mask_requests += 1
+        good_pixels = GOOD_PIXELS.astype(np.uint16)
+        return self.process(
+            good_pixels,
+            conversion=False,
+            gap_pixels=gap_pixels,
+            double_pixels=double_pixels,
+            geometry=geometry,
+        ).astype(bool)
+
+    def can_convert(self):
+        return True
+
+    def get_saturated_pixels(self, image, mask=True, gap_pixels=True, geometry=True):
+        saturated_value = 0x3FFF if self.highgain else 0xC000
+        saturated = (image == saturated_value).astype(np.uint16)
+        saturated = self.process(
+            saturated, conversion=False, gap_pixels=gap_pixels, geometry=geometry
+        ).astype(bool)
+        if mask and self.pixel_mask is not None:
+            saturated &= self.get_pixel_mask(gap_pixels=gap_pixels, geometry=geometry)
+        return np.nonzero(saturated)
+
+    def process(
+        self,
+        image,
+        conversion=True,
+        mask=True,
+        gap_pixels=True,
+        double_pixels="keep",
+        geometry=True,
+    ):
+        # modules are swapped by geometry and separated by a column of gap pixels
+        self.assembled += gap_pixels or geometry
+        out = image.astype(np.float32) / 2 if conversion else image.copy()
+        if geometry:
+            out = out[::-1]
+        if gap_pixels:
+            mid = out.shape[1] // 2
+            out = np.insert(out, mid, 0, axis=1)
+            if double_pixels == "interp":
+                out[:, mid] = (out[:, mid - 1] + out[:, mid + 1]) / 2
+        return np.ascontiguousarray(out)
+
+
+@pytest.fixture(autouse=True)
+def handler(monkeypatch):
+    Handler.instances = 0
+    Handler.loading.set()
+    monkeypatch.setattr(streamvis.receiver, "JFDataHandler", Handler)
+
+
+def metadata(**kwargs):
+    kwargs.setdefault("detector_name", "JF01T03V01")
+    kwargs.setdefault("pedestal_file", "pedestal.h5")
+    return kwargs
+
+
+def wait_loaded(adapter):
+    adapter._loader.submit(lambda: None).result()
+
+
+def test_handler_pool():
+    adapter = StreamAdapter()
+
+    handler = adapter.get_handler(metadata(daq_rec=0))
+    assert handler.pedestal_file == "pedestal.h5"
+    assert not handler.highgain
+
+    # handlers are set up once per configuration
+    assert adapter.get_handler(metadata(daq_rec=0)) is handler
+    assert adapter.get_handler(metadata(daq_rec=1)).highgain
+    assert adapter.get_handler(metadata(module_map=[0, -1, 1])) is not handler
+    assert Handler.instances == 3
+
+    assert adapter.get_handler(dict()) is None
+    assert adapter.get_handler(dict(detector_name="unknown")) is None
+
+
+def test_handler_pool_size():
+    adapter = StreamAdapter(pool_size=2)
+
+    handler1 = adapter.get_handler(metadata(detector_name="JF01T03V01"))
+    handler2 = adapter.get_handler(metadata(detector_name="JF02T09V02"))
+
+    # switching between pooled detectors does not set up handlers again
+    for _ in range(3):
+        assert adapter.get_handler(metadata(detector_name="JF01T03V01")) is handler1
+        assert adapter.get_handler(metadata(detector_name="JF02T09V02")) is handler2
+    assert Handler.instances == 2
+
+    # the least recently used handler is dropped
+    adapter.get_handler(metadata(detector_name="JF06T08V02"))
+    assert adapter.get_handler(metadata(detector_name="JF02T09V02")) is handler2
+    assert adapter.get_handler(metadata(detector_name="JF01T03V01")) is not handler1
+    assert Handler.instances == 4
+
+
+def test_process_mask():
+    adapter = StreamAdapter()
+    image = np.full((2, 4), 2, dtype=np.uint16)
+
+    for _ in range(2):
+        proc_image = adapter.process(image, metadata(), geometry=True)
+        np.testing.assert_array_equal(proc_image, [[1, 1, np.nan, 1, 1], [1, 1, np.nan, np.nan, 1]])
+
+    adapter.process(image, metadata(), geometry=False)
+
+    # masks are computed once per set of options
+    assert adapter.get_handler(metadata()).mask_requests == 2
+
+    # there is no mask without pedestal file
+    adapter.get_handler(metadata(pedestal_file=""))
+    wait_loaded(adapter)
+    proc_image = adapter.process(image, metadata(pedestal_file=""), gap_pixels=False)
+    np.testing.assert_array_equal(proc_image, [[1, 1, 1, 1], [1, 1, 1, 1]])
+
+
+@pytest.mark.parametrize("n_rot", [0, 1, 3])
+@pytest.mark.parametrize("mask", [True, False])
+@pytest.mark.parametrize("double_pixels", ["keep", "interp"])
+def test_process_lut(n_rot, mask, double_pixels):
+    adapter = StreamAdapter()
+    handler = adapter.get_handler(metadata())
+    rng = np.random.default_rng(0)
+
+    assembled = 0
+    for _ in range(5):
+        image = rng.integers(0, 2 ** 14, size=(2, 4), dtype=np.uint16)
+
+        handler.assembled = 0
+        proc_image = adapter.process(
+            image, metadata(), mask=mask, double_pixels=double_pixels, n_rot=n_rot
+        )
+        assembled += handler.assembled
+
+        expected = handler.process(image, double_pixels=double_pixels)
+        if mask:
+            expected[np.invert(handler.get_pixel_mask(double_pixels=double_pixels))] = np.nan
+        np.testing.assert_array_equal(proc_image, np.rot90(expected, k=n_rot))
+
+    if double_pixels == "interp":
+        # a lookup table is not applicable, so each frame is assembled by the handler
+        assert assembled == 5 + mask
+    else:
+        # frames are assembled by the handler only to build and verify a lookup table
+        assert assembled == 3 + mask
+
+
+@pytest.mark.parametrize("n_rot", [0, 1, 2, 3])
+@pytest.mark.parametrize("double_pixels", ["keep", "interp"])
+@pytest.mark.parametrize("daq_rec", [0, 1])
+def test_process_saturated_pixels(n_rot, double_pixels, daq_rec):
+    adapter = StreamAdapter()
+    handler = adapter.get_handler(metadata(daq_rec=daq_rec))
+    saturated_value = 0x3FFF if daq_rec else 0xC000
+
+    # a pixel at [0, 2] is masked
+    image = np.full((2, 4), 2, dtype=np.uint16)
+    image[0, 1:3] = saturated_value
+    image[1, 3] = saturated_value
+
+    for _ in range(2):
+        proc_image, (y, x) = adapter.process(
+            image,
+            metadata(daq_rec=daq_rec),
+            double_pixels=double_pixels,
+            n_rot=n_rot,
+            saturated_pixels=True,
+        )
+
+        assert len(y) == len(x) == 2
+        saturated = np.zeros(proc_image.shape, dtype=bool)
+        saturated[y, x] = True
+        expected = np.zeros(handler.process(image).shape, dtype=bool)
+        expected[handler.get_saturated_pixels(image)] = True
+        np.testing.assert_array_equal(saturated, np.rot90(expected, k=n_rot))
+
+    # there are no saturated pixels in processed images
+    image = image.astype(np.float32)
+    _, saturated_pixels_coord = adapter.process(
+        image, metadata(), gap_pixels=False, geometry=False, saturated_pixels=True
+    )
+    assert saturated_pixels_coord is None
+
+
+def test_process_lut_verification():
+    adapter = StreamAdapter()
+    handler = adapter.get_handler(metadata())
+    image = np.full((2, 4), 2, dtype=np.uint16)
+
+    # assembled pixels also depend on their position, which is not a plain rearrangement
+    process = handler.process
+    handler.process = lambda image, **kwargs: process(image, **kwargs) + kwargs["geometry"]
+
+    proc_image = adapter.process(image, metadata(), mask=False, n_rot=0)
+    np.testing.assert_array_equal(proc_image, [[2, 2, 1, 2, 2], [2, 2, 1, 2, 2]])
+
+
+def test_lut_shared_by_calibrations(tmp_path, monkeypatch):
+    monkeypatch.setattr(streamvis.receiver, "MTIME_CHECK_PERIOD", 0)
+    monkeypatch.setattr(streamvis.receiver, "MTIME_STABLE_PERIOD", 0)
+    monkeypatch.setattr(streamvis.receiver, "LUT_CACHE_SIZE", 2)
+    adapter = StreamAdapter()
+    pedestal_file = tmp_path / "pedestal.h5"
+    pedestal_file.write_bytes(b"")
+    image = np.full((2, 4), 2, dtype=np.uint16)
+
+    handler = adapter.get_handler(metadata(pedestal_file=str(pedestal_file)))
+    expected = adapter.process(image, metadata(pedestal_file=str(pedestal_file)), mask=False)
+
+    # a new calibration of the same detector
+    os.utime(pedestal_file, (0, 0))
+    adapter.get_handler(metadata(pedestal_file=str(pedestal_file)))
+    wait_loaded(adapter)
+    new_handler = adapter.get_handler(metadata(pedestal_file=str(pedestal_file)))
+    assert new_handler is not handler
+
+    # the lookup table is not built again
+    proc_image = adapter.process(image, metadata(pedestal_file=str(pedestal_file)), mask=False)
+    np.testing.assert_array_equal(proc_image, expected)
+    assert new_handler.assembled == 0
+
+    # variants with pixel masks and rotations are limited in number
+    for n_rot in range(4):
+        adapter.process(image, metadata(pedestal_file=str(pedestal_file)), n_rot=n_rot)
+    assert len(adapter._lut_variants) == 2
+    assert len(adapter._luts) == 1
+
+
+def test_load_in_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(streamvis.receiver, "MTIME_CHECK_PERIOD", 0)
+    monkeypatch.setattr(streamvis.receiver, "MTIME_STABLE_PERIOD", 0)
+    adapter = StreamAdapter()
+    pedestal_file = tmp_path / "pedestal.h5"
+    pedestal_file.write_bytes(b"")
+
+    # the first calibration is waited for
+    handler = adapter.get_handler(metadata(pedestal_file=str(pedestal_file)))
+    assert handler.pedestal_file == str(pedestal_file)
+
+    # the same file, but overwritten
+    Handler.loading.clear()
+    os.utime(pedestal_file, (0, 0))
+    assert adapter.get_handler(metadata(pedestal_file=str(pedestal_file))) is handler
+
+    Handler.loading.set()
+    wait_loaded(adapter)
+    new_handler = adapter.get_handler(metadata(pedestal_file=str(pedestal_file)))
+    assert new_handler is not handler
+    assert Handler.instances == 2
+
+
+def test_wait_for_written_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(streamvis.receiver, "MTIME_CHECK_PERIOD", 0)
+    monkeypatch.setattr(streamvis.receiver, "MTIME_STABLE_PERIOD", 0.2)
+    adapter = StreamAdapter()
+    pedestal_file = tmp_path / "pedestal.h5"
+    pedestal_file.write_bytes(b"")
+    handler = adapter.get_handler(metadata(pedestal_file=str(pedestal_file)))
+
+    # the file is not loaded while it is being written
+    for size in range(1, 4):
+        pedestal_file.write_bytes(b"0" * size)
+        assert adapter.get_handler(metadata(pedestal_file=str(pedestal_file))) is handler
+        wait_loaded(adapter)
+    assert Handler.instances == 1
+
+    time.sleep(0.2)
+    adapter.get_handler(metadata(pedestal_file=str(pedestal_file)))
+    wait_loaded(adapter)
+    assert adapter.get_handler(metadata(pedestal_file=str(pedestal_file))) is not handler
+    assert Handler.instances == 2
+
+
+def test_handler_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(streamvis.receiver, "MTIME_CHECK_PERIOD", 0)
+    monkeypatch.setattr(streamvis.receiver, "MTIME_STABLE_PERIOD", 0)
+    adapter = StreamAdapter()
+    pedestal_file = tmp_path / "pedestal.h5"
+    pedestal_file.write_bytes(b"")
+    handler = adapter.get_handler(metadata(pedestal_file=str(pedestal_file)))
+
+    def broken_handler(detector_name):
+        broken_handler.calls += 1
+        raise RuntimeError(detector_name)
+
+    broken_handler.calls = 0
+    monkeypatch.setattr(streamvis.receiver, "JFDataHandler", broken_handler)
+
+    # the previous calibration is kept, and the failed one is not created again for each frame
+    os.utime(pedestal_file, (0, 0))
+    for _ in range(3):
+        assert adapter.get_handler(metadata(pedestal_file=str(pedestal_file))) is handler
+        wait_loaded(adapter)
+    assert broken_handler.calls == 1
+
+    # there is no calibration to fall back to
+    assert adapter.get_handler(metadata(detector_name="JF02T09V02")) is None
+    assert broken_handler.calls == 2
+
+
+@pytest.mark.parametrize("n_rot", [0, 1, 2, 3, -1])
+@pytest.mark.parametrize("dtype", [np.uint16, np.float32])
+def test_mask_cast_rotate(n_rot, dtype):
+    rng = np.random.default_rng(0)
+    image = (rng.random((5, 7)) * 100).astype(dtype)
+    inv_mask = rng.random((5, 7)) > 0.7
+
+    expected = np.rot90(np.where(inv_mask, np.nan, image.astype(np.float32)), k=n_rot)
+    result = _mask_cast_rotate(image, inv_mask, n_rot)
+
+    assert result.dtype == np.float32
+    assert result.flags.c_contiguous
+    np.testing.assert_array_equal(result, expected)
+    np.testing.assert_array_equal(
+        _mask_cast_rotate(image, None, n_rot), np.rot90(image, k=n_rot).astype(np.float32)
+    )
+
+
+def test_mask_cast_rotate_view():
+    image = np.arange(6, dtype=np.float32).reshape(2, 3)
+
+    # a view is returned only if there is nothing to change
+    result = _mask_cast_rotate(image, None, 0, copy=False)
+    assert np.shares_memory(result, image)
+    assert not result.flags.writeable
+    assert image.flags.writeable
+
+    for inv_mask, n_rot in [(image > 2, 0), (None, 1)]:
+        result = _mask_cast_rotate(image, inv_mask, n_rot, copy=False)
+        assert not np.shares_memory(result, image)
+
+    assert _mask_cast_rotate(image.astype(np.float64), None, 0, copy=False).dtype == np.float32
+    assert not np.shares_memory(_mask_cast_rotate(image, None, 0), image)